@@ -0,0 +1,154 @@
+import json
+
+import cv2
+import numpy as np
+
+from .layers import CompiledLayers
+from .video_scan import DEFAULT_CHUNK_FRAMES, map_chunks, propose_ranges
+
+# Number of frames with the most uncovered text that are listed in the report.
+AUDIT_WORST_FRAMES = 10
+
+
+def audit_chunk(video_path, start: int, end: int, layers, mask):
+    """
+    Return (counts, heatmap) for frames [start, end) of the video: the number of pixels in each frame
+    that the layers select as text but the mask doesn't cover, and how many frames each pixel was
+    uncovered text in. Fewer counts are returned if the video ends early. The heatmap is kept as
+    whole counts in the smallest type that can hold them, since it's sent back from a worker
+    process for every chunk.
+    """
+    compiled = CompiledLayers(layers)
+    uncovered_area = cv2.bitwise_not(mask)
+    heatmap_type = np.uint16 if end - start <= np.iinfo(np.uint16).max else np.int32
+    heatmap = np.zeros(mask.shape, heatmap_type)
+    cap = cv2.VideoCapture(str(video_path))
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    counts = []
+    try:
+        for _ in range(start, end):
+            ok, frame = cap.read()
+            if not ok:
+                break
+            uncovered = cv2.bitwise_and(compiled.render(frame), uncovered_area)
+            counts.append(cv2.countNonZero(uncovered))
+            if counts[-1]:
+                cv2.add(heatmap, 1, dst=heatmap, mask=uncovered)
+    finally:
+        cap.release()
+    return np.array(counts, np.int64), heatmap
+
+
+class AuditResult(object):
+    """
+    AuditResult holds how much text each frame of a range has outside the mask (counts, starting at
+    frame start), and a heatmap of how many frames each pixel was uncovered text in.
+    """
+
+    def __init__(self, start: int, counts, heatmap, mask):
+        self.start = start
+        self.counts = counts
+        self.heatmap = heatmap
+        self.mask = mask
+
+    def get_uncovered_ranges(self, min_pixels: int = 0) -> list:
+        """Return the (first frame, last frame) ranges where more than min_pixels pixels are uncovered."""
+        return [
+            (self.start + first, self.start + last)
+            for first, last in propose_ranges(
+                self.counts, threshold=min_pixels, min_length=1, max_gap=0
+            )
+        ]
+
+    def get_report(self, min_pixels: int = 0) -> dict:
+        """Return a summary of the audit, along with the number of uncovered pixels in every frame."""
+        worst = np.argsort(-self.counts, kind="stable")[:AUDIT_WORST_FRAMES]
+        mean = float(self.counts.mean()) if len(self.counts) else 0.0
+        return {
+            "start": self.start,
+            "end": self.start + len(self.counts),
+            "min_pixels": min_pixels,
+            "uncovered_frames": int((self.counts > min_pixels).sum()),
+            "max_uncovered_pixels": int(self.counts.max(initial=0)),
+            "mean_uncovered_pixels": mean,
+            "uncovered_ranges": [
+                [first, last] for first, last in self.get_uncovered_ranges(min_pixels)
+            ],
+            "worst_frames": [
+                {"frame": self.start + int(i), "pixels": int(self.counts[i])}
+                for i in worst
+                if self.counts[i] > min_pixels
+            ],
+            "uncovered_pixels": self.counts.tolist(),
+        }
+
+    def save_report(self, path, min_pixels: int = 0):
+        with open(path, "w") as f:
+            json.dump(self.get_report(min_pixels), f)
+
+    def get_heatmap_image(self) -> np.array:
+        """
+        Return the heatmap as a BGR image: pixels that were uncovered text in more frames are
+        brighter, and the mask is shown in dark gray for reference.
+        """
+        peak = self.heatmap.max()
+        scaled = np.zeros(self.heatmap.shape, np.uint8)
+        if peak > 0:
+            # Square root scaling, so that pixels that were only missed a few times still show up.
+            scaled = np.rint(np.sqrt(self.heatmap / peak) * 255).astype(np.uint8)
+        image = cv2.applyColorMap(scaled, cv2.COLORMAP_INFERNO)
+        image[self.heatmap == 0] = 0
+        image[(self.heatmap == 0) & (self.mask > 0)] = 64
+        return image
+
+    def save_heatmap(self, path):
+        cv2.imwrite(str(path), self.get_heatmap_image())
+
+
+def audit_video(
+    video_path,
+    layers,
+    mask,
+    start: int,
+    end: int,
+    processes: int = None,
+    chunk_frames: int = DEFAULT_CHUNK_FRAMES,
+    progress=None,
+    cpus: int = None,
+) -> AuditResult:
+    """
+    Check how well the mask covers the text in frames [start, end) of the video, where text is
+    whatever the layers select on each frame. Chunks of frames are decoded and checked in parallel
+    worker processes on up to cpus CPUs (see map_chunks), and each chunk's heatmap is added up as soon as it's done, so memory doesn't
+    grow with the length of the video.
+    """
+    counts = []
+    heatmap = np.zeros(mask.shape, np.int32)
+    short = False
+
+    def add_chunk(chunk_start, result):
+        nonlocal short
+        # Stop at the first chunk that came up short, the same way scan_video does: the frames
+        # after it couldn't be read, and later chunks would be numbered as if they followed
+        # straight on.
+        if short:
+            return
+        chunk_counts, chunk_heatmap = result
+        counts.append(chunk_counts)
+        cv2.add(heatmap, chunk_heatmap, dst=heatmap, dtype=cv2.CV_32S)
+        short = len(chunk_counts) < min(chunk_frames, end - chunk_start)
+
+    map_chunks(
+        audit_chunk,
+        video_path,
+        start,
+        end,
+        args=(layers, mask),
+        processes=processes,
+        chunk_frames=chunk_frames,
+        progress=progress,
+        reduce=add_chunk,
+        cpus=cpus,
+    )
+    counts = np.concatenate(counts) if counts else np.zeros(0, np.int64)
+    return AuditResult(start, counts, heatmap, mask)
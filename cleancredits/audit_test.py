@@ -0,0 +1,112 @@
+import json
+
+import cv2
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from . import audit
+from .audit import AuditResult, audit_chunk, audit_video
+from .helpers import MASK_MODE_INCLUDE
+from .helpers_test import TESTDATA_PATH
+from .layers import CompiledLayers
+
+VIDEO_PATH = TESTDATA_PATH / "horses-720p.mp4"
+LAYERS = [
+    {
+        "mask_mode": MASK_MODE_INCLUDE,
+        "hue_min": 0,
+        "hue_max": 179,
+        "sat_min": 0,
+        "sat_max": 255,
+        "val_min": 200,
+        "val_max": 255,
+        "grow": 0,
+        "crop_left": 0,
+        "crop_top": 500,
+        "crop_right": 1080,
+        "crop_bottom": 720,
+    }
+]
+
+
+def test_audit_chunk():
+    mask = np.zeros((720, 1080), np.uint8)
+    mask[600:, :] = 255
+    counts, heatmap = audit_chunk(VIDEO_PATH, 0, 3, LAYERS, mask)
+    assert len(counts) == 3
+    cap = cv2.VideoCapture(str(VIDEO_PATH))
+    _, frame = cap.read()
+    text = CompiledLayers(LAYERS).render(frame)
+    assert counts[0] == np.count_nonzero(text[:600])
+    # Covered pixels never show up in the heatmap.
+    assert not heatmap[600:].any()
+    assert heatmap.max() <= 3
+    assert heatmap.dtype == np.uint16
+    assert heatmap[:600][text[:600] > 0].min() >= 1
+
+
+def test_audit_chunk__full_mask():
+    mask = np.full((720, 1080), 255, np.uint8)
+    counts, heatmap = audit_chunk(VIDEO_PATH, 0, 3, LAYERS, mask)
+    assert_array_equal(counts, [0, 0, 0])
+    assert not heatmap.any()
+
+
+def test_audit_video__chunks_match_sequential():
+    mask = np.zeros((720, 1080), np.uint8)
+    mask[600:, :] = 255
+    counts, heatmap = audit_chunk(VIDEO_PATH, 2, 20, LAYERS, mask)
+    result = audit_video(VIDEO_PATH, LAYERS, mask, 2, 20, processes=2, chunk_frames=5)
+    assert result.start == 2
+    assert_array_equal(result.counts, counts)
+    assert_array_equal(result.heatmap, heatmap)
+
+
+def test_audit_video__short_chunk(monkeypatch):
+    mask = np.zeros((720, 1080), np.uint8)
+
+    def audit_chunk_ending_early(video_path, start, end, layers, mask):
+        # The chunk starting at frame 5 can only read 2 frames.
+        counts, heatmap = audit_chunk(video_path, start, end, layers, mask)
+        if start == 5:
+            return counts[:2], heatmap
+        return counts, heatmap
+
+    monkeypatch.setattr(audit, "audit_chunk", audit_chunk_ending_early)
+    result = audit_video(VIDEO_PATH, LAYERS, mask, 0, 15, processes=1, chunk_frames=5)
+    counts, _ = audit_chunk(VIDEO_PATH, 0, 7, LAYERS, mask)
+    # Frames after the short chunk would be numbered wrongly, so they're left out.
+    assert_array_equal(result.counts, counts)
+
+
+def test_audit_result__report(tmp_path):
+    mask = np.zeros((2, 2), np.uint8)
+    heatmap = np.array([[0, 1], [3, 0]], np.float64)
+    result = AuditResult(10, np.array([0, 5, 7, 0, 1]), heatmap, mask)
+    result.save_report(tmp_path / "report.json", min_pixels=1)
+    with open(tmp_path / "report.json") as f:
+        report = json.load(f)
+    assert report["start"] == 10
+    assert report["end"] == 15
+    assert report["uncovered_frames"] == 2
+    assert report["max_uncovered_pixels"] == 7
+    assert report["uncovered_ranges"] == [[11, 12]]
+    assert report["worst_frames"] == [
+        {"frame": 12, "pixels": 7},
+        {"frame": 11, "pixels": 5},
+    ]
+    assert report["uncovered_pixels"] == [0, 5, 7, 0, 1]
+
+
+def test_audit_result__heatmap(tmp_path):
+    mask = np.array([[255, 0], [0, 0]], np.uint8)
+    heatmap = np.array([[0, 1], [4, 0]], np.float64)
+    result = AuditResult(0, np.array([1, 2]), heatmap, mask)
+    image = result.get_heatmap_image()
+    assert image.shape == (2, 2, 3)
+    assert_array_equal(image[0, 0], [64, 64, 64])
+    assert_array_equal(image[1, 1], [0, 0, 0])
+    # More frames is brighter.
+    assert image[1, 0].sum() > image[0, 1].sum()
+    result.save_heatmap(tmp_path / "heatmap.png")
+    assert cv2.imread(str(tmp_path / "heatmap.png")).shape == (2, 2, 3)
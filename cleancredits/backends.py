@@ -0,0 +1,106 @@
+import pathlib
+import shlex
+import tempfile
+
+import cv2
+import ffmpeg
+
+from .helpers import OUTPUT_VIDEO_KWARGS, get_threads_kwargs, set_framerate
+
+# Clean frames in Python with OpenCV: supports every inpaint method and masks that change over time.
+BACKEND_OPENCV = "opencv"
+# Clean the whole range inside a single ffmpeg filtergraph, with no per-frame work in Python. These
+# only support a single mask for the whole range.
+BACKEND_REMOVELOGO = "removelogo"
+BACKEND_DELOGO = "delogo"
+BACKENDS = (BACKEND_OPENCV, BACKEND_REMOVELOGO, BACKEND_DELOGO)
+FFMPEG_BACKENDS = (BACKEND_REMOVELOGO, BACKEND_DELOGO)
+
+
+def get_delogo_box(mask):
+    """
+    Return (x, y, width, height) of the box delogo should remove: the mask's bounding box, shrunk to
+    leave a 1 pixel border around the frame, since delogo interpolates from the pixels around the box.
+    Returns None if the mask is empty.
+    """
+    x, y, width, height = cv2.boundingRect(mask)
+    if width == 0 or height == 0:
+        return None
+    frame_height, frame_width = mask.shape[:2]
+    left, top = max(x, 1), max(y, 1)
+    right, bottom = min(x + width, frame_width - 1), min(y + height, frame_height - 1)
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right - left, bottom - top
+
+
+def build_ffmpeg_clean(
+    video_file: pathlib.Path,
+    out_file: pathlib.Path,
+    backend: str,
+    mask,
+    mask_file: pathlib.Path = None,
+    start=None,
+    end=None,
+    framerate: str = None,
+    threads: int = None,
+):
+    """
+    Return the ffmpeg stream that cleans the video between the start and end times with one of
+    FFMPEG_BACKENDS and encodes it the same way as join_frames. removelogo reads the mask from
+    mask_file, which must already contain mask. threads limits the decoder and the encoder.
+    """
+    kwargs = get_threads_kwargs(threads)
+    if start:
+        kwargs["ss"] = start
+    if end:
+        kwargs["to"] = end
+    stream = ffmpeg.input(str(video_file), **kwargs).video
+    if backend == BACKEND_REMOVELOGO:
+        stream = stream.filter("removelogo", filename=str(mask_file))
+    elif backend == BACKEND_DELOGO:
+        box = get_delogo_box(mask)
+        if box is not None:
+            x, y, width, height = box
+            stream = stream.filter("delogo", x=x, y=y, w=width, h=height)
+    else:
+        raise ValueError(f"Unknown ffmpeg backend: {backend}")
+    if framerate:
+        stream = set_framerate(stream, framerate)
+    return stream.output(
+        str(out_file), **OUTPUT_VIDEO_KWARGS, **get_threads_kwargs(threads)
+    )
+
+
+def ffmpeg_clean(
+    video_file: pathlib.Path,
+    out_file: pathlib.Path,
+    backend: str,
+    mask,
+    start=None,
+    end=None,
+    framerate: str = None,
+    overwrite_output: bool = False,
+    threads: int = None,
+):
+    """
+    Clean the video between the start and end times with one of FFMPEG_BACKENDS, using mask (a uint8
+    array the same size as the video) for every frame, and write it to out_file. threads limits
+    ffmpeg's decoder and encoder.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        mask_file = pathlib.Path(tmp_dir) / "mask.png"
+        cv2.imwrite(str(mask_file), mask)
+        stream = build_ffmpeg_clean(
+            video_file,
+            out_file,
+            backend,
+            mask,
+            mask_file=mask_file,
+            start=start,
+            end=end,
+            framerate=framerate,
+            threads=threads,
+        )
+        print(f"Cleaning with {backend}: {shlex.join(ffmpeg.compile(stream))}")
+        stream.run(overwrite_output=overwrite_output)
@@ -0,0 +1,72 @@
+import cv2
+import ffmpeg
+import numpy as np
+import pytest
+
+from .backends import (
+    BACKEND_DELOGO,
+    BACKEND_REMOVELOGO,
+    build_ffmpeg_clean,
+    ffmpeg_clean,
+    get_delogo_box,
+)
+from .helpers_test import TESTDATA_PATH
+
+
+def test_get_delogo_box():
+    mask = np.zeros((10, 20), np.uint8)
+    mask[2:5, 3:9] = 255
+    assert get_delogo_box(mask) == (3, 2, 6, 3)
+
+
+def test_get_delogo_box__edges():
+    mask = np.zeros((10, 20), np.uint8)
+    mask[0:5, 15:20] = 255
+    # delogo needs a pixel of border around the box.
+    assert get_delogo_box(mask) == (15, 1, 4, 4)
+
+
+def test_get_delogo_box__empty():
+    assert get_delogo_box(np.zeros((10, 20), np.uint8)) is None
+
+
+def test_build_ffmpeg_clean__unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        build_ffmpeg_clean(
+            TESTDATA_PATH / "horses-720p.mp4",
+            tmp_path / "out.mp4",
+            "foo",
+            np.zeros((720, 1080), np.uint8),
+        )
+
+
+def test_build_ffmpeg_clean__threads(tmp_path):
+    stream = build_ffmpeg_clean(
+        TESTDATA_PATH / "horses-720p.mp4",
+        tmp_path / "out.mp4",
+        BACKEND_DELOGO,
+        np.zeros((720, 1080), np.uint8),
+        threads=2,
+    )
+    args = ffmpeg.compile(stream)
+    # Once for the decoder, before the input, and once for the encoder.
+    assert args.count("-threads") == 2
+    assert args.index("-threads") < args.index("-i")
+
+
+@pytest.mark.parametrize("backend", [BACKEND_REMOVELOGO, BACKEND_DELOGO])
+def test_ffmpeg_clean(tmp_path, backend):
+    mask = cv2.imread(str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE)
+    _, mask = cv2.threshold(mask, 1, 255, cv2.THRESH_BINARY)
+    out_file = tmp_path / "out.mp4"
+    ffmpeg_clean(
+        TESTDATA_PATH / "horses-720p.mp4",
+        out_file,
+        backend,
+        mask,
+        start="0.04s",
+        end="0.4s",
+    )
+    cap = cv2.VideoCapture(str(out_file))
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == 9
+    assert cap.get(cv2.CAP_PROP_FPS) == 25
@@ -0,0 +1,134 @@
+import numpy as np
+
+# _UNPACK_LUT[byte] is the 8 uint8 mask pixels (0 or 255) encoded by that byte.
+_UNPACK_LUT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1) * np.uint8(
+    255
+)
+# _POPCOUNT_LUT[byte] is the number of bits set in that byte. Only used with numpy < 2.0, which doesn't
+# have np.bitwise_count.
+_POPCOUNT_LUT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(
+    axis=1, dtype=np.uint8
+)
+
+
+class BitMask(object):
+    """
+    BitMask is a binary mask stored with one bit per pixel instead of one byte, so it takes 8x less
+    memory (and bandwidth) than the uint8 masks OpenCV works with. Bits are packed along each row
+    with np.packbits, so rows start on a byte boundary and any padding bits at the end of a row are
+    always zero.
+
+    BitMasks support `|`, `&` and `~`, which makes them usable anywhere the equivalent uint8 masks
+    are combined (for example helpers.combine_masks). Use to_array to get the 0/255 uint8 mask that
+    cv2.inpaint and friends need.
+    """
+
+    __slots__ = ("bits", "width")
+
+    def __init__(self, bits: np.array, width: int):
+        self.bits = bits
+        self.width = width
+
+    @classmethod
+    def from_array(cls, mask: np.array) -> "BitMask":
+        """Pack a 2d mask. Any non-zero pixel is considered part of the mask."""
+        return cls(np.packbits(mask > 0, axis=-1), mask.shape[-1])
+
+    @classmethod
+    def zeros(cls, height: int, width: int) -> "BitMask":
+        return cls(np.zeros((height, (width + 7) // 8), np.uint8), width)
+
+    @property
+    def height(self) -> int:
+        return self.bits.shape[0]
+
+    @property
+    def shape(self) -> (int, int):
+        return (self.height, self.width)
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def _row_padding(self) -> np.array:
+        """Return a per-byte mask of the bits in each row that are inside the mask width."""
+        padding = np.full(self.bits.shape[1], 0xFF, np.uint8)
+        if self.width % 8:
+            padding[-1] = (0xFF << (8 - self.width % 8)) & 0xFF
+        return padding
+
+    def to_array(self) -> np.array:
+        """Unpack into a uint8 mask with values 0 and 255."""
+        unpacked = _UNPACK_LUT[self.bits].reshape(self.height, -1)
+        if unpacked.shape[1] != self.width:
+            unpacked = np.ascontiguousarray(unpacked[:, : self.width])
+        return unpacked
+
+    def copy(self) -> "BitMask":
+        return BitMask(self.bits.copy(), self.width)
+
+    def count(self) -> int:
+        """Return the number of pixels in the mask."""
+        if hasattr(np, "bitwise_count"):
+            return int(np.bitwise_count(self.bits).sum(dtype=np.int64))
+        return int(_POPCOUNT_LUT[self.bits].sum(dtype=np.int64))
+
+    def any(self) -> bool:
+        return bool(self.bits.any())
+
+    def bbox(self):
+        """Return the bounding box of the mask as (x, y, width, height), or None if it is empty."""
+        rows = np.flatnonzero(self.bits.any(axis=1))
+        if rows.size == 0:
+            return None
+        columns = np.bitwise_or.reduce(self.bits[rows[0] : rows[-1] + 1], axis=0)
+        columns = np.flatnonzero(np.unpackbits(columns, count=self.width))
+        x, y = int(columns[0]), int(rows[0])
+        return x, y, int(columns[-1]) + 1 - x, int(rows[-1]) + 1 - y
+
+    def paint(self, region: np.array, x: int, y: int, value: bool):
+        """
+        Set (or, if value is False, clear) the pixels where region is non-zero. region is a 2d array
+        whose top left corner is placed at (x, y); any part of it outside the mask is ignored. Only the
+        bytes covered by region are unpacked, so painting small strokes is cheap.
+        """
+        height, width = region.shape
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, self.width), min(y + height, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        region = region[y0 - y : y1 - y, x0 - x : x1 - x]
+        byte0, byte1 = x0 // 8, (x1 + 7) // 8
+        unpacked = np.unpackbits(self.bits[y0:y1, byte0:byte1], axis=1)
+        unpacked[:, x0 - byte0 * 8 : x1 - byte0 * 8][region > 0] = 1 if value else 0
+        self.bits[y0:y1, byte0:byte1] = np.packbits(unpacked, axis=1)
+
+    def _check_compatible(self, other):
+        if not isinstance(other, BitMask):
+            raise TypeError(f"Expected BitMask, got {type(other).__name__}")
+        if self.shape != other.shape:
+            raise ValueError(f"Mask shapes differ: {self.shape} != {other.shape}")
+
+    def __or__(self, other: "BitMask") -> "BitMask":
+        self._check_compatible(other)
+        return BitMask(np.bitwise_or(self.bits, other.bits), self.width)
+
+    def __and__(self, other: "BitMask") -> "BitMask":
+        self._check_compatible(other)
+        return BitMask(np.bitwise_and(self.bits, other.bits), self.width)
+
+    def __invert__(self) -> "BitMask":
+        # Keep padding bits at zero so that count, bbox and == stay correct.
+        return BitMask(
+            np.bitwise_and(np.bitwise_not(self.bits), self._row_padding()), self.width
+        )
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, BitMask):
+            return NotImplemented
+        return self.width == other.width and np.array_equal(self.bits, other.bits)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"BitMask(shape={self.shape}, count={self.count()})"
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from .bitmask import BitMask
+
+
+def random_mask(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.random((height, width)) > 0.5).astype(np.uint8) * 255
+
+
+@pytest.mark.parametrize("width", [1, 7, 8, 9, 1080])
+def test_bitmask__roundtrip(width):
+    mask = random_mask(5, width, seed=width)
+    bitmask = BitMask.from_array(mask)
+    assert bitmask.shape == (5, width)
+    assert bitmask.nbytes == 5 * ((width + 7) // 8)
+    assert_array_equal(bitmask.to_array(), mask)
+    assert bitmask.to_array().flags.c_contiguous
+
+
+def test_bitmask__nonzero_is_masked():
+    mask = np.array([[0, 1, 127, 255]], np.uint8)
+    assert_array_equal(BitMask.from_array(mask).to_array(), [[0, 255, 255, 255]])
+
+
+@pytest.mark.parametrize("width", [5, 16, 21])
+def test_bitmask__operators_match_uint8(width):
+    a = random_mask(4, width, seed=1)
+    b = random_mask(4, width, seed=2)
+    bit_a = BitMask.from_array(a)
+    bit_b = BitMask.from_array(b)
+    assert_array_equal((bit_a | bit_b).to_array(), a | b)
+    assert_array_equal((bit_a & bit_b).to_array(), a & b)
+    assert_array_equal((~bit_a).to_array(), ~a)
+    assert (~bit_a).count() == np.count_nonzero(~a)
+    assert ~~bit_a == bit_a
+
+
+def test_bitmask__operators_require_same_shape():
+    with pytest.raises(ValueError):
+        BitMask.zeros(2, 2) | BitMask.zeros(2, 3)
+    with pytest.raises(TypeError):
+        BitMask.zeros(2, 2) & np.zeros((2, 2), np.uint8)
+
+
+def test_bitmask__equality():
+    mask = random_mask(3, 10)
+    assert BitMask.from_array(mask) == BitMask.from_array(mask)
+    assert BitMask.from_array(mask) != BitMask.from_array(~mask)
+    assert BitMask.from_array(mask) != None
+    assert BitMask.zeros(1, 8) != BitMask.zeros(1, 7)
+
+
+def test_bitmask__count():
+    mask = random_mask(7, 33)
+    assert BitMask.from_array(mask).count() == np.count_nonzero(mask)
+    assert BitMask.zeros(10, 10).count() == 0
+    assert not BitMask.zeros(10, 10).any()
+
+
+@pytest.mark.parametrize(
+    "box",
+    [(0, 0, 1, 1), (3, 2, 5, 4), (9, 0, 12, 7), (20, 6, 1, 1)],
+)
+def test_bitmask__bbox(box):
+    x, y, w, h = box
+    mask = np.zeros((7, 21), np.uint8)
+    mask[y : y + h, x : x + w] = 255
+    assert BitMask.from_array(mask).bbox() == box
+
+
+def test_bitmask__bbox__empty():
+    assert BitMask.zeros(5, 5).bbox() is None
+
+
+@pytest.mark.parametrize("x,y", [(0, 0), (3, 1), (10, 2), (-2, -1), (15, 4)])
+def test_bitmask__paint(x, y):
+    mask = random_mask(6, 19)
+    region = random_mask(3, 6, seed=3)
+    for value in (True, False):
+        bitmask = BitMask.from_array(mask)
+        bitmask.paint(region, x, y, value)
+        # Paint the same region onto the uint8 mask, clipped to its bounds.
+        expected = mask.copy()
+        for ry in range(region.shape[0]):
+            for rx in range(region.shape[1]):
+                if region[ry, rx] and 0 <= y + ry < 6 and 0 <= x + rx < 19:
+                    expected[y + ry, x + rx] = 255 if value else 0
+        assert_array_equal(bitmask.to_array(), expected)
+        # Padding bits must stay clear.
+        assert bitmask.count() == np.count_nonzero(expected)
+
+
+def test_bitmask__paint__outside():
+    bitmask = BitMask.zeros(4, 4)
+    bitmask.paint(np.full((2, 2), 255, np.uint8), 10, 10, True)
+    assert bitmask.count() == 0
@@ -0,0 +1,80 @@
+import collections
+import threading
+
+import numpy as np
+
+
+class BufferPool(object):
+    """
+    BufferPool hands out arrays that are reused from frame to frame, so that cleaning a video doesn't
+    allocate new arrays for every frame. Arrays are taken with acquire and given back with release.
+
+    It also counts how many arrays were allocated and how many bytes were copied (through copy), so
+    that the cost of the per-frame hot path can be reported with format_stats.
+    """
+
+    def __init__(self):
+        # Free arrays by (shape, dtype).
+        self.free = collections.defaultdict(list)
+        # Inpainting threads share the pool.
+        self.lock = threading.Lock()
+        self.allocations = 0
+        self.allocated_bytes = 0
+        # Bytes of the arrays acquire allocated, which the pool keeps for as long as it's used.
+        self.pooled_bytes = 0
+        self.copied_bytes = 0
+        self.frames = 0
+
+    def acquire(self, shape, dtype=np.uint8) -> np.array:
+        """Return an uninitialized array, reusing a released one with the same shape and dtype."""
+        key = (tuple(shape), np.dtype(dtype))
+        with self.lock:
+            if self.free[key]:
+                return self.free[key].pop()
+        array = np.empty(shape, dtype)
+        self.record_allocation(array)
+        with self.lock:
+            self.pooled_bytes += array.nbytes
+        return array
+
+    def release(self, array):
+        """Give an array from acquire back, so that it can be handed out again."""
+        with self.lock:
+            self.free[(array.shape, array.dtype)].append(array)
+
+    def record_allocation(self, array):
+        """Count an array that had to be allocated outside of the pool, such as a decoded frame."""
+        with self.lock:
+            self.allocations += 1
+            self.allocated_bytes += array.nbytes
+
+    def copy(self, dst, src, where=True):
+        """np.copyto(dst, src, where=where), counting the bytes copied."""
+        np.copyto(dst, src, where=where)
+        if where is True:
+            copied = dst.nbytes
+        else:
+            copied = np.count_nonzero(np.broadcast_to(where, dst.shape)) * dst.itemsize
+        with self.lock:
+            self.copied_bytes += copied
+
+    def end_frame(self):
+        with self.lock:
+            self.frames += 1
+
+    def format_stats(self) -> str:
+        frames = max(self.frames, 1)
+        return (
+            f"Buffers: {self.allocations / frames:.1f} allocations "
+            f"({self.allocated_bytes / frames / 1024 / 1024:.2f} MB) and "
+            f"{self.copied_bytes / frames / 1024 / 1024:.2f} MB copied per frame, "
+            f"over {self.frames} frames"
+        )
+
+
+def copyto(dst, src, where=True, pool=None):
+    """np.copyto, counted by pool if there is one."""
+    if pool is None:
+        np.copyto(dst, src, where=where)
+    else:
+        pool.copy(dst, src, where)
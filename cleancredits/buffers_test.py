@@ -0,0 +1,52 @@
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from .buffers import BufferPool, copyto
+
+
+def test_buffer_pool__reuses_released_arrays():
+    pool = BufferPool()
+    array = pool.acquire((4, 5, 3))
+    assert array.shape == (4, 5, 3)
+    assert array.dtype == np.uint8
+    pool.release(array)
+    assert pool.acquire((4, 5, 3)) is array
+    assert pool.acquire((4, 5, 3)) is not array
+    assert pool.acquire((4, 5), np.float32).dtype == np.float32
+    assert pool.allocations == 3
+    assert pool.allocated_bytes == 2 * 60 + 20 * 4
+    # Arrays allocated elsewhere don't stay in the pool.
+    pool.record_allocation(np.zeros(10, np.uint8))
+    assert pool.allocated_bytes == 2 * 60 + 20 * 4 + 10
+    assert pool.pooled_bytes == 2 * 60 + 20 * 4
+
+
+def test_buffer_pool__copy():
+    pool = BufferPool()
+    dst = np.zeros((2, 3, 3), np.uint8)
+    src = np.full((2, 3, 3), 7, np.uint8)
+    where = np.zeros((2, 3, 1), bool)
+    where[0, 0] = True
+    pool.copy(dst, src, where)
+    assert pool.copied_bytes == 3
+    assert dst.sum() == 21
+    pool.copy(dst, src)
+    assert pool.copied_bytes == 3 + 18
+    assert_array_equal(dst, src)
+
+
+def test_buffer_pool__format_stats():
+    pool = BufferPool()
+    pool.record_allocation(np.empty(1024 * 1024, np.uint8))
+    pool.copy(np.empty(1024 * 1024, np.uint8), 0)
+    pool.end_frame()
+    pool.end_frame()
+    assert pool.format_stats() == (
+        "Buffers: 0.5 allocations (0.50 MB) and 0.50 MB copied per frame, over 2 frames"
+    )
+
+
+def test_copyto__without_pool():
+    dst = np.zeros(3, np.uint8)
+    copyto(dst, np.arange(3, dtype=np.uint8), np.array([True, False, True]))
+    assert_array_equal(dst, [0, 0, 2])
@@ -2,13 +2,21 @@ import os
 import pathlib
 import re
 import shutil
+import time
 
 import click
 import cv2
 
 from .__version__ import __version__
+from .audit import audit_video
+from .backends import BACKEND_OPENCV, BACKENDS, FFMPEG_BACKENDS, ffmpeg_clean
+from .buffers import BufferPool
+from .cpu_budget import CpuBudget
 from .gui.app import App
 from .helpers import (
+    INPAINT_METHOD_TELEA,
+    INPAINT_METHOD_TEMPORAL,
+    INPAINT_METHODS,
     MASK_MODE_INCLUDE,
     clean_frames,
     combine_masks,
@@ -17,19 +25,65 @@ from .helpers import (
     render_mask,
     split_frames,
 )
-from .param_types import FRAMERATE, TIMECODE, timecode_to_frame
+from .incremental import (
+    IncrementalRender,
+    clear_render_state,
+    load_render_state,
+    save_render_state,
+)
+from .inpaint import StaticBackgroundReuse, get_inpaint_scheduler
+from .inpaint_cache import (
+    DEFAULT_INPAINT_CACHE_BYTES,
+    DEFAULT_INPAINT_CACHE_DIR,
+    InpaintCache,
+)
+from .keyframes import MaskTrack
+from .layers import load_layers
+from .memory_budget import MemoryBudget
+from .param_types import FRAMERATE, TIMECODE, frame_to_timecode, timecode_to_frame
+from .pipelines import (
+    PATCH_FORMAT_QTRLE,
+    PATCH_FORMATS,
+    PIPELINE_CROP,
+    PIPELINE_FRAMES,
+    PIPELINE_YUV,
+    PIPELINES,
+    crop_clean,
+    export_patch,
+    get_patch_sidecar_path,
+    yuv_clean,
+)
+from .stages import DEFAULT_QUEUE_SIZE, StagedPipeline
+from .temporal import DEFAULT_TEMPORAL_WINDOW, STATIC_MASK_WARNING
+from .tiling import DEFAULT_TILE_MEMORY
+from .tracking import ScrollTracker
+from .video_scan import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_MAX_GAP_FRAMES,
+    DEFAULT_MIN_RANGE_FRAMES,
+    DEFAULT_SCAN_SCALE,
+    format_chunk_workers,
+    get_default_threshold,
+    get_timeline,
+    propose_ranges,
+)
 
 DEFAULT_RADIUS = 3
 
 
 @click.group(invoke_without_command=True)
 @click.version_option(version=__version__)
+@click.option(
+    "--max-memory",
+    type=click.IntRange(1),
+    help="Memory in MB that the GUI's renders and playback may hold frames in. The clean command has its own --max-memory. Default: no limit.",
+)
 @click.pass_context
-def cli(ctx):
+def cli(ctx, max_memory):
     if ctx.invoked_subcommand is not None:
         return
 
-    app = App()
+    app = App(max_memory=max_memory * 1024 * 1024 if max_memory else None)
     app.open_video()
     if not app.video_path:
         print("No video selected - exiting")
@@ -210,7 +264,11 @@ def mask(
 @click.argument(
     "video", type=click.Path(exists=True, dir_okay=False, resolve_path=True)
 )
-@click.argument("mask", type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.argument(
+    "mask",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+    required=False,
+)
 @click.option(
     "-s",
     "--start",
@@ -229,6 +287,33 @@ def mask(
     default=DEFAULT_RADIUS,
     help=f"Interpolation radius. Default: {DEFAULT_RADIUS}",
 )
+@click.option(
+    "-m",
+    "--method",
+    type=click.Choice(INPAINT_METHODS),
+    default=INPAINT_METHOD_TELEA,
+    help="Inpaint method. telea inpaints each frame on its own; temporal takes the background from nearby frames where it isn't covered, which is faster and sharper when the mask moves (--scroll or --keyframes) over a background that doesn't. With a single MASK, temporal gives the same result as telea, only slower. Default: telea",
+)
+@click.option(
+    "--window",
+    type=click.IntRange(1),
+    default=DEFAULT_TEMPORAL_WINDOW,
+    help=f"Number of frames the temporal method takes the background from. Default: {DEFAULT_TEMPORAL_WINDOW}",
+)
+@click.option(
+    "-b",
+    "--backend",
+    type=click.Choice(BACKENDS),
+    default=BACKEND_OPENCV,
+    help="What cleans the frames. opencv cleans each frame in Python; removelogo and delogo clean the whole range inside ffmpeg, which is much faster but only supports a single MASK with the telea method, and requires --output. removelogo follows the shape of the mask, delogo removes its bounding box. Default: opencv",
+)
+@click.option(
+    "-p",
+    "--pipeline",
+    type=click.Choice(PIPELINES),
+    default=PIPELINE_FRAMES,
+    help="How frames get to and from the opencv backend. frames splits the range into frame images and joins the cleaned frames back together; crop has ffmpeg crop out the area around the mask, cleans only that, and overlays it back onto the video while encoding, which is much faster when the mask is small. yuv cleans the YUV 4:2:0 frames ffmpeg decodes without converting them to BGR and back, inpainting the color planes at quarter resolution. crop and yuv only support a single MASK, require --output, and don't write out the cleaned frames; yuv only supports the telea method. Default: frames",
+)
 @click.option(
     "-f",
     "--framerate",
@@ -241,49 +326,636 @@ def mask(
     help="Convert frames to video and output to this location if set",
     type=click.Path(dir_okay=False, writable=True, resolve_path=True),
 )
-def clean(video, mask, start, end, radius, framerate, output):
+@click.option(
+    "--patch",
+    "patch_path",
+    help="Instead of a whole video, write only the cleaned area around the mask to this location, with alpha from the mask, for compositing in other tools. A JSON sidecar next to it (PATCH.json) says where to place the patch. Can't be combined with --output, --scroll or --keyframes.",
+    type=click.Path(writable=True, resolve_path=True),
+)
+@click.option(
+    "--patch-format",
+    type=click.Choice(PATCH_FORMATS),
+    default=PATCH_FORMAT_QTRLE,
+    help="Format for --patch: a directory of PNGs (png), QuickTime Animation (qtrle) or ProRes 4444 (prores). Default: qtrle",
+)
+@click.option(
+    "--scroll",
+    "layers_path",
+    help="Track scrolling credits, using the mask layers in this layers file (exported from the GUI). MASK is optional in this mode; if set, it is inpainted on every frame in addition to the tracked text.",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+)
+@click.option(
+    "--keyframes",
+    "keyframes_path",
+    help="Switch masks at keyframes, using this mask track file (exported from the GUI). Can't be combined with MASK or --scroll.",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, writable=True, resolve_path=True),
+    default=str(DEFAULT_INPAINT_CACHE_DIR),
+    show_default=True,
+    help="Directory to cache inpainted areas in, so that cleaning the same frames with the same mask again (for example, after widening the range) only inpaints the new frames. Only used by the frames pipeline with the telea method.",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(0),
+    default=DEFAULT_INPAINT_CACHE_BYTES // (1024 * 1024),
+    show_default=True,
+    help="Size of the inpaint cache in MB; the least recently used areas are deleted past this. 0 turns the cache off.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Reuse the cleaned frames in the clip folder from the last run with the same video, start and radius, and only inpaint the parts of each frame that changing the mask affects. Requires MASK, and can't be combined with --scroll, --keyframes or the temporal method.",
+)
+@click.option(
+    "--tile-memory",
+    type=click.IntRange(0),
+    default=DEFAULT_TILE_MEMORY // (1024 * 1024),
+    show_default=True,
+    help="Memory in MB that each strip of a frame may use while rendering --scroll masks, to keep memory use down for large (such as 8K) videos. 0 renders whole frames at once.",
+)
+@click.option(
+    "--inpaint-workers",
+    type=click.IntRange(1),
+    default=1,
+    show_default=True,
+    help="Number of frames inpainted at once. Frames are read, inpainted and written in separate threads either way. Only used by the frames pipeline with the telea method.",
+)
+@click.option(
+    "--cpus",
+    "--threads",
+    "cpus",
+    type=click.IntRange(1),
+    help="Number of CPUs to use. They're divided between the ffmpeg decoder and encoder, --inpaint-workers, the threads the workers share to inpaint separate parts of the mask in, and OpenCV, so that together they don't start more threads than there are CPUs. The allocation is printed before cleaning. Default: each of them uses all CPUs.",
+)
+@click.option(
+    "--pin-cpus",
+    is_flag=True,
+    help="Only run on the first --cpus CPUs (or the CPUs available, if --cpus isn't set), along with the ffmpeg processes cleaning starts. Linux only.",
+)
+@click.option(
+    "--max-memory",
+    type=click.IntRange(1),
+    help="Memory in MB that the frames held while cleaning may take: the frames waiting between reading, inpainting and writing, the frames being inpainted by --inpaint-workers, and the temporal method's --window. They're shrunk to fit, and the allocation and the memory actually used are printed. Default: no limit.",
+)
+def clean(
+    video,
+    mask,
+    start,
+    end,
+    radius,
+    method,
+    window,
+    backend,
+    pipeline,
+    framerate,
+    output,
+    patch_path,
+    patch_format,
+    layers_path,
+    keyframes_path,
+    cache_dir,
+    cache_size,
+    incremental,
+    tile_memory,
+    inpaint_workers,
+    cpus,
+    pin_cpus,
+    max_memory,
+):
+    if keyframes_path and (mask or layers_path):
+        raise click.UsageError("--keyframes can't be combined with MASK or --scroll")
+    if backend in FFMPEG_BACKENDS:
+        if layers_path or keyframes_path or method != INPAINT_METHOD_TELEA:
+            raise click.UsageError(
+                f"The {backend} backend can't be combined with --scroll, --keyframes or --method"
+            )
+        if mask is None:
+            raise click.UsageError(f"MASK is required with the {backend} backend")
+        if not output:
+            raise click.UsageError(f"--output is required with the {backend} backend")
+    if patch_path:
+        if output or layers_path or keyframes_path or backend != BACKEND_OPENCV:
+            raise click.UsageError(
+                f"--patch can't be combined with --output, --scroll, --keyframes or the {backend} backend"
+            )
+        if mask is None:
+            raise click.UsageError("MASK is required with --patch")
+    elif pipeline in (PIPELINE_CROP, PIPELINE_YUV):
+        if backend != BACKEND_OPENCV:
+            raise click.UsageError(
+                f"The {pipeline} pipeline is only used by the {BACKEND_OPENCV} backend"
+            )
+        if layers_path or keyframes_path:
+            raise click.UsageError(
+                f"The {pipeline} pipeline can't be combined with --scroll or --keyframes"
+            )
+        if mask is None:
+            raise click.UsageError(f"MASK is required with the {pipeline} pipeline")
+        if not output:
+            raise click.UsageError(f"--output is required with the {pipeline} pipeline")
+        if pipeline == PIPELINE_YUV and method != INPAINT_METHOD_TELEA:
+            raise click.UsageError(
+                f"The {pipeline} pipeline only supports the {INPAINT_METHOD_TELEA} method"
+            )
+    if incremental:
+        if (
+            layers_path
+            or keyframes_path
+            or method != INPAINT_METHOD_TELEA
+            or backend != BACKEND_OPENCV
+            or pipeline != PIPELINE_FRAMES
+            or patch_path
+        ):
+            raise click.UsageError(
+                f"--incremental only supports a single MASK with the {BACKEND_OPENCV} backend, the {PIPELINE_FRAMES} pipeline and the {INPAINT_METHOD_TELEA} method"
+            )
+        if mask is None:
+            raise click.UsageError("MASK is required with --incremental")
+    if mask is None and layers_path is None and keyframes_path is None:
+        raise click.UsageError("MASK is required unless --scroll or --keyframes is set")
+    if (
+        method == INPAINT_METHOD_TEMPORAL
+        and layers_path is None
+        and keyframes_path is None
+    ):
+        click.echo(f"Warning: {STATIC_MASK_WARNING}", err=True)
+    layers = None
+    if layers_path:
+        try:
+            layers = load_layers(layers_path)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint="--scroll")
+    mask_track = None
+    if keyframes_path:
+        try:
+            mask_track = MaskTrack.load(keyframes_path)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint="--keyframes")
+
+    decode_threads = encode_threads = None
+    if cpus or pin_cpus:
+        # ffmpeg only decodes and encodes while frames are cleaned when they're streamed through it,
+        # or when it cleans them itself.
+        streaming = (
+            bool(patch_path)
+            or backend in FFMPEG_BACKENDS
+            or pipeline in (PIPELINE_CROP, PIPELINE_YUV)
+        )
+        try:
+            budget = CpuBudget(cpus, inpaint_workers, streaming, pin=pin_cpus)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint="--pin-cpus")
+        budget.apply()
+        print(budget.format_allocation())
+        inpaint_workers = budget.workers
+        decode_threads = budget.decode_threads
+        encode_threads = budget.encode_threads
+
     cap = cv2.VideoCapture(video)
     input_framerate = cap.get(cv2.CAP_PROP_FPS)
     if not framerate:
         # Default to the input video's framerate
         framerate = input_framerate
 
-    video_file = pathlib.Path(video)
-    mask_file = pathlib.Path(mask)
-
-    cwd = pathlib.Path.cwd()
-    clip_folder = cwd / video_file.stem
-    if clip_folder.exists():
-        click.confirm(
-            f"Clip folder ({clip_folder}) already exists; do you want to delete it and continue?",
-            abort=True,
-            prompt_suffix="",
+    queue_size = DEFAULT_QUEUE_SIZE
+    memory_budget = None
+    if max_memory:
+        frame_bytes = (
+            int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            * int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            * 3
         )
-        shutil.rmtree(clip_folder)
-    os.makedirs(clip_folder)
-    output_clip_folder = clip_folder / "output"
-    os.mkdir(output_clip_folder)
+        if incremental:
+            # Frames that are updated come with the previously cleaned frame.
+            frame_bytes *= 2
+        memory_budget = MemoryBudget(max_memory * 1024 * 1024, frame_bytes)
+        if method == INPAINT_METHOD_TELEA:
+            if (
+                backend == BACKEND_OPENCV
+                and pipeline == PIPELINE_FRAMES
+                and not patch_path
+            ):
+                queue_size, inpaint_workers = memory_budget.get_pipeline(
+                    inpaint_workers
+                )
+        else:
+            window = memory_budget.get_window(window)
+        print(memory_budget.format_allocation())
 
+    video_file = pathlib.Path(video)
     start_frame = timecode_to_frame(start, fps=input_framerate, default=0)
     end_frame = timecode_to_frame(
         end, fps=input_framerate, default=cap.get(cv2.CAP_PROP_FRAME_COUNT) - 1
     )
 
-    split_frames(
-        video_file,
-        clip_folder,
-        start=f"{start_frame / input_framerate}s",
-        end=f"{end_frame / input_framerate}s",
+    if backend in FFMPEG_BACKENDS:
+        clean_start = time.perf_counter()
+        mask_im = cv2.imread(mask, cv2.IMREAD_GRAYSCALE)
+        _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+        ffmpeg_clean(
+            video_file,
+            pathlib.Path(output),
+            backend,
+            mask_im,
+            start=f"{start_frame / input_framerate}s",
+            end=f"{end_frame / input_framerate}s",
+            framerate=None if framerate == input_framerate else framerate,
+            threads=decode_threads,
+        )
+        print_clean_time(backend, output, clean_start)
+        return
+
+    if patch_path:
+        clean_start = time.perf_counter()
+        mask_im = cv2.imread(mask, cv2.IMREAD_GRAYSCALE)
+        _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+        frame_count = export_patch(
+            video_file,
+            pathlib.Path(patch_path),
+            mask_im,
+            radius,
+            patch_format=patch_format,
+            method=method,
+            window=window,
+            start=f"{start_frame / input_framerate}s",
+            end=f"{end_frame / input_framerate}s",
+            start_frame=start_frame,
+            framerate=None if framerate == input_framerate else framerate,
+            decode_threads=decode_threads,
+            encode_threads=encode_threads,
+        )
+        if frame_count is None:
+            print("The mask is empty, so there is no patch to export")
+            return
+        elapsed = time.perf_counter() - clean_start
+        print(
+            f"Exported a {patch_format} patch of {frame_count} frames in {elapsed:.2f}s "
+            f"({frame_count / elapsed:.1f} fps), placed by {get_patch_sidecar_path(patch_path)}"
+        )
+        return
+
+    if pipeline == PIPELINE_CROP:
+        clean_start = time.perf_counter()
+        mask_im = cv2.imread(mask, cv2.IMREAD_GRAYSCALE)
+        _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+        crop_clean(
+            video_file,
+            pathlib.Path(output),
+            mask_im,
+            radius,
+            method=method,
+            window=window,
+            start=f"{start_frame / input_framerate}s",
+            end=f"{end_frame / input_framerate}s",
+            framerate=None if framerate == input_framerate else framerate,
+            decode_threads=decode_threads,
+            encode_threads=encode_threads,
+        )
+        print_clean_time(f"{backend} ({pipeline} pipeline)", output, clean_start)
+        return
+
+    if pipeline == PIPELINE_YUV:
+        clean_start = time.perf_counter()
+        mask_im = cv2.imread(mask, cv2.IMREAD_GRAYSCALE)
+        _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+        yuv_clean(
+            video_file,
+            pathlib.Path(output),
+            mask_im,
+            radius,
+            start=f"{start_frame / input_framerate}s",
+            end=f"{end_frame / input_framerate}s",
+            framerate=None if framerate == input_framerate else framerate,
+            decode_threads=decode_threads,
+            encode_threads=encode_threads,
+        )
+        print_clean_time(f"{backend} ({pipeline} pipeline)", output, clean_start)
+        return
+
+    mask_im = None
+    if mask:
+        mask_file = pathlib.Path(mask)
+        assert mask_file.is_file()
+        mask_im = cv2.imread(str(mask_file), cv2.IMREAD_GRAYSCALE)
+        _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+    # Only a single mask with the telea method can be updated by an incremental render.
+    static_mask = (
+        layers is None and mask_track is None and method == INPAINT_METHOD_TELEA
     )
 
-    assert mask_file.is_file()
-    mask_im = cv2.imread(str(mask_file), cv2.IMREAD_GRAYSCALE)
-    _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+    cwd = pathlib.Path.cwd()
+    clip_folder = cwd / video_file.stem
+    output_clip_folder = clip_folder / "output"
+    previous = None
+    if incremental:
+        previous = load_render_state(output_clip_folder, video_file, radius)
+        if previous is not None and previous[1] != start_frame:
+            # Frames are numbered from the start of the range, so they don't line up.
+            previous = None
+    if previous is None:
+        if clip_folder.exists():
+            click.confirm(
+                f"Clip folder ({clip_folder}) already exists; do you want to delete it and continue?",
+                abort=True,
+                prompt_suffix="",
+            )
+            shutil.rmtree(clip_folder)
+        os.makedirs(clip_folder)
+        os.mkdir(output_clip_folder)
+    # The cleaned frames no longer match the saved state once cleaning starts.
+    clear_render_state(output_clip_folder)
+
+    clean_start = time.perf_counter()
+    if previous is None or previous[2] != end_frame:
+        for path in clip_folder.iterdir():
+            if path.is_file():
+                path.unlink()
+        split_frames(
+            video_file,
+            clip_folder,
+            start=f"{start_frame / input_framerate}s",
+            end=f"{end_frame / input_framerate}s",
+            threads=decode_threads,
+        )
+        # Drop cleaned frames that are past the end of the new range.
+        for path in output_clip_folder.iterdir():
+            if not (clip_folder / path.name).is_file():
+                path.unlink()
+    incremental_render = None
+    if previous is not None:
+        incremental_render = IncrementalRender(previous[0], mask_im, radius)
+        print(incremental_render.format_stats())
+
+    tracker = None
+    if layers is not None:
+        tracker = ScrollTracker(
+            layers,
+            static_mask=mask_im,
+            max_bytes=tile_memory * 1024 * 1024 if tile_memory else None,
+        )
+        mask_im = tracker
+    if mask_track is not None:
+        mask_track.prepare(cap)
+        mask_im = mask_track.mask_function(start_frame, radius)
+    cache = None
+    if cache_size and method == INPAINT_METHOD_TELEA:
+        cache = InpaintCache(cache_dir, max_bytes=cache_size * 1024 * 1024)
+    reuse = StaticBackgroundReuse() if method == INPAINT_METHOD_TELEA else None
+    pool = BufferPool() if method == INPAINT_METHOD_TELEA else None
+    staged_pipeline = None
+    if method == INPAINT_METHOD_TELEA:
+        staged_pipeline = StagedPipeline(queue_size)
+    get_inpaint_scheduler().reset_stats()
     for in_file, out_file in clean_frames(
-        mask_im, clip_folder, output_clip_folder, radius
+        mask_im,
+        clip_folder,
+        output_clip_folder,
+        radius,
+        method=method,
+        window=window,
+        cache=cache,
+        incremental=incremental_render,
+        reuse=reuse,
+        pool=pool,
+        workers=inpaint_workers,
+        pipeline=staged_pipeline,
     ):
         print(in_file, out_file)
+    if tracker is not None:
+        print(tracker.format_stats())
+    if reuse is not None:
+        print(reuse.format_stats())
+    if cache is not None:
+        print(cache.format_stats())
+    if pool is not None:
+        print(pool.format_stats())
+    if staged_pipeline is not None:
+        print(staged_pipeline.format_stats())
+    if get_inpaint_scheduler().runs:
+        print(get_inpaint_scheduler().format_stats())
+    if memory_budget is not None and staged_pipeline is not None:
+        print(memory_budget.format_usage(staged_pipeline, pool))
+    if static_mask:
+        save_render_state(
+            output_clip_folder, video_file, mask_im, radius, start_frame, end_frame
+        )
 
     if output:
         out_file = pathlib.Path(output)
-        join_frames(output_clip_folder, out_file, framerate)
+        join_frames(output_clip_folder, out_file, framerate, threads=encode_threads)
+        print_clean_time(f"{backend} ({pipeline} pipeline)", output, clean_start)
+
+
+def print_clean_time(backend, output, clean_start):
+    """Print how fast the backend cleaned the video, so backends can be compared."""
+    elapsed = time.perf_counter() - clean_start
+    cap = cv2.VideoCapture(output)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    print(
+        f"Cleaned {frame_count} frames with {backend} in {elapsed:.2f}s "
+        f"({frame_count / elapsed:.1f} fps)"
+    )
+
+
+@cli.command(help="Find the frame ranges where text matching a layers file is present")
+@click.argument(
+    "video", type=click.Path(exists=True, dir_okay=False, resolve_path=True)
+)
+@click.argument(
+    "layers_path",
+    metavar="LAYERS_FILE",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+)
+@click.option(
+    "--min-pixels",
+    type=click.FloatRange(0),
+    help="Frames with more masked pixels than this contain text. Default: halfway between the least and most masked frames, or no text at all if the most masked frames don't stand out from the noise between frames.",
+)
+@click.option(
+    "--min-length",
+    type=click.IntRange(1),
+    default=DEFAULT_MIN_RANGE_FRAMES,
+    help=f"Ignore ranges with fewer frames than this. Default: {DEFAULT_MIN_RANGE_FRAMES}",
+)
+@click.option(
+    "--max-gap",
+    type=click.IntRange(0),
+    default=DEFAULT_MAX_GAP_FRAMES,
+    help=f"Merge ranges separated by at most this many frames. Default: {DEFAULT_MAX_GAP_FRAMES}",
+)
+@click.option(
+    "--scale",
+    type=click.FloatRange(0, 1, min_open=True),
+    default=DEFAULT_SCAN_SCALE,
+    help=f"Resolution to scan frames at, as a fraction of the video's resolution. Default: {DEFAULT_SCAN_SCALE}",
+)
+@click.option(
+    "--processes",
+    type=click.IntRange(1),
+    help="Number of processes that scan frames in parallel. Default: one per CPU.",
+)
+@click.option(
+    "--cpus",
+    type=click.IntRange(1),
+    help="Number of CPUs to use. Each of the --processes starts an equal share of them as OpenCV threads, so that together they don't start more threads than there are CPUs. The allocation is printed before starting. Default: all CPUs.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, writable=True, resolve_path=True),
+    default=str(DEFAULT_CACHE_DIR),
+    show_default=True,
+    help="Directory to cache scans in, so that changing the other options doesn't scan the video again.",
+)
+def detect(
+    video,
+    layers_path,
+    min_pixels,
+    min_length,
+    max_gap,
+    scale,
+    processes,
+    cpus,
+    cache_dir,
+):
+    try:
+        layers = load_layers(layers_path)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="LAYERS_FILE")
+
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+
+    if cpus:
+        print(format_chunk_workers(processes, cpus))
+    timeline = get_timeline(
+        video,
+        layers,
+        scale=scale,
+        processes=processes,
+        cpus=cpus,
+        cache_dir=cache_dir,
+        progress=lambda done, total: print(f"Scanned {done}/{total} frames"),
+    )
+    if min_pixels is None:
+        min_pixels = get_default_threshold(timeline)
+    ranges = propose_ranges(
+        timeline, threshold=min_pixels, min_length=min_length, max_gap=max_gap
+    )
+    print(f"Text threshold: {min_pixels:.0f} pixels")
+    if not ranges:
+        print("No text found")
+    for start, end in ranges:
+        # --end is exclusive, so it is the frame after the range.
+        print(
+            f"Frames {start}-{end}: --start={frame_to_timecode(start, fps)} "
+            f"--end={frame_to_timecode(end + 1, fps)}"
+        )
+    return ranges
+
+
+@cli.command(help="Check that a mask covers the text on every frame")
+@click.argument(
+    "video", type=click.Path(exists=True, dir_okay=False, resolve_path=True)
+)
+@click.argument("mask", type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.argument(
+    "layers_path",
+    metavar="LAYERS_FILE",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+)
+@click.option(
+    "-s",
+    "--start",
+    help="Start timecode (HH:MM:SS[:frame]) in the input video",
+    type=TIMECODE,
+)
+@click.option(
+    "-e",
+    "--end",
+    help="End timecode (HH:MM:SS[:frame]) in the input video",
+    type=TIMECODE,
+)
+@click.option(
+    "--min-pixels",
+    type=click.IntRange(0),
+    default=0,
+    help="Only count frames with more uncovered text pixels than this as uncovered. Default: 0",
+)
+@click.option(
+    "--report",
+    "report_path",
+    type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+    help="Write a JSON report with the number of uncovered text pixels in every frame to this location",
+)
+@click.option(
+    "--heatmap",
+    "heatmap_path",
+    type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+    help="Write an image showing where text was uncovered, and how often, to this location",
+)
+@click.option(
+    "--processes",
+    type=click.IntRange(1),
+    help="Number of processes that check frames in parallel. Default: one per CPU.",
+)
+@click.option(
+    "--cpus",
+    type=click.IntRange(1),
+    help="Number of CPUs to use. Each of the --processes starts an equal share of them as OpenCV threads, so that together they don't start more threads than there are CPUs. The allocation is printed before starting. Default: all CPUs.",
+)
+def audit(
+    video,
+    mask,
+    layers_path,
+    start,
+    end,
+    min_pixels,
+    report_path,
+    heatmap_path,
+    processes,
+    cpus,
+):
+    try:
+        layers = load_layers(layers_path)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="LAYERS_FILE")
+    mask_im = cv2.imread(mask, cv2.IMREAD_GRAYSCALE)
+    _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    start_frame = timecode_to_frame(start, fps, default=0)
+    end_frame = min(timecode_to_frame(end, fps, default=frame_count), frame_count)
+
+    if cpus:
+        print(format_chunk_workers(processes, cpus))
+    result = audit_video(
+        video,
+        layers,
+        mask_im,
+        start_frame,
+        end_frame,
+        processes=processes,
+        cpus=cpus,
+        progress=lambda done, total: print(f"Checked {done}/{total} frames"),
+    )
+    report = result.get_report(min_pixels)
+    print(
+        f"{report['uncovered_frames']}/{len(result.counts)} frames have uncovered text "
+        f"(max {report['max_uncovered_pixels']} pixels, "
+        f"mean {report['mean_uncovered_pixels']:.1f} pixels)"
+    )
+    for first, last in report["uncovered_ranges"]:
+        print(f"Uncovered text in frames {first}-{last}")
+    if report_path:
+        result.save_report(report_path, min_pixels)
+    if heatmap_path:
+        result.save_heatmap(heatmap_path)
+    return result
@@ -1,10 +1,16 @@
 import cv2
+import ffmpeg
+import numpy as np
 import pytest
 from click.testing import CliRunner
 from numpy.testing import assert_array_equal
 
-from .cli import mask
+from .cli import audit, clean, detect, mask
+from .helpers import MASK_MODE_INCLUDE
 from .helpers_test import TESTDATA_PATH
+from .inpaint import DEFAULT_INPAINT_THREADS, set_inpaint_threads
+from .keyframes import Keyframe, MaskTrack
+from .layers import save_layers
 
 
 @pytest.mark.parametrize(
@@ -90,3 +96,441 @@ def test_mask(
     expected_mask = cv2.cvtColor(expected_mask, cv2.COLOR_BGR2GRAY)
 
     assert_array_equal(ret_mask, expected_mask)
+
+
+def test_clean__scroll(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    layer = {
+        "mask_mode": MASK_MODE_INCLUDE,
+        "hue_min": 0,
+        "hue_max": 179,
+        "sat_min": 0,
+        "sat_max": 255,
+        "val_min": 200,
+        "val_max": 255,
+        "grow": 1,
+        "crop_left": 0,
+        "crop_top": 500,
+        "crop_right": 1080,
+        "crop_bottom": 720,
+    }
+    save_layers(tmp_path / "layers.json", [layer])
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"--scroll={tmp_path / 'layers.json'}",
+            "--end=00:00:00:04",
+        ],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    clip_folder = tmp_path / "horses-720p"
+    frame_count = len([f for f in clip_folder.iterdir() if f.is_file()])
+    assert frame_count > 0
+    assert len(list((clip_folder / "output").iterdir())) == frame_count
+    assert "Scroll tracking:" in result.output
+
+
+def test_clean__cpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    opencv_threads = cv2.getNumThreads()
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            "--end=00:00:00:04",
+            "--cache-size=0",
+            "--threads=2",
+            "--inpaint-workers=4",
+            f"--output={tmp_path / 'out.mp4'}",
+        ],
+        standalone_mode=False,
+    )
+    cv2.setNumThreads(opencv_threads)
+    set_inpaint_threads(DEFAULT_INPAINT_THREADS)
+    assert result.exception is None, result.output
+    assert (
+        "CPU budget: 2 CPUs: ffmpeg decode 2 threads, "
+        "2 inpaint workers sharing 2 inpaint threads" in result.output
+    )
+    assert "inpaint: 2 threads" in result.output
+    assert "-threads 2" in result.output
+
+
+def test_clean__max_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            "--end=00:00:00:04",
+            "--cache-size=0",
+            "--inpaint-workers=4",
+            "--max-memory=15",
+        ],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    # 1080x720 frames take 2.2 MB, so only 6 fit.
+    assert (
+        "render with 1 frames per queue and 2 inpaint workers, shrunk to fit (13.3 MB)"
+        in result.output
+    )
+    assert "inpaint: 2 threads" in result.output
+    assert "Memory used: up to " in result.output
+
+
+def test_clean__inpaint_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    args = [
+        f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+        f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+        f"--cache-dir={tmp_path / 'cache'}",
+    ]
+    result = runner.invoke(clean, args + ["--end=00:00:00:04"], standalone_mode=False)
+    assert result.exception is None, result.output
+    assert "Inpaint cache: 0 hits, 4 misses" in result.output
+    # Widening the range only inpaints the new frames.
+    result = runner.invoke(
+        clean, args + ["--end=00:00:00:06"], input="y\n", standalone_mode=False
+    )
+    assert result.exception is None, result.output
+    assert "Inpaint cache: 4 hits, 2 misses" in result.output
+    assert len(list((tmp_path / "cache").iterdir())) == 6
+
+
+def test_clean__incremental(tmp_path, monkeypatch):
+    mask = cv2.imread(str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE)
+    partial_mask = mask.copy()
+    partial_mask[:, 700:] = 0
+    cv2.imwrite(str(tmp_path / "partial-mask.png"), partial_mask)
+    runner = CliRunner()
+    args = [
+        f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+        "--end=00:00:00:04",
+        "--cache-size=0",
+    ]
+    (tmp_path / "incremental").mkdir()
+    monkeypatch.chdir(tmp_path / "incremental")
+    result = runner.invoke(
+        clean, args + [f"{tmp_path / 'partial-mask.png'}"], standalone_mode=False
+    )
+    assert result.exception is None, result.output
+    # Fixing the mask only re-inpaints the tiles around the change, without asking to delete the
+    # clip folder.
+    result = runner.invoke(
+        clean,
+        args + [f"{TESTDATA_PATH / 'horses-720p-mask.png'}", "--incremental"],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    assert "Incremental render: re-inpainting 14 of 204 tiles" in result.output
+
+    (tmp_path / "full").mkdir()
+    monkeypatch.chdir(tmp_path / "full")
+    result = runner.invoke(
+        clean,
+        args + [f"{TESTDATA_PATH / 'horses-720p-mask.png'}"],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    incremental_frames = sorted(
+        (tmp_path / "incremental" / "horses-720p" / "output").glob("frame-*.png")
+    )
+    full_frames = sorted(
+        (tmp_path / "full" / "horses-720p" / "output").glob("frame-*.png")
+    )
+    assert [p.name for p in incremental_frames] == [p.name for p in full_frames]
+    for incremental_frame, full_frame in zip(incremental_frames, full_frames):
+        assert_array_equal(
+            cv2.imread(str(incremental_frame)), cv2.imread(str(full_frame))
+        )
+
+
+def test_clean__static_background(tmp_path, monkeypatch):
+    # A held title card: the same frame for 10 frames, stored losslessly.
+    video = tmp_path / "card.mkv"
+    ffmpeg.input(
+        str(TESTDATA_PATH / "horses-720p" / "frame-001.png"), loop=1, framerate=25
+    ).output(str(video), vcodec="ffv1", vframes=10).run(quiet=True)
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            str(video),
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            "--cache-size=0",
+        ],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    assert "Static background: reused 8 of 9 inpainted frames" in result.output
+
+
+def test_clean__mask_required(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(clean, [f"{TESTDATA_PATH / 'horses-720p.mp4'}"])
+    assert result.exit_code != 0
+    assert "MASK is required" in result.output
+
+
+def test_clean__keyframes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mask_im = np.zeros((720, 1080), np.uint8)
+    mask_im[600:700, 300:800] = 255
+    MaskTrack([Keyframe(2, mask_im), Keyframe(3)]).save(tmp_path / "track.json")
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"--keyframes={tmp_path / 'track.json'}",
+            "--start=00:00:00:01",
+            "--end=00:00:00:04",
+        ],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    clip_folder = tmp_path / "horses-720p"
+    in_files = sorted(f for f in clip_folder.iterdir() if f.is_file())
+    assert len(in_files) >= 3
+    for frame_num, in_file in enumerate(in_files, start=1):
+        in_im = cv2.imread(str(in_file))
+        out_im = cv2.imread(str(clip_folder / "output" / in_file.name))
+        # Only frame 2 has a mask.
+        assert (frame_num == 2) == (not np.array_equal(in_im, out_im))
+
+
+def test_clean__temporal(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            "--method=temporal",
+            "--window=3",
+            "--end=00:00:00:04",
+        ],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    # A single mask is masked in every frame, so the temporal method can't help.
+    assert (
+        "Warning: The temporal method only helps when the mask moves" in result.output
+    )
+    clip_folder = tmp_path / "horses-720p"
+    frame_count = len([f for f in clip_folder.iterdir() if f.is_file()])
+    assert len(list((clip_folder / "output").iterdir())) == frame_count
+
+
+def test_detect(tmp_path):
+    layer = {
+        "mask_mode": MASK_MODE_INCLUDE,
+        "hue_min": 0,
+        "hue_max": 179,
+        "sat_min": 0,
+        "sat_max": 255,
+        "val_min": 200,
+        "val_max": 255,
+        "grow": 1,
+        "crop_left": 0,
+        "crop_top": 500,
+        "crop_right": 1080,
+        "crop_bottom": 720,
+    }
+    save_layers(tmp_path / "layers.json", [layer])
+    cache_dir = tmp_path / "cache"
+    args = [
+        f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+        f"{tmp_path / 'layers.json'}",
+        f"--cache-dir={cache_dir}",
+        "--min-pixels=0",
+        "--min-length=1",
+        "--processes=1",
+    ]
+    runner = CliRunner()
+    result = runner.invoke(detect, args, standalone_mode=False)
+    assert result.exception is None, result.output
+    assert result.return_value == [(0, 24)]
+    assert "--start=00:00:00:00 --end=00:00:01:00" in result.output
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # Changing the threshold reuses the cached scan.
+    result = runner.invoke(
+        detect, args + ["--min-pixels=1000000"], standalone_mode=False
+    )
+    assert result.exception is None, result.output
+    assert result.return_value == []
+    assert "Scanned" not in result.output
+
+
+def test_audit(tmp_path):
+    layer = {
+        "mask_mode": MASK_MODE_INCLUDE,
+        "hue_min": 0,
+        "hue_max": 179,
+        "sat_min": 0,
+        "sat_max": 255,
+        "val_min": 200,
+        "val_max": 255,
+        "grow": 0,
+        "crop_left": 0,
+        "crop_top": 500,
+        "crop_right": 1080,
+        "crop_bottom": 720,
+    }
+    save_layers(tmp_path / "layers.json", [layer])
+    runner = CliRunner()
+    result = runner.invoke(
+        audit,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            f"{tmp_path / 'layers.json'}",
+            "--end=00:00:00:05",
+            f"--report={tmp_path / 'report.json'}",
+            f"--heatmap={tmp_path / 'heatmap.png'}",
+            "--processes=1",
+            "--cpus=4",
+        ],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    assert "CPU budget: 4 CPUs: 1 processes x 4 OpenCV threads" in result.output
+    assert len(result.return_value.counts) == 5
+    assert (tmp_path / "report.json").is_file()
+    assert cv2.imread(str(tmp_path / "heatmap.png")).shape == (720, 1080, 3)
+
+
+def test_clean__removelogo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    opencv_threads = cv2.getNumThreads()
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            "--backend=removelogo",
+            "--end=00:00:00:04",
+            "--cpus=8",
+            f"--output={tmp_path / 'output.mp4'}",
+        ],
+        standalone_mode=False,
+    )
+    cv2.setNumThreads(opencv_threads)
+    set_inpaint_threads(DEFAULT_INPAINT_THREADS)
+    assert result.exception is None, result.output
+    # ffmpeg decodes and encodes in the same process, so they share the CPUs.
+    assert "ffmpeg decode 2 threads" in result.output
+    assert "ffmpeg encode 2 threads" in result.output
+    cap = cv2.VideoCapture(str(tmp_path / "output.mp4"))
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == 4
+    # No frames are written out.
+    assert not (tmp_path / "horses-720p").exists()
+    assert "Cleaned 4 frames with removelogo" in result.output
+
+
+def test_clean__ffmpeg_backend_requires_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            "--backend=delogo",
+        ],
+    )
+    assert result.exit_code != 0
+    assert "--output is required" in result.output
+
+
+def test_clean__crop_pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            "--pipeline=crop",
+            "--end=00:00:00:04",
+            f"--output={tmp_path / 'output.mp4'}",
+        ],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    cap = cv2.VideoCapture(str(tmp_path / "output.mp4"))
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == 4
+    assert not (tmp_path / "horses-720p").exists()
+    assert "Cleaned 4 frames with opencv (crop pipeline)" in result.output
+
+
+def test_clean__yuv_pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            "--pipeline=yuv",
+            "--end=00:00:00:04",
+            f"--output={tmp_path / 'output.mp4'}",
+        ],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    cap = cv2.VideoCapture(str(tmp_path / "output.mp4"))
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == 4
+    assert not (tmp_path / "horses-720p").exists()
+    assert "Cleaned 4 frames with opencv (yuv pipeline)" in result.output
+
+
+def test_clean__yuv_pipeline_requires_telea(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            "--pipeline=yuv",
+            "--method=temporal",
+            f"--output={tmp_path / 'output.mp4'}",
+        ],
+    )
+    assert result.exit_code != 0
+    assert "only supports the telea method" in result.output
+
+
+def test_clean__patch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(
+        clean,
+        [
+            f"{TESTDATA_PATH / 'horses-720p.mp4'}",
+            f"{TESTDATA_PATH / 'horses-720p-mask.png'}",
+            "--end=00:00:00:04",
+            f"--patch={tmp_path / 'patch'}",
+            "--patch-format=png",
+        ],
+        standalone_mode=False,
+    )
+    assert result.exception is None, result.output
+    assert len(list((tmp_path / "patch").iterdir())) == 4
+    assert (tmp_path / "patch.json").is_file()
+    assert not (tmp_path / "horses-720p").exists()
@@ -0,0 +1,78 @@
+import os
+
+import cv2
+
+from .inpaint import set_inpaint_threads
+
+# Fraction of the CPUs that each of the ffmpeg decoder and encoder get when they run while frames are
+# being cleaned (the crop and yuv pipelines, patch export and the ffmpeg backends).
+STREAMING_FFMPEG_SHARE = 0.25
+
+
+def get_available_cpus() -> list:
+    """Return the CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class CpuBudget(object):
+    """
+    CpuBudget divides cpus CPUs (default: all of them) between everything that cleaning a video
+    runs, so that together they don't start more threads than there are CPUs: the ffmpeg decoder,
+    the inpaint workers, the threads they inpaint groups of the mask in, OpenCV's own threads, and
+    the libx264 encoder.
+
+    The inpaint workers all hand their groups to the same pool of inpaint threads, so the pool gets
+    all of the CPUs that are left for cleaning, however many workers there are. OpenCV's threads are
+    only used by each worker's own calls, so they're divided between the workers.
+
+    With the frames pipeline, ffmpeg splits the frames before cleaning starts and joins them after
+    it's done, so the decoder, cleaning and the encoder each get all of the CPUs. With streaming (the
+    crop and yuv pipelines, patch export, and the ffmpeg backends, which decode, clean and encode in
+    one ffmpeg process), ffmpeg decodes and encodes while frames are cleaned, so the decoder and
+    encoder each get STREAMING_FFMPEG_SHARE of the CPUs and cleaning the rest.
+
+    If pin is set, apply also pins this process (and so the ffmpeg processes it starts) to the first
+    cpus of the CPUs it may run on.
+    """
+
+    def __init__(
+        self, cpus: int = None, workers: int = 1, streaming: bool = False, pin=False
+    ):
+        available = get_available_cpus()
+        self.cpus = cpus or len(available)
+        if streaming:
+            ffmpeg_threads = max(int(self.cpus * STREAMING_FFMPEG_SHARE), 1)
+            clean_cpus = max(self.cpus - 2 * ffmpeg_threads, 1)
+        else:
+            ffmpeg_threads = clean_cpus = self.cpus
+        self.decode_threads = ffmpeg_threads
+        self.encode_threads = ffmpeg_threads
+        self.workers = max(min(workers, clean_cpus), 1)
+        self.inpaint_threads = clean_cpus
+        self.opencv_threads = max(clean_cpus // self.workers, 1)
+        self.pinned = None
+        if pin:
+            if not hasattr(os, "sched_setaffinity"):
+                raise ValueError("Pinning CPUs isn't supported on this platform")
+            self.pinned = available[: self.cpus]
+
+    def apply(self):
+        """Set OpenCV's and the inpaint threads, and pin the CPUs if pin was set."""
+        cv2.setNumThreads(self.opencv_threads)
+        set_inpaint_threads(self.inpaint_threads)
+        if self.pinned is not None:
+            os.sched_setaffinity(0, self.pinned)
+
+    def format_allocation(self) -> str:
+        pinned = ""
+        if self.pinned is not None:
+            pinned = f" (pinned to {','.join(str(cpu) for cpu in self.pinned)})"
+        return (
+            f"CPU budget: {self.cpus} CPUs{pinned}: "
+            f"ffmpeg decode {self.decode_threads} threads, "
+            f"{self.workers} inpaint workers sharing {self.inpaint_threads} inpaint threads, "
+            f"OpenCV {self.opencv_threads} threads, "
+            f"ffmpeg encode {self.encode_threads} threads"
+        )
@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from . import inpaint
+from .cpu_budget import CpuBudget, get_available_cpus
+from .inpaint import InpaintPlan, get_inpaint_threads, set_inpaint_threads
+from .stages import Stage, StagedPipeline
+
+
+@pytest.fixture
+def restore_threads():
+    opencv_threads = cv2.getNumThreads()
+    inpaint_threads = get_inpaint_threads()
+    affinity = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else None
+    yield
+    cv2.setNumThreads(opencv_threads)
+    set_inpaint_threads(inpaint_threads)
+    if affinity is not None:
+        os.sched_setaffinity(0, affinity)
+
+
+def test_cpu_budget():
+    budget = CpuBudget(8, workers=2)
+    assert budget.decode_threads == 8
+    assert budget.encode_threads == 8
+    assert budget.workers == 2
+    # The workers share the inpaint threads.
+    assert budget.inpaint_threads == 8
+    assert budget.opencv_threads == 4
+    assert budget.pinned is None
+
+
+def test_cpu_budget__streaming():
+    budget = CpuBudget(8, workers=2, streaming=True)
+    assert budget.decode_threads == 2
+    assert budget.encode_threads == 2
+    assert budget.workers == 2
+    assert budget.inpaint_threads == 4
+    assert budget.opencv_threads == 2
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_cpu_budget__one_cpu(streaming):
+    budget = CpuBudget(1, workers=4, streaming=streaming)
+    assert budget.decode_threads == 1
+    assert budget.encode_threads == 1
+    # There aren't enough CPUs for more workers.
+    assert budget.workers == 1
+    assert budget.inpaint_threads == 1
+
+
+def test_cpu_budget__default():
+    assert CpuBudget().cpus == len(get_available_cpus())
+
+
+def test_cpu_budget__apply(restore_threads):
+    budget = CpuBudget(3, workers=1)
+    budget.apply()
+    assert cv2.getNumThreads() == 3
+    assert get_inpaint_threads() == 3
+
+
+def test_cpu_budget__inpaint_concurrency(restore_threads, monkeypatch):
+    budget = CpuBudget(8, workers=4)
+    budget.apply()
+    running = [0]
+    most_running = [0]
+    lock = threading.Lock()
+
+    def inpaint_into(image, mask, radius, dst, pool=None):
+        with lock:
+            running[0] += 1
+            most_running[0] = max(most_running[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    monkeypatch.setattr(inpaint, "inpaint_into", inpaint_into)
+    # 8 groups of mask pixels, far enough apart to be inpainted separately.
+    mask = np.zeros((200, 800), np.uint8)
+    for i in range(8):
+        mask[90:110, i * 100 + 40 : i * 100 + 60] = 255
+    plan = InpaintPlan(mask, 3)
+    assert len(plan.get_groups()) == 8
+
+    def clean(frame):
+        return plan.inpaint_region(frame)
+
+    pipeline = StagedPipeline()
+    frames = (np.zeros((200, 800, 3), np.uint8) for _ in range(8))
+    list(pipeline.run(frames, [Stage("inpaint", clean, budget.workers)]))
+    # Every CPU left for cleaning inpaints at once, whichever workers the groups came from.
+    assert most_running[0] == budget.inpaint_threads
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "sched_setaffinity"), reason="CPU pinning is Linux only"
+)
+def test_cpu_budget__pin(restore_threads):
+    budget = CpuBudget(1, pin=True)
+    assert budget.pinned == get_available_cpus()[:1]
+    budget.apply()
+    assert sorted(os.sched_getaffinity(0)) == budget.pinned
+
+
+def test_cpu_budget__format_allocation():
+    assert CpuBudget(8, workers=2, streaming=True).format_allocation() == (
+        "CPU budget: 8 CPUs: ffmpeg decode 2 threads, "
+        "2 inpaint workers sharing 4 inpaint threads, "
+        "OpenCV 2 threads, ffmpeg encode 2 threads"
+    )
@@ -7,6 +7,8 @@ except ModuleNotFoundError as exc:
 
 import cv2
 
+from ..inpaint_cache import InpaintCache
+from ..memory_budget import MemoryBudget
 from .mask_options import MaskOptions
 from .render_options import RenderOptions
 from .video_display import VideoDisplay
@@ -16,7 +18,9 @@ class App(object):
     options_size = 300
     section_padding = {"pady": (50, 0)}
 
-    def __init__(self):
+    def __init__(self, max_memory: int = None):
+        # Memory in bytes that renders and playback may hold frames in, or None for no limit.
+        self.max_memory = max_memory
         self.video_path = None
         self.video_opened = False
         if tk is None:
@@ -65,6 +69,21 @@ class App(object):
             cap=self.cap,
             video_width=self.video_width,
             video_height=self.video_height,
+            # Shared by the preview and renders, and with the clean command.
+            inpaint_cache=InpaintCache(),
+        )
+        self.show_render_stats = tk.BooleanVar(value=False)
+        self.render_stats_frame = ttk.Frame(self.root_container)
+        self.show_render_stats_checkbox = ttk.Checkbutton(
+            self.render_stats_frame,
+            text="Show render stats",
+            variable=self.show_render_stats,
+            command=self.handle_show_render_stats_change,
+        )
+        self.export_render_stats_button = ttk.Button(
+            self.render_stats_frame,
+            text="Export render stats",
+            command=self.export_render_stats,
         )
         self.left_sidebar = ttk.Frame(self.root_container)
         self.tabs = ttk.Notebook(self.left_sidebar)
@@ -83,6 +102,11 @@ class App(object):
             self.video_display,
         )
         self.mask_options.build()
+        memory_budget = None
+        if self.max_memory:
+            memory_budget = MemoryBudget(
+                self.max_memory, self.video_width * self.video_height * 3
+            )
         self.render_options = RenderOptions(
             self.render_tab,
             self.video_path,
@@ -91,18 +115,35 @@ class App(object):
             self.zoom_factor_fit,
             self.video_display,
             self.tabs,
+            mask_options=self.mask_options,
+            memory_budget=memory_budget,
         )
         self.render_options.build()
 
         self.root_container.grid(column=0, row=0, sticky="nsew")
         self.video_container.grid(column=1, row=0, sticky="nsew", pady=20, padx=(0, 20))
         self.video_display.grid(column=0, row=0, sticky="nsew")
+        self.render_stats_frame.grid(column=1, row=1, sticky="w", padx=(0, 20))
+        self.show_render_stats_checkbox.grid(column=0, row=0)
+        self.export_render_stats_button.grid(column=1, row=0)
         self.left_sidebar.grid(column=0, row=0, sticky="nsew")
         self.tabs.grid(column=0, row=0, sticky="nsew")
 
     def mainloop(self):
         self.root.mainloop()
 
+    def handle_show_render_stats_change(self):
+        self.video_display.set_stats_visible(self.show_render_stats.get())
+
+    def export_render_stats(self):
+        out_file = filedialog.asksaveasfilename(
+            title="Save render stats as",
+            defaultextension=".json",
+        )
+        if not out_file:
+            return
+        self.video_display.profiler.export_json(out_file)
+
     def handle_tab_change(self, val=None):
         if self.tabs.tab(self.tabs.select(), option="text") == "Mask":
             self.mask_options.handle_selected()
@@ -11,6 +11,9 @@ import cv2
 import numpy as np
 
 from ..helpers import MASK_MODE_EXCLUDE, MASK_MODE_INCLUDE, combine_masks
+from ..hsv_histogram import HSV_RANGES
+from ..keyframes import Keyframe, MaskTrack
+from ..layers import LAYER_SETTINGS
 from .slider import Slider
 from .video_display import (
     DISPLAY_MODE_DRAW,
@@ -24,6 +27,9 @@ from .video_display import (
     MASK_SETTINGS,
 )
 
+# The first and last frames a layer applies to when rendering.
+LAYER_RANGE_SETTINGS = ("range_start", "range_end")
+
 
 class MaskOptions(object):
     COLORCHOOSER_FUZZ = 10
@@ -31,6 +37,10 @@ class MaskOptions(object):
     HUE_MAX = 179
     SAT_MAX = 255
     VAL_MAX = 255
+    HSV_HISTOGRAM_WIDTH = 270
+    HSV_HISTOGRAM_ROW_HEIGHT = 24
+    # Milliseconds to wait for a crop slider to stop before counting the pixels in the new crop.
+    HSV_FEEDBACK_CROP_DELAY = 100
 
     section_padding = {"pady": (20, 0)}
 
@@ -51,6 +61,9 @@ class MaskOptions(object):
         self.zoom_factor_fit = zoom_factor_fit
 
         self._input_mask = None
+        # HSV bounds and crop that the HSV feedback was last shown for.
+        self._hsv_feedback_key = None
+        self._hsv_feedback_after_id = None
         self.mask_frame_number = tk.IntVar()
         self.display_mode = tk.StringVar()
         self.zoom_factor = tk.DoubleVar()
@@ -68,6 +81,8 @@ class MaskOptions(object):
         self.crop_right = tk.IntVar()
         self.crop_bottom = tk.IntVar()
         self.grow = tk.IntVar()
+        self.range_start = tk.IntVar()
+        self.range_end = tk.IntVar()
         self.draw_mode_enable = tk.BooleanVar()
         self.draw_mode = tk.StringVar()
         self.draw_size = tk.IntVar()
@@ -163,6 +178,13 @@ class MaskOptions(object):
             text="Color chooser",
             command=self.handle_colorchooser,
         )
+        self.hsv_feedback_label = ttk.Label(self.options_container, justify=tk.LEFT)
+        self.hsv_histogram_canvas = tk.Canvas(
+            self.options_container,
+            width=self.HSV_HISTOGRAM_WIDTH,
+            height=3 * self.HSV_HISTOGRAM_ROW_HEIGHT,
+            highlightthickness=0,
+        )
         self.hue_min_slider = Slider(
             self.options_container,
             "Hue Min",
@@ -246,6 +268,24 @@ class MaskOptions(object):
             command=self.handle_options_change,
         )
 
+        self.range_label = ttk.Label(self.options_container, text="Frame range")
+        self.range_start_slider = Slider(
+            self.options_container,
+            "First frame",
+            from_=0,
+            to=self.frame_count - 1,
+            variable=self.range_start,
+            command=self.handle_options_change,
+        )
+        self.range_end_slider = Slider(
+            self.options_container,
+            "Last frame",
+            from_=0,
+            to=self.frame_count - 1,
+            variable=self.range_end,
+            command=self.handle_options_change,
+        )
+
         self.other_alteration_label = ttk.Label(
             self.options_container, text="Other alteration"
         )
@@ -359,6 +399,8 @@ class MaskOptions(object):
         self.sat_max_slider.grid(row=113, column=0)
         self.val_min_slider.grid(row=114, column=0)
         self.val_max_slider.grid(row=115, column=0)
+        self.hsv_feedback_label.grid(row=116, column=0, columnspan=3, sticky="w")
+        self.hsv_histogram_canvas.grid(row=117, column=0, columnspan=3)
 
         self.crop_label.grid(row=200, column=0, columnspan=3, **self.section_padding)
         self.crop_left_slider.grid(row=210, column=0)
@@ -366,6 +408,10 @@ class MaskOptions(object):
         self.crop_right_slider.grid(row=212, column=0)
         self.crop_bottom_slider.grid(row=213, column=0)
 
+        self.range_label.grid(row=250, column=0, columnspan=3, **self.section_padding)
+        self.range_start_slider.grid(row=251, column=0)
+        self.range_end_slider.grid(row=252, column=0)
+
         self.other_alteration_label.grid(
             row=300, column=0, columnspan=3, **self.section_padding
         )
@@ -382,6 +428,9 @@ class MaskOptions(object):
         self.draw_size_slider.grid(row=324, column=0)
         self.inpaint_radius_slider.grid(row=325, column=0)
 
+        if self.video_display is not None:
+            self.video_display.on_mask_frame_change = self.update_hsv_feedback
+
         # Change canvas size when widgets are added to the inner frame
         self.options_container.bind(
             "<Configure>",
@@ -400,17 +449,99 @@ class MaskOptions(object):
             pixel = np.array([[color]], np.uint8)
             pixel_hsv = cv2.cvtColor(pixel, cv2.COLOR_RGB2HSV)
 
-            hue_min, sat_min, val_min = cv2.subtract(pixel_hsv, self.COLORCHOOSER_FUZZ)[
-                0
-            ][0]
-            hue_max, sat_max, val_max = cv2.add(pixel_hsv, self.COLORCHOOSER_FUZZ)[0][0]
+            bounds = None
+            histogram = self.get_hsv_histogram()
+            if histogram is not None:
+                # Fit the range to how the color is actually spread out in the cropped frame.
+                bounds = histogram.suggest_bounds(
+                    pixel_hsv[0][0],
+                    crop=self.get_crop(),
+                    max_fuzz=3 * self.COLORCHOOSER_FUZZ,
+                )
+            if bounds is None:
+                bounds = (
+                    cv2.subtract(pixel_hsv, self.COLORCHOOSER_FUZZ)[0][0],
+                    cv2.add(pixel_hsv, self.COLORCHOOSER_FUZZ)[0][0],
+                )
+            (hue_min, sat_min, val_min), (hue_max, sat_max, val_max) = bounds
             self.hue_min.set(hue_min)
-            self.hue_max.set(hue_max)
+            self.hue_max.set(min(hue_max, self.HUE_MAX))
             self.sat_min.set(sat_min)
             self.sat_max.set(sat_max)
             self.val_min.set(val_min)
             self.val_max.set(val_max)
 
+    def get_hsv_histogram(self):
+        if self.video_display is None:
+            return None
+        return self.video_display.get_hsv_histogram()
+
+    def get_crop(self):
+        return (
+            self.crop_left.get(),
+            self.crop_top.get(),
+            self.crop_right.get(),
+            self.crop_bottom.get(),
+        )
+
+    def get_hsv_bounds(self):
+        return (
+            self.hue_min.get(),
+            self.hue_max.get(),
+            self.sat_min.get(),
+            self.sat_max.get(),
+            self.val_min.get(),
+            self.val_max.get(),
+        )
+
+    def update_hsv_feedback(self):
+        """
+        Show how many pixels the current HSV range selects, and histograms of the cropped frame's hue,
+        saturation and value with the selected range highlighted. These are read from the mask frame's
+        HSVHistogram, so they update instantly even on very large frames.
+        """
+        if self._hsv_feedback_after_id is not None:
+            self.parent.after_cancel(self._hsv_feedback_after_id)
+            self._hsv_feedback_after_id = None
+        bounds = self.get_hsv_bounds()
+        crop = self.get_crop()
+        self._hsv_feedback_key = (bounds, crop)
+        histogram = self.get_hsv_histogram()
+        self.hsv_histogram_canvas.delete("all")
+        if histogram is None:
+            self.hsv_feedback_label.config(text="")
+            return
+        total = histogram.width * histogram.height
+        selected = histogram.count(*bounds)
+        selected_in_crop = histogram.count(*bounds, crop=crop)
+        # Bounds inside a bin are interpolated (see HSVHistogram).
+        approx = "" if histogram.is_exact(*bounds) else "~"
+        self.hsv_feedback_label.config(
+            text=f"Selected: {approx}{selected:,} px ({selected / total:.1%})\n"
+            f"In crop: {approx}{selected_in_crop:,} px"
+        )
+
+        for axis in range(3):
+            counts = histogram.marginal(axis, *bounds, crop=crop)
+            # Square root keeps small peaks visible next to the background.
+            heights = np.sqrt(counts)
+            if heights.max() > 0:
+                heights = heights / heights.max() * (self.HSV_HISTOGRAM_ROW_HEIGHT - 2)
+            bin_width = self.HSV_HISTOGRAM_WIDTH / len(counts)
+            axis_min, axis_max = bounds[axis * 2], bounds[axis * 2 + 1]
+            bottom = (axis + 1) * self.HSV_HISTOGRAM_ROW_HEIGHT
+            for i, height in enumerate(heights):
+                value = i * HSV_RANGES[axis] // len(counts)
+                in_range = axis_min <= value <= axis_max
+                self.hsv_histogram_canvas.create_rectangle(
+                    i * bin_width,
+                    bottom - height,
+                    (i + 1) * bin_width,
+                    bottom,
+                    fill="#3b78c4" if in_range else "#b8b8b8",
+                    width=0,
+                )
+
     def handle_draw_options_change(self, e=None):
         if self.draw_mode_enable.get():
             self.draw_mode_reset_all_button.state(["!disabled"])
@@ -438,6 +569,8 @@ class MaskOptions(object):
             "val_min": 0,
             "val_max": self.VAL_MAX,
             "grow": 0,
+            "range_start": 0,
+            "range_end": self.frame_count - 1,
             "crop_left": 0,
             "crop_top": 0,
             "crop_right": self.video_width,
@@ -464,6 +597,8 @@ class MaskOptions(object):
             "val_min": self.val_min.get(),
             "val_max": self.val_max.get(),
             "grow": self.grow.get(),
+            "range_start": self.range_start.get(),
+            "range_end": self.range_end.get(),
             "crop_left": self.crop_left.get(),
             "crop_top": self.crop_top.get(),
             "crop_right": self.crop_right.get(),
@@ -490,16 +625,40 @@ class MaskOptions(object):
         # Mirror mask frame number to also be displayed.
         options["display_frame_number"] = options["mask_frame_number"]
         self.video_display.set(options)
+        # Zooming and drawing don't change the feedback. A new mask frame does, but its histogram is
+        # only ready once the video display renders it, which calls update_hsv_feedback itself.
+        bounds = self.get_hsv_bounds()
+        if (bounds, self.get_crop()) == self._hsv_feedback_key:
+            return
+        if self._hsv_feedback_key is not None and bounds == self._hsv_feedback_key[0]:
+            # Only the crop changed, which means counting the pixels in it again.
+            self.schedule_hsv_feedback()
+        else:
+            self.update_hsv_feedback()
+
+    def schedule_hsv_feedback(self):
+        if self._hsv_feedback_after_id is not None:
+            self.parent.after_cancel(self._hsv_feedback_after_id)
+        self._hsv_feedback_after_id = self.parent.after(
+            self.HSV_FEEDBACK_CROP_DELAY, self.update_hsv_feedback
+        )
 
 
 class LayerSelector(object):
+    MAX_LAYERS = 32
+    BUTTONS_PER_ROW = 8
+
     def __init__(self, parent, text, mask_options):
         self.parent = parent
         self.container = ttk.Frame(parent)
 
         self.mask_options = mask_options
 
+        # Each layer's mask is stored as a BitMask to keep memory use low with many layers.
         self.layers = [{}]
+        # Cache of BitMask prefix composites: _composites[k] is the combination of layers 0..k-1, which
+        # is the input mask for layer k. Editing layer i only invalidates the composites above it.
+        self._composites = {}
 
         self.selected_index = 0
 
@@ -542,40 +701,146 @@ class LayerSelector(object):
             button = ttk.Button(
                 self.select_button_frame,
                 text=i + 1,
+                width=3,
                 command=handler(i),
             )
             self.select_buttons.append(button)
-            button.grid(row=0, column=i + 1)
+            row, column = divmod(i, self.BUTTONS_PER_ROW)
+            button.grid(row=row, column=column + 1)
             if i == self.selected_index:
                 button["default"] = "active"
             else:
                 button["default"] = "normal"
 
-        self.add_button.grid(row=0, column=layer_count + 1)
+        row, column = divmod(layer_count, self.BUTTONS_PER_ROW)
+        self.add_button.grid(row=row, column=column + 1)
 
-        # Center select buttons horizontally
-        # First, clear weights (even if a button was deleted)
-        for i in range(1, 8):
-            self.select_button_frame.grid_columnconfigure(i, weight=0)
+        # Center select buttons horizontally. Buttons wrap onto a new row every BUTTONS_PER_ROW layers,
+        # so the weighted spacer columns sit on either side of a full row.
         self.select_button_frame.grid_columnconfigure(0, weight=1)
-        self.select_button_frame.grid_columnconfigure(layer_count + 2, weight=1)
+        self.select_button_frame.grid_columnconfigure(
+            self.BUTTONS_PER_ROW + 1, weight=1
+        )
 
         if layer_count <= 1:
             self.delete_button.state(["disabled"])
         else:
             self.delete_button.state(["!disabled"])
 
-        if layer_count >= 5:
+        if layer_count >= self.MAX_LAYERS:
             self.add_button.grid_forget()
 
     def save_layer(self, index, mask):
         options = self.mask_options.get_options()
-        self.layers[index] = {k: options[k] for k in MASK_SETTINGS}
+        previous = self.layers[index]
+        if (
+            previous.get("mask_mode") != options["mask_mode"]
+            or previous.get("mask") != mask
+        ):
+            self.invalidate_composites(index)
+        self.layers[index] = {
+            k: options[k] for k in MASK_SETTINGS | set(LAYER_RANGE_SETTINGS)
+        }
         self.layers[index]["mask"] = mask
+        # The input mask is rebuilt from the composite cache when the layer is loaded, so there's no
+        # need to hold on to a full-size copy of it here.
+        self.layers[index]["input_mask"] = None
+
+    def invalidate_composites(self, index):
+        """Drop cached composites that include layer `index`."""
+        self._composites = {k: v for k, v in self._composites.items() if k <= index}
+
+    def get_input_mask(self, index):
+        """
+        Return the combination of layers 0..index-1, reusing the highest cached prefix composite and
+        caching any composites computed along the way.
+        """
+        start = index
+        while start > 0 and start not in self._composites:
+            start -= 1
+        input_mask = self._composites.get(start)
+        for i in range(start, index):
+            layer = self.layers[i]
+            input_mask = combine_masks(layer["mask_mode"], layer["mask"], input_mask)
+            self._composites[i + 1] = input_mask
+        return input_mask
+
+    def get_layer_settings(self):
+        """
+        Return the settings (LAYER_SETTINGS) of every layer, bottom layer first, including any unsaved
+        changes to the selected layer.
+        """
+        options = self.mask_options.get_options()
+        return [
+            {
+                k: (options if i == self.selected_index else layer)[k]
+                for k in LAYER_SETTINGS
+            }
+            for i, layer in enumerate(self.layers)
+        ]
+
+    def get_current_layers(self):
+        """Return the layers, with the selected layer's settings and mask taken from the mask options."""
+        options = self.mask_options.get_options()
+        layers = list(self.layers)
+        layers[self.selected_index] = {
+            k: options[k] for k in MASK_SETTINGS | set(LAYER_RANGE_SETTINGS)
+        }
+        layers[self.selected_index]["mask"] = self.mask_options.video_display.get_mask()
+        return layers
+
+    def has_frame_ranges(self) -> bool:
+        """Return whether any layer only applies to part of the video."""
+        full_range = (0, self.mask_options.frame_count - 1)
+        return any(
+            (layer["range_start"], layer["range_end"]) != full_range
+            for layer in self.get_current_layers()
+        )
+
+    def get_mask_track(self) -> MaskTrack:
+        """
+        Return a MaskTrack with a keyframe wherever the set of layers that apply changes. Each keyframe's
+        mask combines the layers that apply in its range, with the overrides on top; ranges that use the
+        same layers share the same mask.
+        """
+        video_display = self.mask_options.video_display
+        layers = self.get_current_layers()
+        boundaries = sorted(
+            {layer["range_start"] for layer in layers}
+            | {layer["range_end"] + 1 for layer in layers}
+            | {0}
+        )
+        masks = {}
+        keyframes = []
+        previous = None
+        for start in boundaries:
+            active = tuple(
+                i
+                for i, layer in enumerate(layers)
+                if layer["range_start"] <= start <= layer["range_end"]
+            )
+            if active == previous:
+                continue
+            previous = active
+            if not active:
+                keyframes.append(Keyframe(start))
+                continue
+            if active not in masks:
+                mask = None
+                for i in active:
+                    mask = combine_masks(
+                        layers[i]["mask_mode"], layers[i]["mask"], mask
+                    )
+                mask = (mask | video_display.draw_include) & ~video_display.draw_exclude
+                masks[active] = mask.to_array()
+            keyframes.append(Keyframe(start, masks[active]))
+        return MaskTrack(keyframes)
 
     def add_layer(self):
         default_options = self.mask_options.get_default_options()
-        new_layer = {k: default_options[k] for k in MASK_SETTINGS}
+        new_layer = {
+            k: default_options[k] for k in MASK_SETTINGS | set(LAYER_RANGE_SETTINGS)
+        }
         # Keep the same frame we were already on - chances are the user wants to get a different aspect of it.
         new_layer["mask_frame_number"] = self.layers[self.selected_index][
             "mask_frame_number"
@@ -584,16 +849,11 @@ class LayerSelector(object):
 
     def load_layer(self, index):
         # Build the input mask first
-        input_mask = None
-        for layer in self.layers[0:index]:
-            input_mask = combine_masks(
-                layer["mask_mode"],
-                layer["mask"],
-                input_mask,
-            )
-        self.layers[index]["input_mask"] = input_mask
+        self.layers[index]["input_mask"] = self.get_input_mask(index)
         layer = self.layers[index]
-        self.mask_options.set_options({k: layer[k] for k in MASK_SETTINGS})
+        self.mask_options.set_options(
+            {k: layer[k] for k in MASK_SETTINGS | set(LAYER_RANGE_SETTINGS)}
+        )
         self.selected_index = index
 
     def handle_select(self, index):
@@ -615,6 +875,7 @@ class LayerSelector(object):
         self.build()
 
     def handle_delete(self):
+        self.invalidate_composites(self.selected_index)
         del self.layers[self.selected_index]
         self.load_layer(min(self.selected_index, len(self.layers) - 1))
         self.build()
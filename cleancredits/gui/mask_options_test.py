@@ -1,3 +1,5 @@
+from unittest import mock
+
 import numpy as np
 import pytest
 
@@ -8,8 +10,10 @@ except ModuleNotFoundError as exc:
     tk = None
     ttk = None
 
-from ..helpers import MASK_MODE_INCLUDE
-from .mask_options import LayerSelector, MaskOptions
+from ..bitmask import BitMask
+from ..helpers import MASK_MODE_EXCLUDE, MASK_MODE_INCLUDE
+from ..layers import LAYER_SETTINGS
+from .mask_options import LAYER_RANGE_SETTINGS, LayerSelector, MaskOptions
 from .video_display import MASK_SETTINGS, VideoDisplay
 
 
@@ -22,13 +26,50 @@ def test_mask_options_build():
     mask_options.build()
 
 
+def test_mask_options__hsv_feedback_only_on_hsv_or_crop_change():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("Tkinter not supported")
+    video_display = mock.Mock()
+    video_display.get_hsv_histogram.return_value = None
+    mask_options = MaskOptions(root, 100, 100, 100, 100, video_display)
+    mask_options.build()
+    mask_options.set_options(mask_options.get_default_options())
+    mask_options.handle_options_change()
+    video_display.get_hsv_histogram.reset_mock()
+
+    mask_options.set_options({"zoom_factor": 200, "draw_size": 5})
+    mask_options.handle_options_change()
+    video_display.get_hsv_histogram.assert_not_called()
+
+    mask_options.set_options({"hue_min": 10})
+    mask_options.handle_options_change()
+    video_display.get_hsv_histogram.assert_called_once()
+
+    # Crop changes wait for the slider to stop.
+    with mock.patch.object(root, "after", return_value="after#1") as after:
+        with mock.patch.object(root, "after_cancel") as after_cancel:
+            mask_options.set_options({"crop_left": 10})
+            mask_options.handle_options_change()
+            mask_options.set_options({"crop_left": 20})
+            mask_options.handle_options_change()
+            video_display.get_hsv_histogram.assert_called_once()
+            assert after.call_count == 2
+            after_cancel.assert_called_once_with("after#1")
+            after.call_args[0][1]()
+    assert video_display.get_hsv_histogram.call_count == 2
+
+
 def test_layer_selector__save_layer():
     try:
         root = tk.Tk()
     except tk.TclError:
         pytest.skip("Tkinter not supported")
     mask_options = MaskOptions(root, 100, 100, 100, 100, None)
-    mask = object()
+    mask = np.zeros((100, 100), np.uint8)
+    mask[10:20, 30:40] = 255
+    mask = BitMask.from_array(mask)
     options = {
         "mask_frame_number": 100,
         "mask_mode": MASK_MODE_INCLUDE,
@@ -45,11 +86,15 @@ def test_layer_selector__save_layer():
         "crop_bottom": 200,
     }
     mask_options.set_options(options)
-    options |= {"mask": mask, "input_mask": None}
     layer_selector = LayerSelector(ttk.Frame(root), "text", mask_options)
     layer_selector.save_layer(0, mask)
     assert len(layer_selector.layers) == 1
-    assert layer_selector.layers[0] == options
+    assert layer_selector.layers[0] == options | {
+        "range_start": 0,
+        "range_end": 99,
+        "mask": mask,
+        "input_mask": None,
+    }
 
 
 def test_layer_selector__add_layer():
@@ -58,7 +103,7 @@ def test_layer_selector__add_layer():
     except tk.TclError:
         pytest.skip("Tkinter not supported")
     mask_options = MaskOptions(root, 100, 100, 100, 100, None)
-    mask = object()
+    mask = BitMask.zeros(100, 100)
     mask_options.set_options(
         {
             "mask_frame_number": 100,
@@ -67,7 +112,7 @@ def test_layer_selector__add_layer():
     options = {
         k: v
         for k, v in mask_options.get_default_options().items()
-        if k in MASK_SETTINGS
+        if k in MASK_SETTINGS | set(LAYER_RANGE_SETTINGS)
     } | {"mask_frame_number": 100}
     layer_selector = LayerSelector(ttk.Frame(root), "text", mask_options)
     layer_selector.save_layer(0, mask)
@@ -82,7 +127,7 @@ def test_layer_selector__load_layer():
         root = tk.Tk()
     except tk.TclError:
         pytest.skip("Tkinter not supported")
-    mask_options = MaskOptions(root, 100, 100, 100, 100, None)
+    mask_options = MaskOptions(root, 2, 2, 100, 100, None)
     layer_selector = LayerSelector(ttk.Frame(root), "text", mask_options)
     layer_selector.layers = [
         {
@@ -99,7 +144,9 @@ def test_layer_selector__load_layer():
             "crop_top": 200,
             "crop_right": 100,
             "crop_bottom": 200,
-            "mask": np.array([[1, 0], [0, 1]]),
+            "range_start": 0,
+            "range_end": 99,
+            "mask": BitMask.from_array(np.array([[1, 0], [0, 1]])),
         },
         {
             "mask_frame_number": 100,
@@ -115,7 +162,9 @@ def test_layer_selector__load_layer():
             "crop_top": 200,
             "crop_right": 100,
             "crop_bottom": 200,
-            "mask": np.array([[0, 0], [1, 1]]),
+            "range_start": 0,
+            "range_end": 99,
+            "mask": BitMask.from_array(np.array([[0, 0], [1, 1]])),
         },
         {
             "mask_frame_number": 100,
@@ -131,20 +180,107 @@ def test_layer_selector__load_layer():
             "crop_top": 200,
             "crop_right": 100,
             "crop_bottom": 200,
-            "mask": np.array([[1, 1], [1, 1]]),
+            "range_start": 0,
+            "range_end": 99,
+            "mask": BitMask.from_array(np.array([[1, 1], [1, 1]])),
         },
     ]
     layer_selector.load_layer(2)
     assert layer_selector.selected_index == 2
     np.testing.assert_array_equal(
-        layer_selector.layers[2]["input_mask"], np.array([[1, 0], [1, 1]])
+        layer_selector.layers[2]["input_mask"].to_array(),
+        np.array([[255, 0], [255, 255]]),
     )
     expected_options = layer_selector.layers[2].copy()
     del expected_options["mask"]
     expected_input_mask = expected_options.pop("input_mask")
     options = {
-        k: v for k, v in mask_options.get_options().items() if k in MASK_SETTINGS
+        k: v
+        for k, v in mask_options.get_options().items()
+        if k in MASK_SETTINGS | set(LAYER_RANGE_SETTINGS)
     }
     input_mask = options.pop("input_mask")
     assert options == expected_options
-    np.testing.assert_array_equal(input_mask, expected_input_mask)
+    assert input_mask == expected_input_mask
+
+
+def make_layer(mask, mode=MASK_MODE_INCLUDE):
+    return {
+        "mask_frame_number": 0,
+        "mask_mode": mode,
+        "hue_min": 0,
+        "hue_max": 179,
+        "sat_min": 0,
+        "sat_max": 255,
+        "val_min": 0,
+        "val_max": 255,
+        "grow": 0,
+        "crop_left": 0,
+        "crop_top": 0,
+        "crop_right": 4,
+        "crop_bottom": 1,
+        "mask": BitMask.from_array(np.array([mask], np.uint8)),
+    }
+
+
+def test_layer_selector__get_input_mask__caches_prefix_composites():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("Tkinter not supported")
+    mask_options = MaskOptions(root, 4, 1, 100, 100, None)
+    layer_selector = LayerSelector(ttk.Frame(root), "text", mask_options)
+    layer_selector.layers = [
+        make_layer([1, 0, 0, 0]),
+        make_layer([0, 1, 0, 0]),
+        make_layer([1, 1, 0, 0], MASK_MODE_EXCLUDE),
+        make_layer([0, 0, 0, 1]),
+    ]
+    np.testing.assert_array_equal(
+        layer_selector.get_input_mask(4).to_array(), np.array([[0, 0, 0, 255]])
+    )
+    assert sorted(layer_selector._composites) == [1, 2, 3, 4]
+
+    # Changing layer 1 only invalidates composites that include it.
+    layer_selector.layers[1]["mask"] = BitMask.from_array(np.array([[0, 0, 1, 0]]))
+    layer_selector.invalidate_composites(1)
+    assert sorted(layer_selector._composites) == [1]
+    np.testing.assert_array_equal(
+        layer_selector.get_input_mask(3).to_array(), np.array([[0, 0, 255, 0]])
+    )
+    assert sorted(layer_selector._composites) == [1, 2, 3]
+    assert layer_selector.get_input_mask(0) is None
+
+
+def test_layer_selector__build__many_layers():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("Tkinter not supported")
+    mask_options = MaskOptions(root, 4, 1, 100, 100, None)
+    layer_selector = LayerSelector(ttk.Frame(root), "text", mask_options)
+    layer_selector.layers = [
+        make_layer([1, 0, 0, 0]) for _ in range(LayerSelector.MAX_LAYERS)
+    ]
+    layer_selector.build()
+    assert len(layer_selector.select_buttons) == LayerSelector.MAX_LAYERS
+    assert not layer_selector.add_button.winfo_manager()
+
+
+def test_layer_selector__get_layer_settings():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("Tkinter not supported")
+    mask_options = MaskOptions(root, 4, 1, 100, 100, None)
+    layer_selector = LayerSelector(ttk.Frame(root), "text", mask_options)
+    layer_selector.save_layer(0, BitMask.zeros(1, 4))
+    layer_selector.add_layer()
+    layer_selector.selected_index = 1
+    # The selected layer's settings come from the (possibly unsaved) mask options.
+    mask_options.set_options({"hue_min": 42})
+    layers = layer_selector.get_layer_settings()
+    assert len(layers) == 2
+    assert all(set(layer) == set(LAYER_SETTINGS) for layer in layers)
+    assert layers[0]["hue_min"] == 0
+    assert layers[1]["hue_min"] == 42
@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+
+import cv2
+
+from ..inpaint import InpaintPlan
+
+# Lowest resolution scale the player will drop to in order to keep up with the source framerate.
+MIN_SCALE = 0.25
+# How much to change the scale by each time the player adapts its resolution.
+SCALE_STEP = 0.75
+# How many played frames can wait to be shown.
+DEFAULT_PLAYBACK_QUEUE_SIZE = 4
+
+
+def inpaint_scaled(frame, mask, radius: int, scale: float):
+    """
+    Inpaint frame at a reduced resolution and scale the result back up to the original size.
+    This trades quality for speed during playback.
+    """
+    if scale >= 1:
+        return cv2.inpaint(frame, mask, radius, cv2.INPAINT_TELEA)
+    height, width = frame.shape[:2]
+    small_frame = cv2.resize(
+        frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+    )
+    small_mask = cv2.resize(
+        mask,
+        (small_frame.shape[1], small_frame.shape[0]),
+        interpolation=cv2.INTER_AREA,
+    )
+    # Any pixel that was partially covered by the mask needs to be inpainted.
+    _, small_mask = cv2.threshold(small_mask, 0, 255, cv2.THRESH_BINARY)
+    small_radius = max(1, round(radius * scale))
+    cleaned = cv2.inpaint(small_frame, small_mask, small_radius, cv2.INPAINT_TELEA)
+    cleaned = cv2.resize(cleaned, (width, height), interpolation=cv2.INTER_LINEAR)
+    # Only the masked area comes from the scaled-down inpainting; everything else is untouched.
+    cleaned[mask == 0] = frame[mask == 0]
+    return cleaned
+
+
+class Player(object):
+    """
+    Player decodes and inpaints a range of frames on a background thread so that the GUI can show
+    cleaned playback in real time. If inpainting can't keep up with the source framerate, the player
+    skips frames and lowers the resolution it inpaints at.
+
+    mask can also be a function that takes (frame_num, frame) for each frame that is played and
+    returns its mask (or an InpaintPlan, or None if nothing should be inpainted).
+    """
+
+    def __init__(
+        self,
+        video_path,
+        start_frame: int,
+        end_frame: int,
+        framerate: float,
+        mask,
+        radius: int,
+        queue_size: int = DEFAULT_PLAYBACK_QUEUE_SIZE,
+    ):
+        self.video_path = video_path
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.framerate = framerate
+        self.mask = mask
+        self.radius = radius
+
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.scale = 1.0
+        # Frames are dropped both by the player's thread and by the GUI's.
+        self.dropped_lock = threading.Lock()
+        self.dropped_frames = 0
+        self.displayed_frames = 0
+        self.start_time = None
+        self.done = False
+
+    @property
+    def finished(self) -> bool:
+        return self.done and self.frames.empty()
+
+    @property
+    def achieved_fps(self) -> float:
+        if self.start_time is None or self.displayed_frames == 0:
+            return 0.0
+        return self.displayed_frames / (time.perf_counter() - self.start_time)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def drop_frames(self, count: int):
+        with self.dropped_lock:
+            self.dropped_frames += count
+
+    def get_frame(self):
+        """
+        Return the most recent (frame_num, cleaned frame) that is ready to be displayed, or None if
+        no new frame is ready. Older frames that were never displayed count as dropped.
+        """
+        item = None
+        while True:
+            try:
+                newer = self.frames.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.drop_frames(1)
+            item = newer
+        if item is not None:
+            self.displayed_frames += 1
+        return item
+
+    def run(self):
+        cap = cv2.VideoCapture(str(self.video_path))
+        cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+        frame_interval = 1 / self.framerate
+        frame_num = self.start_frame
+        try:
+            while not self.stop_event.is_set() and frame_num <= self.end_frame:
+                # Skip ahead to the frame that should be on screen right now. grab() avoids
+                # the cost of fully decoding frames we're going to drop anyway.
+                elapsed = time.perf_counter() - self.start_time
+                due_frame = self.start_frame + int(elapsed * self.framerate)
+                while frame_num < min(due_frame, self.end_frame):
+                    cap.grab()
+                    frame_num += 1
+                    self.drop_frames(1)
+
+                ok, frame = cap.read()
+                if not ok:
+                    break
+
+                inpaint_start = time.perf_counter()
+                mask = self.mask(frame_num, frame) if callable(self.mask) else self.mask
+                if isinstance(mask, InpaintPlan):
+                    mask = mask.mask
+                if mask is None:
+                    cleaned = frame
+                else:
+                    cleaned = inpaint_scaled(frame, mask, self.radius, self.scale)
+                self.adapt_scale(time.perf_counter() - inpaint_start, frame_interval)
+
+                while not self.stop_event.is_set():
+                    try:
+                        self.frames.put((frame_num, cleaned), timeout=frame_interval)
+                        break
+                    except queue.Full:
+                        pass
+                frame_num += 1
+
+                # Don't get ahead of the source framerate.
+                due_time = self.start_time + (
+                    (frame_num - self.start_frame) * frame_interval
+                )
+                delay = due_time - time.perf_counter()
+                if delay > 0:
+                    self.stop_event.wait(delay)
+        finally:
+            cap.release()
+            self.done = True
+
+    def adapt_scale(self, inpaint_time: float, frame_interval: float):
+        if inpaint_time > frame_interval * 0.8 and self.scale > MIN_SCALE:
+            self.scale = max(MIN_SCALE, self.scale * SCALE_STEP)
+        elif inpaint_time < frame_interval * 0.4 and self.scale < 1:
+            self.scale = min(1.0, self.scale / SCALE_STEP)
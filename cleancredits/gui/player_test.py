@@ -0,0 +1,115 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from ..helpers_test import TESTDATA_PATH
+from .player import MIN_SCALE, Player, inpaint_scaled
+
+
+def load_mask():
+    mask = cv2.imread(str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE)
+    _, mask = cv2.threshold(mask, 1, 255, cv2.THRESH_BINARY)
+    return mask
+
+
+def test_inpaint_scaled__full_scale_matches_inpaint():
+    frame = cv2.imread(str(TESTDATA_PATH / "horses-720p" / "frame-001.png"))
+    mask = load_mask()
+    assert_array_equal(
+        inpaint_scaled(frame, mask, 3, 1.0),
+        cv2.inpaint(frame, mask, 3, cv2.INPAINT_TELEA),
+    )
+
+
+def test_inpaint_scaled__reduced_scale_only_changes_masked_area():
+    frame = cv2.imread(str(TESTDATA_PATH / "horses-720p" / "frame-001.png"))
+    mask = load_mask()
+    cleaned = inpaint_scaled(frame, mask, 3, 0.5)
+    assert cleaned.shape == frame.shape
+    assert_array_equal(cleaned[mask == 0], frame[mask == 0])
+
+
+def test_player__plays_whole_range():
+    player = Player(
+        TESTDATA_PATH / "horses-720p.mp4",
+        start_frame=5,
+        end_frame=14,
+        framerate=25,
+        mask=load_mask(),
+        radius=3,
+    )
+    player.start()
+    frame_nums = []
+    deadline = time.perf_counter() + 30
+    while not player.finished and time.perf_counter() < deadline:
+        item = player.get_frame()
+        if item is not None:
+            frame_num, frame = item
+            assert frame.shape == (720, 1080, 3)
+            frame_nums.append(frame_num)
+        time.sleep(0.005)
+    player.stop()
+
+    assert player.finished
+    assert frame_nums == sorted(frame_nums)
+    assert frame_nums[-1] == 14
+    # Every frame in the range is either displayed or dropped.
+    assert player.displayed_frames + player.dropped_frames == 10
+    assert player.displayed_frames == len(frame_nums)
+
+
+def test_player__stop_before_finished():
+    player = Player(
+        TESTDATA_PATH / "horses-720p.mp4",
+        start_frame=0,
+        end_frame=24,
+        framerate=1,
+        mask=load_mask(),
+        radius=3,
+    )
+    player.start()
+    player.stop()
+    assert not player.thread.is_alive()
+
+
+@pytest.mark.parametrize(
+    "scale,inpaint_time,expected_scale",
+    [
+        (1.0, 0.039, 0.75),
+        (1.0, 0.010, 1.0),
+        (MIN_SCALE, 0.039, MIN_SCALE),
+        (0.75, 0.010, 1.0),
+        (0.5, 0.020, 0.5),
+    ],
+)
+def test_player__adapt_scale(scale, inpaint_time, expected_scale):
+    player = Player("", 0, 0, 25, None, 3)
+    player.scale = scale
+    player.adapt_scale(inpaint_time, 1 / 25)
+    assert player.scale == pytest.approx(expected_scale)
+
+
+def test_player__drop_frames_from_both_threads():
+    player = Player(
+        TESTDATA_PATH / "horses-720p.mp4",
+        start_frame=0,
+        end_frame=0,
+        framerate=25,
+        mask=None,
+        radius=3,
+    )
+
+    def drop():
+        for _ in range(10000):
+            player.drop_frames(1)
+
+    threads = [threading.Thread(target=drop) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert player.dropped_frames == 40000
@@ -1,6 +1,8 @@
+import multiprocessing
 import pathlib
 import tempfile
-from os import path
+import threading
+import time
 
 try:
     import tkinter as tk
@@ -11,8 +13,38 @@ except ModuleNotFoundError as exc:
     ttk = None
 
 import cv2
+import numpy as np
 
-from ..helpers import clean_frames, get_frame, join_frames
+from ..backends import BACKEND_OPENCV, BACKENDS, FFMPEG_BACKENDS, ffmpeg_clean
+from ..buffers import BufferPool
+from ..helpers import (
+    INPAINT_METHOD_TELEA,
+    INPAINT_METHOD_TEMPORAL,
+    INPAINT_METHODS,
+    clean_frames,
+    get_frame,
+    join_frames,
+)
+from ..incremental import (
+    IncrementalRender,
+    clear_render_state,
+    evict_render_store,
+    get_render_store_dir,
+    load_render_state,
+    save_render_state,
+)
+from ..inpaint import (
+    InpaintPlan,
+    StaticBackgroundReuse,
+    as_inpaint_plan,
+    get_inpaint_scheduler,
+)
+from ..layers import save_layers
+from ..stages import DEFAULT_QUEUE_SIZE, Stage, StagedPipeline
+from ..temporal import DEFAULT_TEMPORAL_WINDOW, STATIC_MASK_WARNING, TemporalInpainter
+from ..tracking import ScrollTracker
+from ..video_scan import get_timeline, propose_ranges
+from .player import DEFAULT_PLAYBACK_QUEUE_SIZE, Player
 from .slider import Slider
 from .video_display import DISPLAY_MODE_ORIGINAL
 
@@ -29,6 +61,8 @@ class RenderOptions(object):
         zoom_factor_fit,
         video_display,
         tabs,
+        mask_options=None,
+        memory_budget=None,
     ):
         self.parent = parent
         self.root = parent.winfo_toplevel()
@@ -38,10 +72,42 @@ class RenderOptions(object):
         self.zoom_factor = zoom_factor_fit
         self.video_display = video_display
         self.tabs = tabs
+        # Only needed for the mask layer settings, which scrolling credits mode re-renders as the text moves.
+        self.mask_options = mask_options
+        # Fits the frames renders and playback hold into --max-memory, if it's set.
+        self.memory_budget = memory_budget
 
         self.start_frame = tk.IntVar(value=0)
         self.end_frame = tk.IntVar(value=self.frame_count - 1)
         self.last_frame_changed = "start"
+        self.player = None
+        self.playback_after_id = None
+        self.scroll_mode = tk.BooleanVar(value=False)
+        self.tracker = None
+        self.mask_source = None
+        self.inpaint_method = tk.StringVar(value=INPAINT_METHOD_TELEA)
+        self.temporal_inpainter = None
+        self.background_reuse = None
+        self.buffer_pool = None
+        # The thread that cleans frames with the telea method, and how many frames it has cleaned.
+        self.render_thread = None
+        self.render_progress = 0
+        self.render_result = None
+        self.staged_pipeline = None
+        # The mask and radius of the current render, and the IncrementalRender that updates the
+        # frames kept from the previous one, when the render's frames are kept in a render store.
+        self.render_mask = None
+        self.render_radius = None
+        self.incremental = None
+        self.cleaned_frames_dir = None
+        self.cleaned_frames_tmp = None
+        self.backend = tk.StringVar(value=BACKEND_OPENCV)
+        self.render_start = None
+        self.ffmpeg_thread = None
+        self.ffmpeg_result = None
+        self.detect_thread = None
+        self.detect_progress = None
+        self.detect_result = None
 
     def build(self):
         self.start_frame_slider = Slider(
@@ -69,6 +135,40 @@ class RenderOptions(object):
         self.save_mask_button = ttk.Button(
             self.button_frame, text="Export final mask", command=self.save_mask
         )
+        self.play_button = ttk.Button(
+            self.button_frame, text="Play", command=self.toggle_playback
+        )
+        self.scroll_mode_checkbox = ttk.Checkbutton(
+            self.parent,
+            text="Scrolling credits",
+            variable=self.scroll_mode,
+        )
+        self.inpaint_method_label = ttk.Label(self.parent, text="Inpaint method")
+        self.inpaint_method_combobox = ttk.Combobox(
+            self.parent,
+            textvariable=self.inpaint_method,
+            values=INPAINT_METHODS,
+            state="readonly",
+            width=10,
+        )
+        self.backend_label = ttk.Label(self.parent, text="Backend")
+        self.backend_combobox = ttk.Combobox(
+            self.parent,
+            textvariable=self.backend,
+            values=BACKENDS,
+            state="readonly",
+            width=10,
+        )
+        self.export_layers_button = ttk.Button(
+            self.button_frame, text="Export layers", command=self.save_layers
+        )
+        self.export_mask_track_button = ttk.Button(
+            self.button_frame, text="Export mask track", command=self.save_mask_track
+        )
+        self.detect_button = ttk.Button(
+            self.button_frame, text="Detect text", command=self.detect_text
+        )
+        self.playback_label = ttk.Label(self.parent, wraplength=250)
         self.progress_label = ttk.Label(self.parent, wraplength=250)
         self.progress_bar = ttk.Progressbar(
             self.parent,
@@ -78,9 +178,20 @@ class RenderOptions(object):
 
         self.start_frame_slider.grid(row=0, column=0)
         self.end_frame_slider.grid(row=1, column=0)
+        self.inpaint_method_label.grid(row=3, column=0, sticky="w")
+        self.inpaint_method_combobox.grid(row=3, column=1, columnspan=2, sticky="w")
+        self.backend_label.grid(row=4, column=0, sticky="w")
+        self.backend_combobox.grid(row=4, column=1, columnspan=2, sticky="w")
+        if self.mask_options is not None:
+            self.scroll_mode_checkbox.grid(row=2, column=0, columnspan=3, sticky="w")
         self.button_frame.grid(row=1000, column=0, columnspan=3, **self.section_padding)
         self.save_render_button.grid(row=0, column=0)
         self.save_mask_button.grid(row=0, column=1)
+        self.play_button.grid(row=0, column=2)
+        if self.mask_options is not None:
+            self.export_layers_button.grid(row=1, column=0)
+            self.export_mask_track_button.grid(row=1, column=1)
+            self.detect_button.grid(row=1, column=2)
 
     def handle_selected(self):
         if self.last_frame_changed == "start":
@@ -90,6 +201,8 @@ class RenderOptions(object):
 
     def handle_start_frame_change(self, val=None):
         self.last_frame_changed = "start"
+        if self.player is not None:
+            self.stop_playback()
         self.video_display.set(
             {
                 "display_mode": DISPLAY_MODE_ORIGINAL,
@@ -120,6 +233,44 @@ class RenderOptions(object):
             return
         cv2.imwrite(str(out_file), self.video_display.get_mask_with_overrides())
 
+    def save_layers(self):
+        out_file = filedialog.asksaveasfilename(
+            title="Save layers as",
+            defaultextension=".json",
+        )
+        if not out_file:
+            return
+        save_layers(out_file, self.mask_options.layer_selector.get_layer_settings())
+
+    def save_mask_track(self):
+        out_file = filedialog.asksaveasfilename(
+            title="Save mask track as",
+            defaultextension=".json",
+        )
+        if not out_file:
+            return
+        self.mask_options.layer_selector.get_mask_track().save(out_file)
+
+    def get_mask_source(self):
+        """
+        Return what to clean frames with: the final mask, or a function that takes (frame_num, frame)
+        and returns the mask for that frame. The mask changes over time in scrolling credits mode,
+        where a ScrollTracker moves the mask layers along with the text, and when layers only apply
+        to some frames, where it switches between combinations of layers at keyframes.
+        """
+        self.tracker = None
+        if self.mask_options is not None:
+            layer_selector = self.mask_options.layer_selector
+            if self.scroll_mode.get():
+                tracker = ScrollTracker(layer_selector.get_layer_settings())
+                self.tracker = tracker
+                return lambda frame_num, frame: tracker(frame)
+            if layer_selector.has_frame_ranges():
+                mask_track = layer_selector.get_mask_track()
+                radius = self.video_display.get_inpaint_radius()
+                return lambda frame_num, frame: mask_track.get_plan(frame_num, radius)
+        return self.video_display.get_mask_with_overrides()
+
     def save_render(self):
         self.disable_for_render()
         self.out_file = filedialog.asksaveasfilename(
@@ -129,6 +280,11 @@ class RenderOptions(object):
             self.enable_after_render()
             return
 
+        self.render_start = time.perf_counter()
+        if self.backend.get() in FFMPEG_BACKENDS:
+            self.save_render_ffmpeg()
+            return
+
         start_frame = self.start_frame.get()
         end_frame = self.end_frame.get()
         frame_count = end_frame - start_frame + 1
@@ -146,28 +302,297 @@ class RenderOptions(object):
             row=2000, column=0, columnspan=3, **self.section_padding
         )
         self.progress_bar.grid(row=2001, column=0, columnspan=3)
-        self.cleaned_frames_dir = tempfile.TemporaryDirectory()
+        self.mask_source = self.get_mask_source()
+        self.render_mask = None
+        self.incremental = None
+        self.cleaned_frames_tmp = None
+        if (
+            not callable(self.mask_source)
+            and self.inpaint_method.get() == INPAINT_METHOD_TELEA
+        ):
+            # Keep the cleaned frames, so that the next render to the same file only has to
+            # update the parts that a change to the mask affects.
+            self.render_mask = self.mask_source
+            self.prepare_render_store(start_frame, end_frame)
+        else:
+            self.cleaned_frames_tmp = tempfile.TemporaryDirectory()
+            self.cleaned_frames_dir = pathlib.Path(self.cleaned_frames_tmp.name)
+        if not callable(self.mask_source):
+            # Only work out the area to inpaint once.
+            self.mask_source = InpaintPlan(
+                self.mask_source, self.video_display.get_inpaint_radius()
+            )
+        self.temporal_inpainter = None
+        self.background_reuse = StaticBackgroundReuse()
+        self.buffer_pool = BufferPool()
+        self.staged_pipeline = None
+        # Only report on inpainting since this render started, not on earlier renders or previews.
+        get_inpaint_scheduler().reset_stats()
         self.progress_label.config(text=f"Cleaning frame {start_frame}...")
+        if self.inpaint_method.get() == INPAINT_METHOD_TELEA:
+            self.start_render_thread(start_frame, end_frame)
+            return
+        if not callable(self.mask_source):
+            print(f"Warning: {STATIC_MASK_WARNING}")
+        window = DEFAULT_TEMPORAL_WINDOW
+        if self.memory_budget is not None:
+            window = self.memory_budget.get_window(window)
+            print(self.memory_budget.format_allocation())
+        self.temporal_inpainter = TemporalInpainter(
+            self.video_display.get_inpaint_radius(), window
+        )
         # Slight delay to make sure the UI can update
         self.root.after(10, lambda: self.save_render_clean_frame(start_frame))
 
+    def prepare_render_store(self, start_frame, end_frame):
+        """
+        Use the render store for this video and output file as the cleaned frames directory, and
+        set up an incremental render if it has frames from a previous render with the same radius.
+        """
+        radius = self.video_display.get_inpaint_radius()
+        self.render_radius = radius
+        self.cleaned_frames_dir = get_render_store_dir(self.video_path, self.out_file)
+        self.cleaned_frames_dir.mkdir(parents=True, exist_ok=True)
+        previous = load_render_state(self.cleaned_frames_dir, self.video_path, radius)
+        # The frames no longer match the saved state once the render starts.
+        clear_render_state(self.cleaned_frames_dir)
+        for frame_path in self.cleaned_frames_dir.glob("frame-*.png"):
+            frame_num = int(frame_path.stem.split("-")[1])
+            if previous is None or not start_frame <= frame_num <= end_frame:
+                frame_path.unlink()
+        if previous is not None:
+            self.incremental = IncrementalRender(previous[0], self.render_mask, radius)
+            print(self.incremental.format_stats())
+
+    def save_render_ffmpeg(self):
+        """Render with one of the ffmpeg backends in a background thread."""
+        backend = self.backend.get()
+        frame_ranges = (
+            self.mask_options is not None
+            and self.mask_options.layer_selector.has_frame_ranges()
+        )
+        if (
+            self.scroll_mode.get()
+            or frame_ranges
+            or self.inpaint_method.get() != INPAINT_METHOD_TELEA
+        ):
+            self.progress_label.config(
+                text=f"The {backend} backend only supports a single mask with the {INPAINT_METHOD_TELEA} inpaint method"
+            )
+            self.progress_label.grid(
+                row=2000, column=0, columnspan=3, **self.section_padding
+            )
+            self.enable_after_render()
+            return
+
+        self.progress_label.config(text=f"Cleaning with {backend}...")
+        self.progress_label.grid(
+            row=2000, column=0, columnspan=3, **self.section_padding
+        )
+        self.ffmpeg_result = None
+        self.ffmpeg_thread = threading.Thread(
+            target=self.run_ffmpeg_render,
+            args=(
+                backend,
+                self.video_display.get_mask_with_overrides(),
+                self.start_frame.get(),
+                self.end_frame.get(),
+            ),
+            daemon=True,
+        )
+        self.ffmpeg_thread.start()
+        self.root.after(100, self.poll_ffmpeg_render)
+
+    def run_ffmpeg_render(self, backend, mask, start_frame, end_frame):
+        # Tk variables can only be read from the main thread, so the frames are passed in.
+        try:
+            ffmpeg_clean(
+                pathlib.Path(self.video_path),
+                pathlib.Path(self.out_file),
+                backend,
+                mask,
+                start=f"{start_frame / self.framerate}s",
+                # The end frame is included in the render.
+                end=f"{(end_frame + 1) / self.framerate}s",
+                overwrite_output=True,
+            )
+        except Exception as exc:
+            self.ffmpeg_result = exc
+
+    def poll_ffmpeg_render(self):
+        if self.ffmpeg_thread.is_alive():
+            self.root.after(100, self.poll_ffmpeg_render)
+            return
+        self.ffmpeg_thread = None
+        self.enable_after_render()
+        if isinstance(self.ffmpeg_result, Exception):
+            self.progress_label.config(text=f"Render failed: {self.ffmpeg_result}")
+            return
+        self.progress_label.config(text=self.format_render_done(self.backend.get()))
+
+    def format_render_done(self, backend):
+        """Return the message shown when a render is done, with how fast the backend was."""
+        elapsed = time.perf_counter() - self.render_start
+        frame_count = self.end_frame.get() - self.start_frame.get() + 1
+        message = (
+            f"Done rendering {self.out_file} with {backend} in {elapsed:.1f}s "
+            f"({frame_count / elapsed:.1f} fps)"
+        )
+        print(message)
+        return message
+
+    def start_render_thread(self, start_frame, end_frame):
+        """
+        Clean frames with the telea method in a background thread, so that the UI stays responsive.
+        poll_render moves the progress bar along and muxes the frames once they're done.
+        """
+        self.render_progress = 0
+        self.render_result = None
+        queue_size = DEFAULT_QUEUE_SIZE
+        if self.memory_budget is not None:
+            queue_size, _ = self.memory_budget.get_pipeline()
+            print(self.memory_budget.format_allocation())
+        self.staged_pipeline = StagedPipeline(queue_size)
+        self.render_thread = threading.Thread(
+            target=self.run_render, args=(start_frame, end_frame), daemon=True
+        )
+        self.render_thread.start()
+        self.root.after(100, self.poll_render)
+
+    def run_render(self, start_frame, end_frame):
+        # The video display's capture is still used for previews, so frames are read from another one,
+        # in order rather than seeking to each frame.
+        cap = cv2.VideoCapture(str(self.video_path))
+        try:
+            if not cap.isOpened():
+                raise Exception(f"Couldn't open {self.video_path}")
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            for _ in self.staged_pipeline.run(
+                range(start_frame, end_frame + 1), self.get_render_stages(cap)
+            ):
+                self.render_progress += 1
+        except Exception as exc:
+            self.render_result = exc
+        finally:
+            cap.release()
+
+    def get_render_stages(self, cap):
+        """
+        Return the Stages that read each frame from cap, clean it and write it to the cleaned frames
+        directory. Frames that the render store already has are updated by the IncrementalRender.
+        """
+        radius = self.video_display.get_inpaint_radius()
+        cache = self.video_display.inpaint_cache
+        pool = self.buffer_pool
+        shape = (
+            int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            3,
+        )
+
+        # Each item is [frame_num, frame, plan, previously cleaned frame].
+        def decode(frame_num):
+            previous_path = self.get_cleaned_frame_path(frame_num)
+            if (
+                self.incremental is not None
+                and previous_path.is_file()
+                and not self.incremental.tiles
+            ):
+                # Nothing to update, but the frame still has to be read past.
+                cap.grab()
+                return [frame_num, None, None, None]
+            buffer = pool.acquire(shape)
+            ok, frame = cap.read(buffer)
+            if not ok:
+                raise Exception(f"Invalid frame: {frame_num}")
+            if frame is not buffer:
+                pool.release(buffer)
+                pool.record_allocation(frame)
+            if self.incremental is not None and previous_path.is_file():
+                return [frame_num, frame, None, cv2.imread(str(previous_path))]
+            if callable(self.mask_source):
+                plan = as_inpaint_plan(self.mask_source(frame_num, frame), radius)
+            else:
+                plan = self.mask_source
+            return [frame_num, frame, plan, None]
+
+        def inpaint(item):
+            _, frame, plan, previous = item
+            if previous is not None:
+                item[3] = self.incremental.apply(frame, previous)
+            elif plan is not None:
+                self.background_reuse.inpaint_in_place(plan, frame, cache, pool)
+            return item
+
+        def write(item):
+            frame_num, frame, _, updated = item
+            if updated is not None:
+                print(f"Updating frame {frame_num}...")
+                cv2.imwrite(str(self.get_cleaned_frame_path(frame_num)), updated)
+            elif frame is not None:
+                self.write_cleaned_frame(frame_num, frame)
+                pool.end_frame()
+            if frame is not None:
+                pool.release(frame)
+            return frame_num
+
+        return [
+            Stage("decode", decode),
+            Stage("inpaint", inpaint),
+            Stage("write", write),
+        ]
+
+    def poll_render(self):
+        if self.render_thread.is_alive():
+            self.progress_bar.config(value=self.render_progress)
+            self.progress_label.config(
+                text=f"Cleaning frame {self.start_frame.get() + self.render_progress}..."
+            )
+            self.root.after(100, self.poll_render)
+            return
+        self.render_thread = None
+        if isinstance(self.render_result, Exception):
+            self.progress_label.config(text=f"Render failed: {self.render_result}")
+            self.progress_bar.grid_forget()
+            if self.cleaned_frames_tmp is not None:
+                self.cleaned_frames_tmp.cleanup()
+                self.cleaned_frames_tmp = None
+            self.mask_source = None
+            self.incremental = None
+            self.render_mask = None
+            self.enable_after_render()
+            return
+        self.progress_bar.config(value=self.render_progress)
+        self.progress_label.config(text=f"Muxing to {self.out_file}")
+        # Slight delay to make sure the UI can update
+        self.root.after(10, self.save_render_mux)
+
     def save_render_clean_frame(self, frame_num):
+        """Clean frame_num with the temporal method, which needs the frames around it."""
         print(f"Cleaning frame {frame_num}...")
         frame = get_frame(self.video_display.cap, frame_num)
-        mask = self.video_display.get_mask_with_overrides()
         # This is a little roundabout since ultimately inpaint_radius is set on the mask_options,
         # but we don't otherwise need access to mask_options.
         inpaint_radius = self.video_display.get_inpaint_radius()
-        cleaned = cv2.inpaint(frame, mask, inpaint_radius, cv2.INPAINT_TELEA)
-        cleaned_frame = cleaned.astype(int)
-        end_frame = self.end_frame.get()
-        filename = path.join(
-            self.cleaned_frames_dir.name,
-            f"frame-{frame_num:0{len(str(end_frame))}}.png",
-        )
-        print(f"Writing {filename}...")
-        cv2.imwrite(filename, cleaned_frame)
+        if callable(self.mask_source):
+            plan = as_inpaint_plan(self.mask_source(frame_num, frame), inpaint_radius)
+        else:
+            plan = self.mask_source
+        # Cleaned frames come out once the frames after them in the window have been read.
+        if plan is None:
+            mask = np.zeros(frame.shape[:2], np.uint8)
+        else:
+            mask = plan.mask
+        ready = self.temporal_inpainter.push(frame, mask)
+        if frame_num == self.end_frame.get():
+            ready += self.temporal_inpainter.flush()
+        start_frame = self.start_frame.get()
+        for index, cleaned in ready:
+            self.write_cleaned_frame(start_frame + index, cleaned)
+        self.save_render_next_frame(frame_num)
 
+    def save_render_next_frame(self, frame_num):
+        end_frame = self.end_frame.get()
         self.progress_step()
         if frame_num < end_frame:
             self.progress_label.config(text=f"Cleaning frame {frame_num + 1}...")
@@ -178,24 +603,193 @@ class RenderOptions(object):
             # Slight delay to make sure the UI can update
             self.root.after(10, self.save_render_mux)
 
+    def get_frame_number_width(self):
+        # The same for every render of the video, so that stored frames can be found again.
+        return len(str(int(self.frame_count)))
+
+    def get_cleaned_frame_path(self, frame_num):
+        return (
+            self.cleaned_frames_dir
+            / f"frame-{frame_num:0{self.get_frame_number_width()}}.png"
+        )
+
+    def write_cleaned_frame(self, frame_num, cleaned_frame):
+        filename = self.get_cleaned_frame_path(frame_num)
+        print(f"Writing {filename}...")
+        cv2.imwrite(str(filename), cleaned_frame)
+
     def save_render_mux(self):
         print(f"Muxing to {self.out_file}")
-        end_frame = self.end_frame.get()
         join_frames(
-            pathlib.Path(self.cleaned_frames_dir.name),
+            self.cleaned_frames_dir,
             pathlib.Path(self.out_file),
             self.framerate,
-            frame_filename=f"frame-%0{len(str(end_frame))}d.png",
+            frame_filename=f"frame-%0{self.get_frame_number_width()}d.png",
             start_frame=self.start_frame.get(),
             overwrite_output=True,
         )
-        self.cleaned_frames_dir.cleanup()
+        if self.cleaned_frames_tmp is not None:
+            self.cleaned_frames_tmp.cleanup()
+            self.cleaned_frames_tmp = None
+        else:
+            save_render_state(
+                self.cleaned_frames_dir,
+                self.video_path,
+                self.render_mask,
+                self.render_radius,
+                self.start_frame.get(),
+                self.end_frame.get(),
+            )
+            evict_render_store(keep=self.cleaned_frames_dir)
+        if self.incremental is not None:
+            print(self.incremental.format_stats())
+            self.incremental = None
+        self.render_mask = None
+        if self.tracker is not None:
+            print(self.tracker.format_stats())
+            self.tracker = None
+        if self.temporal_inpainter is None:
+            print(self.background_reuse.format_stats())
+            print(self.buffer_pool.format_stats())
+        if self.staged_pipeline is not None:
+            print(self.staged_pipeline.format_stats())
+            if self.memory_budget is not None:
+                print(
+                    self.memory_budget.format_usage(
+                        self.staged_pipeline, self.buffer_pool
+                    )
+                )
+            self.staged_pipeline = None
+        if get_inpaint_scheduler().runs:
+            print(get_inpaint_scheduler().format_stats())
+        if self.video_display.inpaint_cache is not None:
+            print(self.video_display.inpaint_cache.format_stats())
+        self.mask_source = None
+        self.temporal_inpainter = None
         self.progress_step()
-        self.progress_label.config(text=f"Done rendering {self.out_file}")
-        print(f"Done rendering {self.out_file}")
+        self.progress_label.config(text=self.format_render_done(BACKEND_OPENCV))
         self.progress_bar.grid_forget()
         self.enable_after_render()
 
+    def detect_text(self):
+        """
+        Scan every frame of the video with the current mask layers in a background thread, then set
+        the start and end frames to cover the ranges where text was found.
+        """
+        self.disable_for_render()
+        layers = self.mask_options.layer_selector.get_layer_settings()
+        self.detect_progress = (0, self.frame_count)
+        self.detect_result = None
+        self.detect_thread = threading.Thread(
+            target=self.run_detect, args=(layers,), daemon=True
+        )
+        self.progress_label.config(text="Scanning for text...")
+        self.progress_label.grid(
+            row=2000, column=0, columnspan=3, **self.section_padding
+        )
+        self.detect_thread.start()
+        self.root.after(100, self.poll_detect)
+
+    def run_detect(self, layers):
+        def progress(done, total):
+            self.detect_progress = (done, total)
+
+        try:
+            # Forking from this thread would copy Tk's and OpenCV's threads' state into the workers
+            # half-way through, so they're started from scratch instead.
+            self.detect_result = get_timeline(
+                self.video_path,
+                layers,
+                progress=progress,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        except Exception as exc:
+            self.detect_result = exc
+
+    def poll_detect(self):
+        if self.detect_thread.is_alive():
+            done, total = self.detect_progress
+            self.progress_label.config(text=f"Scanning for text: {done}/{total} frames")
+            self.root.after(100, self.poll_detect)
+            return
+        self.detect_thread = None
+        self.enable_after_render()
+        if isinstance(self.detect_result, Exception):
+            self.progress_label.config(text=f"Scan failed: {self.detect_result}")
+            return
+        ranges = propose_ranges(self.detect_result)
+        if not ranges:
+            self.progress_label.config(text="No text found")
+            return
+        self.start_frame.set(ranges[0][0])
+        self.end_frame.set(ranges[-1][1])
+        self.handle_start_frame_change()
+        found = ", ".join(f"{start}-{end}" for start, end in ranges)
+        self.progress_label.config(text=f"Text found in frames {found}")
+        self.progress_label.grid(
+            row=2000, column=0, columnspan=3, **self.section_padding
+        )
+
+    def toggle_playback(self):
+        if self.player is not None:
+            self.stop_playback()
+            return
+
+        self.disable_for_render()
+        self.play_button.state(["!disabled"])
+        self.play_button.config(text="Stop")
+        queue_size = DEFAULT_PLAYBACK_QUEUE_SIZE
+        if self.memory_budget is not None:
+            queue_size = self.memory_budget.get_playback_queue(queue_size)
+        self.player = Player(
+            self.video_path,
+            self.start_frame.get(),
+            self.end_frame.get(),
+            self.framerate,
+            self.get_mask_source(),
+            self.video_display.get_inpaint_radius(),
+            queue_size=queue_size,
+        )
+        self.playback_label.grid(
+            row=3000, column=0, columnspan=3, **self.section_padding
+        )
+        self.player.start()
+        self.poll_playback()
+
+    def poll_playback(self):
+        item = self.player.get_frame()
+        if item is not None:
+            frame_num, frame = item
+            self.video_display.show_frame(frame)
+            self.playback_label.config(
+                text=(
+                    f"Frame {frame_num}: {self.player.achieved_fps:.1f} fps, "
+                    f"{self.player.dropped_frames} dropped, "
+                    f"{self.player.scale:.0%} resolution"
+                )
+            )
+        if self.player.finished:
+            self.stop_playback()
+            return
+        # Poll twice per source frame so that a ready frame is never shown too late.
+        self.playback_after_id = self.root.after(
+            max(1, int(500 / self.framerate)), self.poll_playback
+        )
+
+    def stop_playback(self):
+        if self.playback_after_id is not None:
+            self.root.after_cancel(self.playback_after_id)
+            self.playback_after_id = None
+        self.player.stop()
+        print(
+            f"Playback stopped: {self.player.achieved_fps:.1f} fps, "
+            f"{self.player.dropped_frames} dropped frames"
+        )
+        self.player = None
+        self.play_button.config(text="Play")
+        self.enable_after_render()
+        self.video_display.refresh_display()
+
     def progress_step(self):
         self.progress_bar.step()
         print(f"Progress: {self.progress_bar['value']}/{self.progress_bar['maximum']}")
@@ -206,6 +800,13 @@ class RenderOptions(object):
         self.start_frame_slider.state(["disabled"])
         self.end_frame_slider.state(["disabled"])
         self.save_mask_button.state(["disabled"])
+        self.play_button.state(["disabled"])
+        self.scroll_mode_checkbox.state(["disabled"])
+        self.export_layers_button.state(["disabled"])
+        self.export_mask_track_button.state(["disabled"])
+        self.detect_button.state(["disabled"])
+        self.inpaint_method_combobox.state(["disabled"])
+        self.backend_combobox.state(["disabled"])
 
     def enable_after_render(self):
         self.tabs.tab(0, state="normal")
@@ -213,3 +814,10 @@ class RenderOptions(object):
         self.start_frame_slider.state(["!disabled"])
         self.end_frame_slider.state(["!disabled"])
         self.save_mask_button.state(["!disabled"])
+        self.play_button.state(["!disabled"])
+        self.scroll_mode_checkbox.state(["!disabled"])
+        self.export_layers_button.state(["!disabled"])
+        self.export_mask_track_button.state(["!disabled"])
+        self.detect_button.state(["!disabled"])
+        self.inpaint_method_combobox.state(["!disabled", "readonly"])
+        self.backend_combobox.state(["!disabled", "readonly"])
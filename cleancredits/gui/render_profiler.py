@@ -0,0 +1,106 @@
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+STAGE_DECODE = "decode"
+STAGE_MASK = "mask"
+STAGE_OVERRIDES = "overrides"
+STAGE_INPAINT = "inpaint"
+STAGE_DISPLAY = "display"
+STAGE_BLIT = "blit"
+
+RENDER_STAGES = (
+    STAGE_DECODE,
+    STAGE_MASK,
+    STAGE_OVERRIDES,
+    STAGE_INPAINT,
+    STAGE_DISPLAY,
+    STAGE_BLIT,
+)
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+
+class RenderProfiler(object):
+    """
+    RenderProfiler records the wall time of each VideoDisplay.render stage, along with how often
+    each stage ran or was skipped because its settings hadn't changed. A render cycle runs the
+    stages over several render calls, so skips are only counted once a cycle ends (end_cycle), for
+    the stages that didn't run in it. Only the most recent `window` timings are kept for each stage,
+    so percentiles reflect recent behavior.
+    """
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.timings = {stage: deque(maxlen=self.window) for stage in RENDER_STAGES}
+        self.run_counts = {stage: 0 for stage in RENDER_STAGES}
+        self.skip_counts = {stage: 0 for stage in RENDER_STAGES}
+        # Stages that ran since the current render cycle started.
+        self.cycle_stages = set()
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage].append(time.perf_counter() - start)
+            self.run_counts[stage] += 1
+            self.cycle_stages.add(stage)
+
+    def skip(self, stage: str):
+        self.skip_counts[stage] += 1
+
+    def end_cycle(self):
+        """Count a skip for each stage that didn't run in the render cycle that just ended."""
+        for stage in RENDER_STAGES:
+            if stage not in self.cycle_stages:
+                self.skip(stage)
+        self.cycle_stages = set()
+
+    def percentiles(self, stage: str, percentiles=DEFAULT_PERCENTILES) -> dict:
+        """Return the rolling percentiles for a stage in milliseconds."""
+        timings = self.timings[stage]
+        if not timings:
+            return {p: None for p in percentiles}
+        values = np.percentile(np.array(timings) * 1000, percentiles)
+        return {p: float(v) for p, v in zip(percentiles, values)}
+
+    def summary(self, percentiles=DEFAULT_PERCENTILES) -> dict:
+        stages = {}
+        for stage in RENDER_STAGES:
+            timings = self.timings[stage]
+            stages[stage] = {
+                "runs": self.run_counts[stage],
+                "skips": self.skip_counts[stage],
+                "mean_ms": float(np.mean(timings) * 1000) if timings else None,
+                "percentiles_ms": {
+                    f"p{p}": v for p, v in self.percentiles(stage, percentiles).items()
+                },
+                "samples_ms": [t * 1000 for t in timings],
+            }
+        return {"window": self.window, "stages": stages}
+
+    def format_status(self) -> str:
+        lines = []
+        for stage in RENDER_STAGES:
+            p50, p90, p99 = self.percentiles(stage).values()
+            if p50 is None:
+                timing = "no samples"
+            else:
+                timing = f"p50 {p50:6.1f}ms  p90 {p90:6.1f}ms  p99 {p99:6.1f}ms"
+            lines.append(
+                f"{stage:<9} {timing}  "
+                f"({self.run_counts[stage]} run / {self.skip_counts[stage]} skipped)"
+            )
+        return "\n".join(lines)
+
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
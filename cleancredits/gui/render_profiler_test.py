@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from .render_profiler import (
+    RENDER_STAGES,
+    STAGE_BLIT,
+    STAGE_DECODE,
+    STAGE_INPAINT,
+    STAGE_MASK,
+    RenderProfiler,
+)
+
+
+def test_render_profiler__time_and_skip():
+    profiler = RenderProfiler()
+    with profiler.time(STAGE_MASK):
+        pass
+    with profiler.time(STAGE_MASK):
+        pass
+    profiler.skip(STAGE_MASK)
+    profiler.skip(STAGE_INPAINT)
+
+    assert profiler.run_counts[STAGE_MASK] == 2
+    assert profiler.skip_counts[STAGE_MASK] == 1
+    assert profiler.run_counts[STAGE_INPAINT] == 0
+    assert profiler.skip_counts[STAGE_INPAINT] == 1
+    assert len(profiler.timings[STAGE_MASK]) == 2
+
+
+def test_render_profiler__end_cycle():
+    profiler = RenderProfiler()
+    # A cycle where the frame changed runs over several render calls.
+    for stage in (STAGE_DECODE, STAGE_MASK, STAGE_BLIT):
+        with profiler.time(stage):
+            pass
+    profiler.end_cycle()
+    # A cycle where only the zoom changed.
+    with profiler.time(STAGE_BLIT):
+        pass
+    profiler.end_cycle()
+
+    assert profiler.run_counts[STAGE_DECODE] == 1
+    assert profiler.skip_counts[STAGE_DECODE] == 1
+    assert profiler.skip_counts[STAGE_MASK] == 1
+    assert profiler.run_counts[STAGE_BLIT] == 2
+    assert profiler.skip_counts[STAGE_BLIT] == 0
+    assert profiler.skip_counts[STAGE_INPAINT] == 2
+
+
+def test_render_profiler__time_records_on_exception():
+    profiler = RenderProfiler()
+    with pytest.raises(ValueError):
+        with profiler.time(STAGE_MASK):
+            raise ValueError()
+    assert profiler.run_counts[STAGE_MASK] == 1
+
+
+def test_render_profiler__rolling_window():
+    profiler = RenderProfiler(window=3)
+    for _ in range(10):
+        with profiler.time(STAGE_MASK):
+            pass
+    assert profiler.run_counts[STAGE_MASK] == 10
+    assert len(profiler.timings[STAGE_MASK]) == 3
+
+
+def test_render_profiler__percentiles():
+    profiler = RenderProfiler()
+    profiler.timings[STAGE_MASK].extend([0.001 * i for i in range(1, 101)])
+    percentiles = profiler.percentiles(STAGE_MASK, (50, 90))
+    assert percentiles[50] == pytest.approx(50.5)
+    assert percentiles[90] == pytest.approx(90.1)
+    assert profiler.percentiles(STAGE_INPAINT, (50,)) == {50: None}
+
+
+def test_render_profiler__format_status():
+    profiler = RenderProfiler()
+    with profiler.time(STAGE_MASK):
+        pass
+    status = profiler.format_status()
+    assert len(status.splitlines()) == len(RENDER_STAGES)
+    assert "(1 run / 0 skipped)" in status
+    assert "no samples" in status
+
+
+def test_render_profiler__export_json(tmp_path):
+    profiler = RenderProfiler()
+    with profiler.time(STAGE_MASK):
+        pass
+    profiler.skip(STAGE_INPAINT)
+    out_file = tmp_path / "stats.json"
+    profiler.export_json(out_file)
+    with open(out_file) as f:
+        data = json.load(f)
+    assert set(data["stages"]) == set(RENDER_STAGES)
+    assert data["stages"][STAGE_MASK]["runs"] == 1
+    assert len(data["stages"][STAGE_MASK]["samples_ms"]) == 1
+    assert data["stages"][STAGE_INPAINT]["skips"] == 1
+    assert data["stages"][STAGE_INPAINT]["percentiles_ms"]["p50"] is None
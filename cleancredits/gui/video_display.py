@@ -9,7 +9,19 @@ import cv2
 import numpy as np
 from PIL import Image, ImageTk
 
+from ..bitmask import BitMask
 from ..helpers import combine_masks, get_frame, render_mask
+from ..hsv_histogram import HSVHistogram
+from ..inpaint import InpaintPlan
+from .render_profiler import (
+    STAGE_BLIT,
+    STAGE_DECODE,
+    STAGE_DISPLAY,
+    STAGE_INPAINT,
+    STAGE_MASK,
+    STAGE_OVERRIDES,
+    RenderProfiler,
+)
 
 DISPLAY_MODE_MASK = "Areas to inpaint"
 DISPLAY_MODE_DRAW = "Overrides"
@@ -139,7 +151,7 @@ def get_unzoomed_coords(
 
 
 class VideoDisplay(object):
-    def __init__(self, parent, cap, video_width, video_height):
+    def __init__(self, parent, cap, video_width, video_height, inpaint_cache=None):
         self.parent = parent
         self.root = parent.winfo_toplevel()
         self.canvas = tk.Canvas(parent, width=parent["width"], height=parent["height"])
@@ -149,14 +161,21 @@ class VideoDisplay(object):
         self.canvas.bind("<B1-Motion>", self.handle_canvas_drag)
         self.canvas.bind("<ButtonRelease-1>", self.handle_canvas_drag)
         self.canvas_img = self.canvas.create_image(0, 0, anchor=tk.NW)
+        self.stats_label = ttk.Label(parent, font="TkFixedFont", justify=tk.LEFT)
+        self.stats_visible = False
         self.draw_cursor = None
         self.draw_prev = None
 
         self.cap = cap
         self.video_width = video_width
         self.video_height = video_height
+        # InpaintCache that previews (and renders) reuse inpainted frames from, if set.
+        self.inpaint_cache = inpaint_cache
 
-        self.draw_mask = np.full((video_height, video_width), 127, np.uint8)
+        # Overrides are stored as two BitMasks of the pixels that should always / never be inpainted.
+        # A pixel is in at most one of them.
+        self.draw_include = BitMask.zeros(video_height, video_width)
+        self.draw_exclude = BitMask.zeros(video_height, video_width)
         self.draw_mask_changed = True
 
         self.new_settings = {}
@@ -165,7 +184,12 @@ class VideoDisplay(object):
         self._display_frame = None
         self._mask_frame = None
         self._mask = None
+        self._mask_with_overrides = None
+        self._mask_with_overrides_array = None
         self._display = None
+        self._hsv_histogram = None
+        # Called after the mask frame changes, so that anything showing stats about it can update.
+        self.on_mask_frame_change = None
 
         self.display_frame_changed = True
         self.mask_changed = True
@@ -174,25 +198,46 @@ class VideoDisplay(object):
         self.display_changed = True
 
         self.last_after_id = None
+        self.profiler = RenderProfiler()
 
     def grid(self, *args, **kwargs):
         self.canvas.grid(*args, **kwargs)
 
+    def set_stats_visible(self, visible: bool):
+        self.stats_visible = visible
+        if visible:
+            self.stats_label.grid(row=1, column=0, sticky="w")
+            self.update_stats()
+        else:
+            self.stats_label.grid_remove()
+
+    def update_stats(self):
+        if self.stats_visible:
+            self.stats_label.config(text=self.profiler.format_status())
+
     def clear_overrides(self):
-        self.draw_mask = np.full((self.video_height, self.video_width), 127, np.uint8)
+        self.draw_include = BitMask.zeros(self.video_height, self.video_width)
+        self.draw_exclude = BitMask.zeros(self.video_height, self.video_width)
         self.draw_mask_changed = True
         self.schedule_render()
 
+    def show_frame(self, frame):
+        """
+        Display a BGR frame directly, bypassing the mask and inpaint steps. This is used for playback,
+        where frames are cleaned in the background.
+        """
+        self._display = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+        self.display_changed = True
+        self.schedule_render()
+
+    def refresh_display(self):
+        """Rebuild the display from the current settings, for example after playback."""
+        self.inpaint_changed = True
+        self.schedule_render()
+
     def settings_changed(self, keys):
-        if "input_mask" in keys:
-            if not np.array_equal(
-                self.new_settings["input_mask"], self.settings.get("input_mask")
-            ):
-                return True
-        return any(
-            self.new_settings[k] != self.settings.get(k)
-            for k in keys - set(("input_mask",))
-        )
+        # input_mask is a BitMask (or None), which supports == directly.
+        return any(self.new_settings[k] != self.settings.get(k) for k in keys)
 
     def mark_settings_changed(self, keys):
         self.settings |= {k: self.new_settings[k] for k in keys}
@@ -205,10 +250,30 @@ class VideoDisplay(object):
             self.schedule_render()
 
     def get_mask(self):
+        """Return the current layer's mask as a BitMask."""
         return self._mask
 
     def get_mask_with_overrides(self):
-        return self._mask_with_overrides
+        """Return the final mask as a uint8 array, ready to be passed to cv2."""
+        return self._mask_with_overrides_array
+
+    def get_hsv_histogram(self):
+        """Return an HSVHistogram of the current mask frame, or None if it hasn't been loaded yet."""
+        if self._mask_frame is None:
+            return None
+        if self._hsv_histogram is None:
+            self._hsv_histogram = HSVHistogram(self._mask_frame)
+        return self._hsv_histogram
+
+    def get_draw_mask(self):
+        """
+        Return the overrides as a single uint8 image: 255 where pixels should always be inpainted,
+        0 where they should never be inpainted, and 127 elsewhere.
+        """
+        draw_mask = np.full((self.video_height, self.video_width), 127, np.uint8)
+        draw_mask[self.draw_include.to_array() > 0] = 255
+        draw_mask[self.draw_exclude.to_array() > 0] = 0
+        return draw_mask
 
     def get_inpaint_radius(self):
         """
@@ -271,19 +336,29 @@ class VideoDisplay(object):
         )
         draw_prev = self.draw_prev or pt
 
-        if self.settings["draw_mode"] == DRAW_MODE_EXCLUDE:
-            color = 0
-        elif self.settings["draw_mode"] == DRAW_MODE_RESET:
-            color = 127
-        else:
-            # DRAW_MODE_INCLUDE
-            color = 255
-
-        cv2.line(self.draw_mask, draw_prev, pt, color, draw_size)
+        self.draw_line(draw_prev, pt, draw_size, self.settings["draw_mode"])
         self.draw_prev = pt
         self.draw_mask_changed = True
         self.schedule_render()
 
+    def draw_line(self, start, end, size, draw_mode):
+        # Only rasterize the line within its bounding box, then apply it to the override masks.
+        padding = size // 2 + 2
+        x0 = min(start[0], end[0]) - padding
+        y0 = min(start[1], end[1]) - padding
+        x1 = max(start[0], end[0]) + padding
+        y1 = max(start[1], end[1]) + padding
+        stroke = np.zeros((y1 - y0, x1 - x0), np.uint8)
+        cv2.line(
+            stroke,
+            (start[0] - x0, start[1] - y0),
+            (end[0] - x0, end[1] - y0),
+            255,
+            size,
+        )
+        self.draw_include.paint(stroke, x0, y0, draw_mode == DRAW_MODE_INCLUDE)
+        self.draw_exclude.paint(stroke, x0, y0, draw_mode == DRAW_MODE_EXCLUDE)
+
     def schedule_render(self):
         if self.last_after_id is not None:
             self.root.after_cancel(self.last_after_id)
@@ -294,64 +369,71 @@ class VideoDisplay(object):
         """
         Render any changes to the display. We check what was last rendered against current settings to avoid
         rendering more than once per loop. We also short circuit after each potential step of the render to limit
-        how much of the work happens in each loop.
+        how much of the work happens in each loop. Each step is timed by self.profiler, which also counts the
+        steps that were skipped because nothing they depend on changed, once per render cycle.
         """
         if self.settings_changed(FRAME_SETTINGS):
-            self._display_frame = get_frame(
-                self.cap, self.new_settings["display_frame_number"]
-            )
+            with self.profiler.time(STAGE_DECODE):
+                self._display_frame = get_frame(
+                    self.cap, self.new_settings["display_frame_number"]
+                )
             self.mark_settings_changed(FRAME_SETTINGS)
             self.display_frame_changed = True
             self.root.after(1, self.render)
             return
 
         if self.settings_changed(MASK_SETTINGS):
-            if self.settings_changed({"mask_frame_number"}):
-                if (
-                    self.new_settings["mask_frame_number"]
-                    == self.new_settings["display_frame_number"]
-                ):
-                    self._mask_frame = self._display_frame
-                else:
-                    # This generally shouldn't happen, since mask options will always set the display frame number
-                    # and mask frame number to the same value, but just in case!
-                    self._mask_frame = get_frame(
-                        self.cap, self.new_settings["mask_frame_number"]
+            with self.profiler.time(STAGE_MASK):
+                mask_frame_changed = self.settings_changed({"mask_frame_number"})
+                if mask_frame_changed:
+                    if (
+                        self.new_settings["mask_frame_number"]
+                        == self.new_settings["display_frame_number"]
+                    ):
+                        self._mask_frame = self._display_frame
+                    else:
+                        # This generally shouldn't happen, since mask options will always set the display frame number
+                        # and mask frame number to the same value, but just in case!
+                        self._mask_frame = get_frame(
+                            self.cap, self.new_settings["mask_frame_number"]
+                        )
+                    self._hsv_histogram = None
+                self._mask = BitMask.from_array(
+                    render_mask(
+                        image=self._mask_frame,
+                        hue_min=self.new_settings["hue_min"],
+                        hue_max=self.new_settings["hue_max"],
+                        sat_min=self.new_settings["sat_min"],
+                        sat_max=self.new_settings["sat_max"],
+                        val_min=self.new_settings["val_min"],
+                        val_max=self.new_settings["val_max"],
+                        grow=self.new_settings["grow"],
+                        crop_left=self.new_settings["crop_left"],
+                        crop_top=self.new_settings["crop_top"],
+                        crop_right=self.new_settings["crop_right"],
+                        crop_bottom=self.new_settings["crop_bottom"],
                     )
-            self._mask = render_mask(
-                image=self._mask_frame,
-                hue_min=self.new_settings["hue_min"],
-                hue_max=self.new_settings["hue_max"],
-                sat_min=self.new_settings["sat_min"],
-                sat_max=self.new_settings["sat_max"],
-                val_min=self.new_settings["val_min"],
-                val_max=self.new_settings["val_max"],
-                grow=self.new_settings["grow"],
-                crop_left=self.new_settings["crop_left"],
-                crop_top=self.new_settings["crop_top"],
-                crop_right=self.new_settings["crop_right"],
-                crop_bottom=self.new_settings["crop_bottom"],
-            )
-            self._mask_with_input = combine_masks(
-                mode=self.new_settings["mask_mode"],
-                top=self._mask,
-                bottom=self.new_settings["input_mask"],
-            )
+                )
+                self._mask_with_input = combine_masks(
+                    mode=self.new_settings["mask_mode"],
+                    top=self._mask,
+                    bottom=self.new_settings["input_mask"],
+                )
             self.mark_settings_changed(MASK_SETTINGS)
             self.mask_changed = True
+            if mask_frame_changed and self.on_mask_frame_change is not None:
+                self.on_mask_frame_change()
             self.root.after(1, self.render)
             return
 
         if self.draw_mask_changed or self.mask_changed:
-            # Add include/exclude overrides to the mask
-            _, include_mask = cv2.threshold(self.draw_mask, 128, 255, cv2.THRESH_BINARY)
-            self._mask_with_overrides = cv2.bitwise_or(
-                self._mask_with_input, include_mask
-            )
-            _, exclude_mask = cv2.threshold(self.draw_mask, 126, 255, cv2.THRESH_BINARY)
-            self._mask_with_overrides = cv2.bitwise_and(
-                self._mask_with_overrides, exclude_mask
-            )
+            with self.profiler.time(STAGE_OVERRIDES):
+                # Add include/exclude overrides to the mask
+                self._mask_with_overrides = (
+                    self._mask_with_input | self.draw_include
+                ) & ~self.draw_exclude
+                # Keep an unpacked copy around, since inpainting & display need it as a uint8 array.
+                self._mask_with_overrides_array = self._mask_with_overrides.to_array()
             self.mask_changed = False
             self.overrides_changed = True
             self.draw_mask_changed = False
@@ -359,47 +441,54 @@ class VideoDisplay(object):
             return
 
         # Inpainting is expensive so we skip it unless preview mode is active
-        if self.new_settings["display_mode"] == DISPLAY_MODE_PREVIEW:
-            if (
-                self.settings_changed(INPAINT_SETTINGS)
-                or self.overrides_changed
-                or self.display_frame_changed
-                # Always redo inpainting layer if we're changing to Preview mode.
-                or self.settings_changed({"display_mode"})
-            ):
-                frame_rgb = cv2.cvtColor(self._display_frame, cv2.COLOR_BGR2RGB)
-                self._inpainted = cv2.inpaint(
-                    frame_rgb,
-                    self._mask_with_overrides,
-                    self.new_settings["inpaint_radius"],
-                    cv2.INPAINT_TELEA,
+        if self.new_settings["display_mode"] == DISPLAY_MODE_PREVIEW and (
+            self.settings_changed(INPAINT_SETTINGS)
+            or self.overrides_changed
+            or self.display_frame_changed
+            # Always redo inpainting layer if we're changing to Preview mode.
+            or self.settings_changed({"display_mode"})
+        ):
+            with self.profiler.time(STAGE_INPAINT):
+                # Inpaint the BGR frame the same way a render does, so that they share cached
+                # results.
+                plan = InpaintPlan(
+                    self._mask_with_overrides_array, self.new_settings["inpaint_radius"]
+                )
+                self._inpainted = cv2.cvtColor(
+                    plan.inpaint(self._display_frame, self.inpaint_cache),
+                    cv2.COLOR_BGR2RGB,
                 )
-                self.mark_settings_changed(INPAINT_SETTINGS)
-                self.mark_settings_changed({"display_mode"})
-                self.overrides_changed = False
-                self.display_frame_changed = False
-                self.inpaint_changed = True
-                self.root.after(1, self.render)
-                return
-        elif self.overrides_changed or self.display_frame_changed:
+            self.mark_settings_changed(INPAINT_SETTINGS)
+            self.mark_settings_changed({"display_mode"})
+            self.overrides_changed = False
+            self.display_frame_changed = False
+            self.inpaint_changed = True
+            self.root.after(1, self.render)
+            return
+        if self.new_settings["display_mode"] != DISPLAY_MODE_PREVIEW and (
+            self.overrides_changed or self.display_frame_changed
+        ):
             self.overrides_changed = False
             self.display_frame_changed = False
             self.inpaint_changed = True
 
         if self.settings_changed(DISPLAY_SETTINGS) or self.inpaint_changed:
-            if self.new_settings["display_mode"] == DISPLAY_MODE_ORIGINAL:
-                self._display = cv2.cvtColor(self._display_frame, cv2.COLOR_BGR2RGBA)
-            elif self.new_settings["display_mode"] == DISPLAY_MODE_MASK:
-                self._display = cv2.bitwise_and(
-                    self._display_frame,
-                    self._display_frame,
-                    mask=self._mask_with_overrides,
-                )
-                self._display = cv2.cvtColor(self._display, cv2.COLOR_BGR2RGBA)
-            elif self.new_settings["display_mode"] == DISPLAY_MODE_DRAW:
-                self._display = self.draw_mask
-            else:  # DISPLAY_MODE_PREVIEW
-                self._display = cv2.cvtColor(self._inpainted, cv2.COLOR_RGB2RGBA)
+            with self.profiler.time(STAGE_DISPLAY):
+                if self.new_settings["display_mode"] == DISPLAY_MODE_ORIGINAL:
+                    self._display = cv2.cvtColor(
+                        self._display_frame, cv2.COLOR_BGR2RGBA
+                    )
+                elif self.new_settings["display_mode"] == DISPLAY_MODE_MASK:
+                    self._display = cv2.bitwise_and(
+                        self._display_frame,
+                        self._display_frame,
+                        mask=self._mask_with_overrides_array,
+                    )
+                    self._display = cv2.cvtColor(self._display, cv2.COLOR_BGR2RGBA)
+                elif self.new_settings["display_mode"] == DISPLAY_MODE_DRAW:
+                    self._display = self.get_draw_mask()
+                else:  # DISPLAY_MODE_PREVIEW
+                    self._display = cv2.cvtColor(self._inpainted, cv2.COLOR_RGB2RGBA)
             self.mark_settings_changed(DISPLAY_SETTINGS)
             self.inpaint_changed = False
             self.display_changed = True
@@ -407,31 +496,35 @@ class VideoDisplay(object):
             return
 
         if self.settings_changed(ZOOM_SETTINGS) or self.display_changed:
-            # Crop to the specified center, then zoom
-            zoom_factor = self.new_settings["zoom_factor"] / 100
-            crop_x, crop_y, zoom_width, zoom_height = get_zoom_crop(
-                zoom_factor,
-                self.new_settings["zoom_center_x"],
-                self.new_settings["zoom_center_y"],
-                self.video_width,
-                self.video_height,
-                self.canvas.winfo_width(),
-                self.canvas.winfo_height(),
-            )
-            img = self._display[
-                crop_y : crop_y + zoom_height, crop_x : crop_x + zoom_width
-            ]
-            img = cv2.resize(
-                img,
-                None,
-                fx=zoom_factor,
-                fy=zoom_factor,
-                interpolation=cv2.INTER_NEAREST,
-            )
+            with self.profiler.time(STAGE_BLIT):
+                # Crop to the specified center, then zoom
+                zoom_factor = self.new_settings["zoom_factor"] / 100
+                crop_x, crop_y, zoom_width, zoom_height = get_zoom_crop(
+                    zoom_factor,
+                    self.new_settings["zoom_center_x"],
+                    self.new_settings["zoom_center_y"],
+                    self.video_width,
+                    self.video_height,
+                    self.canvas.winfo_width(),
+                    self.canvas.winfo_height(),
+                )
+                img = self._display[
+                    crop_y : crop_y + zoom_height, crop_x : crop_x + zoom_width
+                ]
+                img = cv2.resize(
+                    img,
+                    None,
+                    fx=zoom_factor,
+                    fy=zoom_factor,
+                    interpolation=cv2.INTER_NEAREST,
+                )
 
-            # Store imgtk on self to prevent garbage collection
-            self.imgtk = ImageTk.PhotoImage(image=Image.fromarray(img))
+                # Store imgtk on self to prevent garbage collection
+                self.imgtk = ImageTk.PhotoImage(image=Image.fromarray(img))
 
-            self.canvas.itemconfig(self.canvas_img, image=self.imgtk)
+                self.canvas.itemconfig(self.canvas_img, image=self.imgtk)
             self.mark_settings_changed(ZOOM_SETTINGS)
             self.display_changed = False
+        # The cycle is done once every stage is up to date.
+        self.profiler.end_cycle()
+        self.update_stats()
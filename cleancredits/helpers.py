@@ -7,15 +7,40 @@ import cv2
 import ffmpeg
 import numpy as np
 
+from .inpaint import InpaintPlan, as_inpaint_plan
+from .stages import Stage, StagedPipeline
+from .temporal import DEFAULT_TEMPORAL_WINDOW, TemporalInpainter
+
 MASK_MODE_INCLUDE = "Always inpaint"
 MASK_MODE_EXCLUDE = "Never inpaint"
 
 SPLIT_FRAME_FILENAME = "frame-%03d.png"
+# Encoder settings for cleaned videos. In testing, these gave the best quality while still being
+# recognizable by most editors and players.
+OUTPUT_VIDEO_KWARGS = {"vcodec": "libx264", "pix_fmt": "yuv420p", "crf": 17}
+
+
+def get_threads_kwargs(threads: int = None) -> dict:
+    """
+    Return the ffmpeg option that limits the decoder (as an input option) or the encoder (as an output
+    option) to threads threads. If threads isn't set, ffmpeg picks the number itself.
+    """
+    if threads:
+        return {"threads": threads}
+    return {}
+
+
+# Inpaint each frame on its own with OpenCV's Telea algorithm.
+INPAINT_METHOD_TELEA = "telea"
+# Take masked pixels from the same place in nearby frames, for text over a static background.
+INPAINT_METHOD_TEMPORAL = "temporal"
+INPAINT_METHODS = (INPAINT_METHOD_TELEA, INPAINT_METHOD_TEMPORAL)
 
 
-def get_frame(cap, frame_num) -> np.array:
+def get_frame(cap, frame_num, out=None) -> np.array:
+    """Return frame_num of the video. If out is given, the frame is decoded into it."""
     cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-    _, frame = cap.read()
+    _, frame = cap.read(out)
     if frame is None:
         raise Exception(f"Invalid frame: {frame_num}")
     return frame
@@ -56,31 +81,41 @@ def render_mask(
 
 def combine_masks(
     mode: str,
-    top: np.array,
-    bottom: np.array,
-) -> np.array:
+    top,
+    bottom,
+):
+    """
+    Combine the top mask with the bottom mask (which may be None) according to the mask mode.
+    Masks can be uint8 arrays or BitMasks, as long as top and bottom are the same type.
+    """
     if mode == MASK_MODE_INCLUDE:
         mask = top
         # Combine with base mask in bitwise_or to include the areas in both masks.
         if bottom is not None:
-            mask = cv2.bitwise_or(mask, bottom)
+            mask = mask | bottom
     else:
         # Invert so that the selected areas are excluded from the mask instead of included.
-        mask = cv2.bitwise_not(top)
+        mask = ~top
         # Combine with base mask in bitwise_and to remove the areas in the current mask.
         if bottom is not None:
-            mask = cv2.bitwise_and(mask, bottom)
+            mask = mask & bottom
     return mask
 
 
-def split_frames(video_file: pathlib.Path, out_dir: pathlib.Path, start=None, end=None):
-    """Convert a video to a directory of frame images"""
+def split_frames(
+    video_file: pathlib.Path,
+    out_dir: pathlib.Path,
+    start=None,
+    end=None,
+    threads: int = None,
+):
+    """Convert a video to a directory of frame images, decoding with threads threads if set"""
     assert out_dir.is_dir()
     assert video_file.is_file()
     assert video_file.exists()
 
     out = out_dir / SPLIT_FRAME_FILENAME
-    kwargs = {}
+    kwargs = get_threads_kwargs(threads)
     if start:
         kwargs["ss"] = start
     if end:
@@ -89,29 +124,133 @@ def split_frames(video_file: pathlib.Path, out_dir: pathlib.Path, start=None, en
 
 
 def clean_frames(
-    mask_im: np.array, in_dir: pathlib.Path, out_dir: pathlib.Path, radius: int
+    mask_im,
+    in_dir: pathlib.Path,
+    out_dir: pathlib.Path,
+    radius: int,
+    method: str = INPAINT_METHOD_TELEA,
+    window: int = DEFAULT_TEMPORAL_WINDOW,
+    cache=None,
+    incremental=None,
+    reuse=None,
+    pool=None,
+    workers: int = 1,
+    pipeline=None,
 ) -> (pathlib.Path, pathlib.Path):
-    """For each input frame, clean it based on the mask file"""
+    """
+    For each input frame, clean it based on the mask file. mask_im can also be a function that takes
+    each (BGR) frame in order and returns its mask (or an InpaintPlan, or None to leave the frame as it
+    is), for masks that change over time. method is one of INPAINT_METHODS; window is the number of
+    frames the temporal method takes the background from. If an InpaintCache is given, the telea
+    method reuses results from it.
+
+    If an IncrementalRender is given, frames that were already cleaned in out_dir (with its old mask)
+    are updated rather than cleaned from scratch; only frames without a cleaned version are cleaned
+    with mask_im. If a StaticBackgroundReuse is given, the telea method reuses the previous frame's
+    result when the background around the mask hasn't changed.
+
+    The telea method cleans each frame in place, so that the decoded frame is the only full-size
+    array: inpainting only works on the boxes around each group of mask pixels (see InpaintPlan).
+    Mask functions have to copy the frame if they keep it, since it is cleaned after they return.
+    If a BufferPool is given, any other arrays come from it, and it counts the allocations and copies
+    for each frame.
+
+    The telea method decodes, inpaints and writes frames in separate threads (with workers threads
+    inpainting), connected by bounded queues, so that reading and writing files overlaps with
+    inpainting. A StagedPipeline can be given to set the queue size and report on the stages.
+    """
     assert in_dir.is_dir()
     assert out_dir.is_dir()
 
     paths = sorted(in_dir.iterdir(), key=attrgetter("name"))
-    for in_file in paths:
+    if method == INPAINT_METHOD_TEMPORAL:
+        yield from clean_frames_temporal(mask_im, paths, out_dir, radius, window)
+        return
+    if method != INPAINT_METHOD_TELEA:
+        raise ValueError(f"Unknown inpaint method: {method}")
+    static_plan = None if callable(mask_im) else InpaintPlan(mask_im, radius)
+
+    # Each item is [in_file, out_file, frame, plan, previously cleaned frame].
+    def decode(in_file):
         out_file = out_dir / in_file.name
+        if incremental is not None and out_file.is_file():
+            if not incremental.tiles:
+                return [in_file, out_file, None, None, None]
+            previous = cv2.imread(str(out_file))
+            return [in_file, out_file, cv2.imread(str(in_file)), None, previous]
+        frame = cv2.imread(str(in_file))
+        if pool is not None:
+            pool.record_allocation(frame)
+        # Mask functions are called in order, since they can depend on the previous frames.
+        if callable(mask_im):
+            plan = as_inpaint_plan(mask_im(frame), radius)
+        else:
+            plan = static_plan
+        return [in_file, out_file, frame, plan, None]
+
+    def inpaint(item):
+        _, _, frame, plan, previous = item
+        if previous is not None:
+            item[2] = incremental.apply(frame, previous)
+        # The plan only inpaints the area around the mask, which gives the same result as
+        # inpainting the whole frame.
+        elif plan is not None and reuse is not None:
+            reuse.inpaint_in_place(plan, frame, cache, pool)
+        elif plan is not None:
+            plan.inpaint_in_place(frame, cache, pool)
+        return item
+
+    def write(item):
+        in_file, out_file, frame, _, previous = item
+        if frame is not None:
+            cv2.imwrite(str(out_file), frame)
+            if pool is not None and previous is None:
+                pool.end_frame()
+        return in_file, out_file
 
+    if pipeline is None:
+        pipeline = StagedPipeline()
+    yield from pipeline.run(
         # Skip non-files (i.e. directories)
-        if not in_file.is_file():
-            continue
+        [path for path in paths if path.is_file()],
+        [
+            Stage("decode", decode),
+            Stage("inpaint", inpaint, workers),
+            Stage("write", write),
+        ],
+    )
+
+
+def clean_frames_temporal(
+    mask_im, paths, out_dir: pathlib.Path, radius: int, window: int
+) -> (pathlib.Path, pathlib.Path):
+    """clean_frames for INPAINT_METHOD_TEMPORAL. Only the frames in the window are kept in memory."""
+    in_files = [path for path in paths if path.is_file()]
+    inpainter = TemporalInpainter(radius, window)
+
+    def write(ready):
+        for index, cleaned in ready:
+            out_file = out_dir / in_files[index].name
+            cv2.imwrite(str(out_file), cleaned)
+            yield in_files[index], out_file
 
+    for in_file in in_files:
         orig = cv2.imread(str(in_file))
-        orig = cv2.cvtColor(orig, cv2.COLOR_BGR2RGB)
+        mask = mask_im(orig) if callable(mask_im) else mask_im
+        if mask is None:
+            mask = np.zeros(orig.shape[:2], np.uint8)
+        elif isinstance(mask, InpaintPlan):
+            mask = mask.mask
+        yield from write(inpainter.push(orig, mask))
+    yield from write(inpainter.flush())
 
-        interp = cv2.inpaint(orig, mask_im, radius, cv2.INPAINT_TELEA)
-        interp = cv2.cvtColor(interp, cv2.COLOR_BGR2RGB)
-        interp = interp.astype(int)
 
-        cv2.imwrite(str(out_file), interp)
-        yield in_file, out_file
+def set_framerate(stream, framerate: str):
+    """
+    Play the frames of an ffmpeg stream back at framerate, the same way join_frames does, rather than
+    dropping or duplicating frames to keep the original speed.
+    """
+    return stream.filter("setpts", f"N/({framerate})/TB").filter("fps", fps=framerate)
 
 
 def join_frames(
@@ -121,6 +260,7 @@ def join_frames(
     frame_filename: str = SPLIT_FRAME_FILENAME,
     start_frame: int = 0,
     overwrite_output: bool = False,
+    threads: int = None,
 ):
     assert in_dir.is_dir()
 
@@ -130,7 +270,7 @@ def join_frames(
     stream = (
         ffmpeg.input(str(in_), framerate=framerate, start_number=start_frame)
         .filter("fps", fps=framerate)
-        .output(str(out_file), vcodec="libx264", pix_fmt="yuv420p", crf=17)
+        .output(str(out_file), **OUTPUT_VIDEO_KWARGS, **get_threads_kwargs(threads))
     )
     print(f"Muxing frames: {shlex.join(ffmpeg.compile(stream))}")
 
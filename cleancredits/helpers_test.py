@@ -7,7 +7,19 @@ import numpy as np
 import pytest
 from numpy.testing import assert_array_equal
 
-from .helpers import clean_frames, join_frames, split_frames
+from .bitmask import BitMask
+from .buffers import BufferPool
+from .helpers import (
+    INPAINT_METHOD_TEMPORAL,
+    MASK_MODE_EXCLUDE,
+    MASK_MODE_INCLUDE,
+    clean_frames,
+    combine_masks,
+    join_frames,
+    split_frames,
+)
+from .inpaint import StaticBackgroundReuse
+from .stages import StagedPipeline
 
 FILE_PATH = pathlib.Path(__file__).resolve()
 TESTDATA_PATH = FILE_PATH.parent / "testdata"
@@ -69,6 +81,127 @@ def test_clean_frames(tmp_path):
         )
 
 
+def test_clean_frames__mask_function(tmp_path):
+    in_dir = TESTDATA_PATH / "horses-720p"
+    mask_im = cv2.imread(
+        str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE
+    )
+    _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+    frames = []
+
+    def mask_function(frame):
+        # The frame is cleaned in place afterwards.
+        frames.append(frame.copy())
+        return mask_im
+
+    cleaned = list(clean_frames(mask_function, in_dir, tmp_path, 3))
+    assert len(frames) == len(cleaned)
+    # Frames are passed in order, as read from disk.
+    in_file, _ = cleaned[0]
+    assert_array_equal(frames[0], cv2.imread(str(in_file)))
+
+
+def test_clean_frames__pool(tmp_path):
+    in_dir = TESTDATA_PATH / "horses-720p"
+    mask_im = cv2.imread(
+        str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE
+    )
+    _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+    pool = BufferPool()
+    cleaned = list(clean_frames(mask_im, in_dir, tmp_path, 3, pool=pool))
+    for in_file, out_file in cleaned:
+        in_im = cv2.imread(str(in_file))
+        assert_array_equal(
+            cv2.imread(str(out_file)), cv2.inpaint(in_im, mask_im, 3, cv2.INPAINT_TELEA)
+        )
+    # Only decoding each frame allocates, and only the area around the mask is copied.
+    assert pool.frames == len(cleaned)
+    assert pool.allocations == len(cleaned)
+    assert pool.allocated_bytes == len(cleaned) * in_im.nbytes
+    assert pool.copied_bytes == 0
+
+
+def test_clean_frames__workers(tmp_path):
+    in_dir = TESTDATA_PATH / "horses-720p"
+    mask_im = cv2.imread(
+        str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE
+    )
+    _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+    pipeline = StagedPipeline()
+    cleaned = list(
+        clean_frames(
+            mask_im,
+            in_dir,
+            tmp_path,
+            3,
+            reuse=StaticBackgroundReuse(),
+            workers=3,
+            pipeline=pipeline,
+        )
+    )
+    # Frames come out in order.
+    assert [in_file.name for in_file, _ in cleaned] == sorted(
+        path.name for path in in_dir.iterdir()
+    )
+    for in_file, out_file in cleaned:
+        in_im = cv2.imread(str(in_file))
+        assert_array_equal(
+            cv2.imread(str(out_file)), cv2.inpaint(in_im, mask_im, 3, cv2.INPAINT_TELEA)
+        )
+    assert [stage.name for stage in pipeline.stages] == ["decode", "inpaint", "write"]
+    assert pipeline.stages[1].workers == 3
+    assert pipeline.items == len(cleaned)
+
+
+def test_clean_frames__temporal(tmp_path):
+    in_dir = TESTDATA_PATH / "horses-720p"
+    mask_im = cv2.imread(
+        str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE
+    )
+    _, mask_im = cv2.threshold(mask_im, 1, 255, cv2.THRESH_BINARY)
+    cleaned = list(
+        clean_frames(mask_im, in_dir, tmp_path, 3, INPAINT_METHOD_TEMPORAL, window=5)
+    )
+    assert [in_file for in_file, _ in cleaned] == sorted(in_dir.iterdir())
+    for in_file, out_file in cleaned:
+        in_im = cv2.imread(str(in_file))
+        out_im = cv2.imread(str(out_file))
+        # Only the masked area changes.
+        assert_array_equal(in_im[mask_im == 0], out_im[mask_im == 0])
+
+
+def test_clean_frames__temporal_moving_mask(tmp_path):
+    # Text moves down over a still background, so each masked pixel is uncovered in other frames.
+    background = np.random.default_rng(0).integers(0, 256, (120, 160, 3), np.uint8)
+    in_dir = tmp_path / "in"
+    out_dir = tmp_path / "out"
+    in_dir.mkdir()
+    out_dir.mkdir()
+    for i in range(7):
+        frame = background.copy()
+        frame[10 + 12 * i : 20 + 12 * i, 40:120] = 255
+        cv2.imwrite(str(in_dir / f"frame-{i:03}.png"), frame)
+
+    def mask_function(frame):
+        return cv2.inRange(frame, (255, 255, 255), (255, 255, 255))
+
+    cleaned = list(
+        clean_frames(
+            mask_function, in_dir, out_dir, 3, INPAINT_METHOD_TEMPORAL, window=5
+        )
+    )
+    assert len(cleaned) == 7
+    for _, out_file in cleaned:
+        # The background is recovered exactly, rather than inpainted from the area around the text.
+        assert_array_equal(cv2.imread(str(out_file)), background)
+
+
+def test_clean_frames__unknown_method(tmp_path):
+    mask_im = np.zeros((720, 1080), np.uint8)
+    with pytest.raises(ValueError):
+        list(clean_frames(mask_im, TESTDATA_PATH / "horses-720p", tmp_path, 3, "foo"))
+
+
 def test_join_frames(tmp_path):
     in_dir = TESTDATA_PATH / "horses-720p"
     out_file = tmp_path / "output.mp4"
@@ -143,3 +276,27 @@ def test_join_frames__high_start_frame(tmp_path):
     assert (
         frame_count == expected_frame_count
     ), f"found {expected_frame_count} files: {files}"
+
+
+@pytest.mark.parametrize("as_bitmask", [False, True])
+@pytest.mark.parametrize(
+    "mode,top,bottom,expected",
+    [
+        (MASK_MODE_INCLUDE, [0, 255, 0, 255], None, [0, 255, 0, 255]),
+        (MASK_MODE_INCLUDE, [0, 255, 0, 255], [0, 0, 255, 255], [0, 255, 255, 255]),
+        (MASK_MODE_EXCLUDE, [0, 255, 0, 255], None, [255, 0, 255, 0]),
+        (MASK_MODE_EXCLUDE, [0, 255, 0, 255], [0, 0, 255, 255], [0, 0, 255, 0]),
+    ],
+)
+def test_combine_masks(mode, top, bottom, expected, as_bitmask):
+    top = np.array([top], np.uint8)
+    if bottom is not None:
+        bottom = np.array([bottom], np.uint8)
+    if as_bitmask:
+        top = BitMask.from_array(top)
+        if bottom is not None:
+            bottom = BitMask.from_array(bottom)
+    mask = combine_masks(mode, top, bottom)
+    if as_bitmask:
+        mask = mask.to_array()
+    assert_array_equal(mask, [expected])
@@ -0,0 +1,263 @@
+import itertools
+
+import cv2
+import numpy as np
+
+# OpenCV hue goes from 0 to 179
+HSV_RANGES = np.array([180, 256, 256])
+# Width (in HSV values) of each histogram bin. Hue is kept at full resolution since hue ranges tend
+# to be narrow; saturation and value are binned to keep the table small (~6MB).
+DEFAULT_BIN_WIDTHS = (1, 4, 4)
+
+
+def get_rect_area(rect) -> int:
+    left, top, right, bottom = rect
+    return max(right - left, 0) * max(bottom - top, 0)
+
+
+def subtract_rect(rect, other) -> list:
+    """
+    Return up to 4 (left, top, right, bottom) rects that together cover the part of rect that isn't
+    in other.
+    """
+    left, top, right, bottom = rect
+    inner_left, inner_top = max(left, other[0]), max(top, other[1])
+    inner_right, inner_bottom = min(right, other[2]), min(bottom, other[3])
+    if inner_left >= inner_right or inner_top >= inner_bottom:
+        return [rect] if get_rect_area(rect) else []
+    rects = [
+        (left, top, right, inner_top),
+        (left, inner_bottom, right, bottom),
+        (left, inner_top, inner_left, inner_bottom),
+        (inner_right, inner_top, right, inner_bottom),
+    ]
+    return [r for r in rects if get_rect_area(r)]
+
+
+class HSVHistogram(object):
+    """
+    HSVHistogram is a 3d histogram of an image's HSV values, stored as a summed-volume table so that
+    the number of pixels inside any HSV box (such as the range selected by the hue/sat/val sliders)
+    can be computed in constant time, no matter how large the image is.
+
+    Counts within a crop need a table of their own, which takes time proportional to the number of
+    pixels counted. Each pixel's bin is kept, so a new crop only counts pixels, and moving a crop's
+    edges only counts the strips of pixels that were added or removed.
+
+    Counts are exact when the box bounds fall on bin edges (see is_exact). Otherwise, pixels are
+    assumed to be spread evenly within each bin, which makes the count exact to within the bin width.
+    """
+
+    def __init__(self, image, bin_widths=DEFAULT_BIN_WIDTHS):
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        self.bin_widths = np.array(bin_widths)
+        if np.any(HSV_RANGES % self.bin_widths):
+            raise ValueError(f"Bin widths {bin_widths} must divide {HSV_RANGES}")
+        self.bins = HSV_RANGES // self.bin_widths
+        self.height, self.width = hsv.shape[:2]
+        # Index of each pixel's bin in the flattened histogram.
+        binned = hsv // self.bin_widths.astype(np.uint8)
+        self.index = (
+            binned[..., 0].astype(np.int32) * int(self.bins[1] * self.bins[2])
+            + binned[..., 1].astype(np.int32) * int(self.bins[2])
+            + binned[..., 2]
+        )
+        self.table = self.summed_volume(
+            self.count_bins((0, 0, self.width, self.height))
+        )
+        self._crop = None
+        self._crop_hist = None
+        self._crop_table = None
+
+    def count_bins(self, rect) -> np.array:
+        """Return the number of pixels in each bin within the (left, top, right, bottom) rect."""
+        left, top, right, bottom = rect
+        return np.bincount(
+            self.index[top:bottom, left:right].ravel(),
+            minlength=int(np.prod(self.bins)),
+        )
+
+    def summed_volume(self, hist) -> np.array:
+        """
+        Return a table where table[h, s, v] is the number of pixels in bins below (h, s, v), from the
+        flattened histogram hist. The table has one more entry than there are bins on each axis,
+        with zeros in the first entries.
+        """
+        table = np.zeros(self.bins + 1, np.int64)
+        table[1:, 1:, 1:] = hist.reshape(self.bins).cumsum(0).cumsum(1).cumsum(2)
+        return table
+
+    def get_table(self, crop=None) -> np.array:
+        """Return the summed-volume table for the whole frame, or for the (left, top, right, bottom) crop."""
+        if crop is None:
+            return self.table
+        left, top, right, bottom = crop
+        left, right = np.clip((left, right), 0, self.width)
+        top, bottom = np.clip((top, bottom), 0, self.height)
+        crop = (int(left), int(top), int(max(left, right)), int(max(top, bottom)))
+        if crop == (0, 0, self.width, self.height):
+            return self.table
+        if crop == self._crop:
+            return self._crop_table
+        added = subtract_rect(crop, self._crop) if self._crop else [crop]
+        removed = subtract_rect(self._crop, crop) if self._crop else []
+        if sum(get_rect_area(rect) for rect in added + removed) < get_rect_area(crop):
+            # Dragging a crop slider only moves one edge a little at a time.
+            hist = self._crop_hist.copy()
+            for rect in added:
+                hist += self.count_bins(rect)
+            for rect in removed:
+                hist -= self.count_bins(rect)
+        else:
+            hist = self.count_bins(crop)
+        self._crop = crop
+        self._crop_hist = hist
+        self._crop_table = self.summed_volume(hist)
+        return self._crop_table
+
+    def is_exact(
+        self,
+        hue_min: int,
+        hue_max: int,
+        sat_min: int,
+        sat_max: int,
+        val_min: int,
+        val_max: int,
+    ) -> bool:
+        """Return whether count is exact for this range, because its bounds fall on bin edges."""
+        lower = np.array([hue_min, sat_min, val_min])
+        upper = np.array([hue_max, sat_max, val_max]) + 1
+        return bool(
+            np.all(lower % self.bin_widths == 0)
+            and np.all((upper % self.bin_widths == 0) | (upper >= HSV_RANGES))
+        )
+
+    def cumulative(self, table, upper) -> np.array:
+        """
+        Return the number of pixels whose h, s and v are all below upper (an array of 3 HSV values,
+        or 3 broadcastable arrays), interpolating within bins.
+        """
+        result = 0
+        coords = [
+            np.clip(
+                np.asarray(upper[axis], float) / self.bin_widths[axis],
+                0,
+                self.bins[axis],
+            )
+            for axis in range(3)
+        ]
+        lows = [np.floor(c).astype(int) for c in coords]
+        highs = [np.minimum(low + 1, self.bins[axis]) for axis, low in enumerate(lows)]
+        fracs = [c - low for c, low in zip(coords, lows)]
+        for corner in itertools.product((0, 1), repeat=3):
+            weight = 1
+            index = []
+            for axis, use_high in enumerate(corner):
+                if use_high:
+                    weight = weight * fracs[axis]
+                    index.append(highs[axis])
+                else:
+                    weight = weight * (1 - fracs[axis])
+                    index.append(lows[axis])
+            result = result + weight * table[tuple(index)]
+        return result
+
+    def count_box(self, table, lower, upper):
+        """Return the number of pixels with lower <= hsv < upper, using inclusion-exclusion."""
+        result = 0
+        for corner in itertools.product((0, 1), repeat=3):
+            bounds = [
+                upper[axis] if c else lower[axis] for axis, c in enumerate(corner)
+            ]
+            sign = -1 if (3 - sum(corner)) % 2 else 1
+            result = result + sign * self.cumulative(table, bounds)
+        return result
+
+    def count(
+        self,
+        hue_min: int,
+        hue_max: int,
+        sat_min: int,
+        sat_max: int,
+        val_min: int,
+        val_max: int,
+        crop=None,
+    ) -> int:
+        """Return the number of pixels in the inclusive HSV range, optionally within a crop."""
+        if hue_min > hue_max or sat_min > sat_max or val_min > val_max:
+            return 0
+        count = self.count_box(
+            self.get_table(crop),
+            (hue_min, sat_min, val_min),
+            (hue_max + 1, sat_max + 1, val_max + 1),
+        )
+        return int(round(float(count)))
+
+    def marginal(
+        self,
+        axis: int,
+        hue_min: int,
+        hue_max: int,
+        sat_min: int,
+        sat_max: int,
+        val_min: int,
+        val_max: int,
+        crop=None,
+    ) -> np.array:
+        """
+        Return the number of pixels in each bin along one axis (0 = hue, 1 = sat, 2 = val), counting
+        only pixels that are inside the HSV range on the other two axes.
+        """
+        lower = [hue_min, sat_min, val_min]
+        upper = [hue_max + 1, sat_max + 1, val_max + 1]
+        edges = np.arange(self.bins[axis] + 1) * self.bin_widths[axis]
+        lower[axis] = edges[:-1]
+        upper[axis] = edges[1:]
+        counts = self.count_box(self.get_table(crop), lower, upper)
+        return np.maximum(np.rint(counts), 0).astype(np.int64)
+
+    def suggest_bounds(self, hsv_pixel, crop=None, min_fraction=0.02, max_fuzz=40):
+        """
+        Suggest a tight HSV range around a color. Starting from the bins around the color, the range
+        is repeatedly grown by one bin on whichever side adds the most pixels, as long as that adds at
+        least min_fraction of the pixels already selected, and no bound is more than max_fuzz away
+        from the color. Returns ((hue_min, sat_min, val_min), (hue_max, sat_max, val_max)), or None
+        if the color doesn't appear in the image.
+        """
+        table = self.get_table(crop)
+        pixel = np.array(hsv_pixel, int)
+        lower = np.maximum(pixel - self.bin_widths, 0)
+        upper = np.minimum(pixel + self.bin_widths, HSV_RANGES - 1)
+        current = self.count_box(table, lower, upper + 1)
+        if current < 1:
+            return None
+
+        while True:
+            best = None
+            for axis in range(3):
+                for direction in (-1, 1):
+                    new_lower, new_upper = lower.copy(), upper.copy()
+                    if direction < 0:
+                        new_lower[axis] = max(lower[axis] - self.bin_widths[axis], 0)
+                    else:
+                        new_upper[axis] = min(
+                            upper[axis] + self.bin_widths[axis], HSV_RANGES[axis] - 1
+                        )
+                    if (new_lower == lower).all() and (new_upper == upper).all():
+                        continue
+                    if (
+                        pixel[axis] - new_lower[axis] > max_fuzz
+                        or new_upper[axis] - pixel[axis] > max_fuzz
+                    ):
+                        continue
+                    count = self.count_box(table, new_lower, new_upper + 1)
+                    added = count - current
+                    if added >= min_fraction * current and (
+                        best is None or added > best[0]
+                    ):
+                        best = (added, count, new_lower, new_upper)
+            if best is None:
+                break
+            _, current, lower, upper = best
+
+        return tuple(int(x) for x in lower), tuple(int(x) for x in upper)
@@ -0,0 +1,146 @@
+import cv2
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from .helpers_test import TESTDATA_PATH
+from .hsv_histogram import HSVHistogram, subtract_rect
+
+
+def load_frame():
+    return cv2.imread(str(TESTDATA_PATH / "horses-720p" / "frame-001.png"))
+
+
+def exact_count(image, hue_min, hue_max, sat_min, sat_max, val_min, val_max):
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    return cv2.countNonZero(
+        cv2.inRange(hsv, (hue_min, sat_min, val_min), (hue_max, sat_max, val_max))
+    )
+
+
+@pytest.mark.parametrize(
+    "bounds",
+    [
+        (0, 179, 0, 255, 0, 255),
+        (10, 30, 0, 63, 128, 255),
+        (0, 0, 0, 3, 0, 3),
+        (90, 179, 64, 191, 32, 95),
+    ],
+)
+def test_hsv_histogram__count__bin_aligned_is_exact(bounds):
+    frame = load_frame()
+    histogram = HSVHistogram(frame)
+    assert histogram.count(*bounds) == exact_count(frame, *bounds)
+
+
+@pytest.mark.parametrize(
+    "bounds",
+    [
+        (10, 30, 5, 100, 130, 250),
+        (0, 179, 17, 203, 41, 222),
+    ],
+)
+def test_hsv_histogram__count__within_bins_is_approximate(bounds):
+    frame = load_frame()
+    histogram = HSVHistogram(frame)
+    # Only the partial bins at each edge are approximated.
+    assert histogram.count(*bounds) == pytest.approx(
+        exact_count(frame, *bounds), rel=0.1
+    )
+
+
+def test_hsv_histogram__count__empty_range():
+    histogram = HSVHistogram(load_frame())
+    assert histogram.count(10, 9, 0, 255, 0, 255) == 0
+
+
+def test_hsv_histogram__count__crop():
+    frame = load_frame()
+    histogram = HSVHistogram(frame)
+    crop = (100, 200, 600, 400)
+    bounds = (0, 179, 0, 127, 128, 255)
+    assert histogram.count(*bounds, crop=crop) == exact_count(
+        frame[200:400, 100:600], *bounds
+    )
+    # Full-frame crops use the full-frame table.
+    assert histogram.get_table((0, 0, 1080, 720)) is histogram.table
+
+
+def test_hsv_histogram__count__moving_crop():
+    frame = load_frame()
+    histogram = HSVHistogram(frame)
+    bounds = (0, 179, 0, 127, 128, 255)
+    # Dragging each edge in turn, then jumping to a crop that doesn't overlap.
+    for crop in [
+        (100, 200, 600, 400),
+        (110, 200, 600, 400),
+        (110, 190, 600, 400),
+        (110, 190, 580, 400),
+        (110, 190, 580, 420),
+        (800, 0, 1080, 100),
+    ]:
+        left, top, right, bottom = crop
+        assert histogram.count(*bounds, crop=crop) == exact_count(
+            frame[top:bottom, left:right], *bounds
+        )
+
+
+def test_hsv_histogram__is_exact():
+    histogram = HSVHistogram(load_frame())
+    assert histogram.is_exact(0, 179, 0, 255, 0, 255)
+    assert histogram.is_exact(10, 30, 0, 63, 128, 255)
+    assert not histogram.is_exact(10, 30, 5, 100, 130, 250)
+
+
+def test_subtract_rect():
+    assert subtract_rect((0, 0, 10, 10), (0, 0, 10, 10)) == []
+    assert subtract_rect((0, 0, 10, 10), (2, 0, 10, 10)) == [(0, 0, 2, 10)]
+    assert subtract_rect((0, 0, 10, 10), (20, 20, 30, 30)) == [(0, 0, 10, 10)]
+    assert sorted(subtract_rect((0, 0, 10, 10), (2, 2, 8, 8))) == [
+        (0, 0, 10, 2),
+        (0, 2, 2, 8),
+        (0, 8, 10, 10),
+        (8, 2, 10, 8),
+    ]
+
+
+@pytest.mark.parametrize("axis", [0, 1, 2])
+def test_hsv_histogram__marginal(axis):
+    frame = load_frame()
+    histogram = HSVHistogram(frame)
+    bounds = (0, 99, 0, 127, 64, 255)
+    marginal = histogram.marginal(axis, *bounds)
+    assert marginal.shape == (histogram.bins[axis],)
+    # Bins outside the range on this axis are still counted, so clip the axis to its full range.
+    full = list(bounds)
+    full[axis * 2], full[axis * 2 + 1] = 0, (179, 255, 255)[axis]
+    assert marginal.sum() == exact_count(frame, *full)
+
+
+def test_hsv_histogram__suggest_bounds():
+    # Two flat colors with a little noise.
+    rng = np.random.default_rng(0)
+    hsv = np.zeros((100, 100, 3), np.int16)
+    hsv[:, :50] = (20, 200, 200)
+    hsv[:, 50:] = (120, 50, 60)
+    hsv += rng.integers(-3, 4, hsv.shape)
+    image = cv2.cvtColor(np.clip(hsv, 0, 255).astype(np.uint8), cv2.COLOR_HSV2BGR)
+    histogram = HSVHistogram(image)
+
+    lower, upper = histogram.suggest_bounds((20, 200, 200))
+    selected = histogram.count(
+        lower[0], upper[0], lower[1], upper[1], lower[2], upper[2]
+    )
+    assert selected == pytest.approx(5000, rel=0.05)
+    # The other color is left out.
+    assert not (lower[0] <= 120 <= upper[0])
+
+
+def test_hsv_histogram__suggest_bounds__missing_color():
+    image = np.zeros((10, 10, 3), np.uint8)
+    assert HSVHistogram(image).suggest_bounds((90, 255, 255)) is None
+
+
+def test_hsv_histogram__invalid_bin_widths():
+    with pytest.raises(ValueError):
+        HSVHistogram(np.zeros((2, 2, 3), np.uint8), bin_widths=(7, 4, 4))
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import pathlib
+import shutil
+
+import cv2
+import numpy as np
+
+from .inpaint import INPAINT_REGION_PADDING, InpaintPlan, get_inpaint_groups
+from .video_scan import DEFAULT_CACHE_DIR
+
+# Size (in pixels) of the square tiles that masks are compared in.
+DEFAULT_TILE_SIZE = 64
+RENDER_STATE_FILENAME = "render.json"
+RENDER_MASK_FILENAME = "render-mask.png"
+# Where the GUI keeps the cleaned frames of each render, so that the next render of the same video
+# to the same file can reuse them.
+DEFAULT_RENDER_STORE_DIR = DEFAULT_CACHE_DIR / "renders"
+# Least recently rendered frames are deleted once the render store grows past this many bytes.
+DEFAULT_RENDER_STORE_BYTES = 4 * 1024 * 1024 * 1024
+
+
+class IncrementalRender(object):
+    """
+    IncrementalRender updates frames that were cleaned with old_mask so that they look like they were
+    cleaned with new_mask, by only inpainting the tiles that the change can affect and keeping the
+    rest of each previously cleaned frame. The result is the same as cleaning the frame again.
+
+    A tile is affected if the masks differ within the inpaint radius of it, or if it has part of a
+    group of mask pixels (see get_inpaint_groups) that is also in an affected tile, since inpainting
+    spreads across the whole group.
+    """
+
+    def __init__(self, old_mask, new_mask, radius: int, tile_size=DEFAULT_TILE_SIZE):
+        self.radius = radius
+        height, width = new_mask.shape[:2]
+        rows = -(-height // tile_size)
+        columns = -(-width // tile_size)
+        self.tile_count = rows * columns
+
+        # Groups are worked out from both masks, so that every group is the same in both if none of
+        # its pixels changed.
+        size = 2 * (radius + INPAINT_REGION_PADDING) + 1
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+        changed = cv2.dilate(cv2.bitwise_xor(old_mask, new_mask), kernel)
+        _, labels = get_inpaint_groups(cv2.bitwise_or(old_mask, new_mask), radius)
+
+        def get_tiles(ys, xs):
+            return (ys // tile_size) * columns + xs // tile_size
+
+        dirty = np.zeros(self.tile_count, bool)
+        dirty[get_tiles(*np.nonzero(changed))] = True
+        # Every (group, tile) pair where the group has pixels in the tile.
+        ys, xs = np.nonzero(labels)
+        pairs = np.unique(
+            labels[ys, xs].astype(np.int64) * self.tile_count + get_tiles(ys, xs)
+        )
+        pair_groups, pair_tiles = np.divmod(pairs, self.tile_count)
+        while True:
+            dirty_groups = np.unique(pair_groups[dirty[pair_tiles]])
+            grown = dirty.copy()
+            grown[pair_tiles[np.isin(pair_groups, dirty_groups)]] = True
+            if (grown == dirty).all():
+                break
+            dirty = grown
+
+        self.tiles = []
+        for tile in np.flatnonzero(dirty):
+            row, column = divmod(int(tile), columns)
+            top, left = row * tile_size, column * tile_size
+            self.tiles.append(
+                (top, min(top + tile_size, height), left, min(left + tile_size, width))
+            )
+        plan_mask = np.where(np.isin(labels, dirty_groups), new_mask, 0).astype(
+            np.uint8
+        )
+        self.plan = InpaintPlan(plan_mask, radius)
+
+    def apply(self, source, previous) -> np.array:
+        """
+        Return previous (source cleaned with old_mask) as if source had been cleaned with new_mask.
+        """
+        if not self.tiles:
+            return previous
+        fresh = self.plan.inpaint(source)
+        cleaned = previous.copy()
+        for top, bottom, left, right in self.tiles:
+            cleaned[top:bottom, left:right] = fresh[top:bottom, left:right]
+        return cleaned
+
+    def format_stats(self) -> str:
+        return f"Incremental render: re-inpainting {len(self.tiles)} of {self.tile_count} tiles"
+
+
+def get_video_key(video_path) -> dict:
+    video_path = pathlib.Path(video_path).resolve()
+    stat = video_path.stat()
+    return {"video": str(video_path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def get_render_store_dir(
+    video_path, out_file, store_dir=DEFAULT_RENDER_STORE_DIR
+) -> pathlib.Path:
+    """Return the directory where the cleaned frames of renders of video_path to out_file are kept."""
+    key = json.dumps(
+        [str(pathlib.Path(video_path).resolve()), str(pathlib.Path(out_file).resolve())]
+    )
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return pathlib.Path(store_dir) / f"{pathlib.Path(video_path).stem}-{digest}"
+
+
+def evict_render_store(
+    store_dir=DEFAULT_RENDER_STORE_DIR, max_bytes=DEFAULT_RENDER_STORE_BYTES, keep=None
+) -> int:
+    """
+    Delete the frames of the least recently rendered videos in store_dir until it fits in max_bytes,
+    except for the ones in keep (the render that was just saved), and return how many bytes the
+    store takes afterwards.
+    """
+    store_dir = pathlib.Path(store_dir)
+    if not store_dir.is_dir():
+        return 0
+    renders = []
+    size = 0
+    for frames_dir in store_dir.iterdir():
+        if not frames_dir.is_dir():
+            continue
+        # The state is saved at the end of each render, so its time is when the frames were last
+        # rendered.
+        state_path = frames_dir / RENDER_STATE_FILENAME
+        used_path = state_path if state_path.is_file() else frames_dir
+        frames_size = sum(p.stat().st_size for p in frames_dir.iterdir() if p.is_file())
+        renders.append((used_path.stat().st_mtime_ns, frames_dir, frames_size))
+        size += frames_size
+    keep = pathlib.Path(keep).resolve() if keep is not None else None
+    for _, frames_dir, frames_size in sorted(renders, key=lambda render: render[0]):
+        if size <= max_bytes:
+            break
+        if frames_dir.resolve() == keep:
+            continue
+        shutil.rmtree(frames_dir, ignore_errors=True)
+        size -= frames_size
+    return size
+
+
+def save_render_state(
+    frames_dir, video_path, mask, radius: int, start_frame: int, end_frame: int
+):
+    """
+    Record that the cleaned frames in frames_dir are frames [start_frame, end_frame] of the video,
+    cleaned with mask and radius.
+    """
+    frames_dir = pathlib.Path(frames_dir)
+    cv2.imwrite(str(frames_dir / RENDER_MASK_FILENAME), mask)
+    with open(frames_dir / RENDER_STATE_FILENAME, "w") as f:
+        json.dump(
+            {
+                **get_video_key(video_path),
+                "radius": radius,
+                "start_frame": start_frame,
+                "end_frame": end_frame,
+            },
+            f,
+            indent=2,
+        )
+
+
+def load_render_state(frames_dir, video_path, radius: int):
+    """
+    Return (mask, start_frame, end_frame) from the state saved in frames_dir, or None if there isn't
+    any, or it was for a different video (or a different version of it) or radius.
+    """
+    frames_dir = pathlib.Path(frames_dir)
+    try:
+        with open(frames_dir / RENDER_STATE_FILENAME) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    video_key = {k: state.get(k) for k in ("video", "size", "mtime")}
+    if video_key != get_video_key(video_path) or state.get("radius") != radius:
+        return None
+    mask = cv2.imread(str(frames_dir / RENDER_MASK_FILENAME), cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        return None
+    return mask, state["start_frame"], state["end_frame"]
+
+
+def clear_render_state(frames_dir):
+    """Forget the saved state, while the frames in frames_dir are being replaced."""
+    (pathlib.Path(frames_dir) / RENDER_STATE_FILENAME).unlink(missing_ok=True)
@@ -0,0 +1,118 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from .helpers_test import TESTDATA_PATH
+from .incremental import (
+    IncrementalRender,
+    clear_render_state,
+    evict_render_store,
+    get_render_store_dir,
+    load_render_state,
+    save_render_state,
+)
+
+VIDEO_PATH = TESTDATA_PATH / "horses-720p.mp4"
+
+
+def load_frame():
+    return cv2.imread(str(TESTDATA_PATH / "horses-720p" / "frame-001.png"))
+
+
+def load_mask():
+    mask = cv2.imread(str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE)
+    _, mask = cv2.threshold(mask, 1, 255, cv2.THRESH_BINARY)
+    return mask
+
+
+def get_extra_mask():
+    extra = np.zeros((720, 1080), np.uint8)
+    extra[100:130, 100:200] = 255
+    return extra
+
+
+@pytest.mark.parametrize("radius", [3, 10])
+@pytest.mark.parametrize(
+    "old_mask,new_mask",
+    [
+        # Letters that the old mask missed.
+        (np.where(np.arange(1080) < 700, load_mask(), 0).astype(np.uint8), load_mask()),
+        # An area added to or removed from the mask.
+        (load_mask(), load_mask() | get_extra_mask()),
+        (load_mask() | get_extra_mask(), load_mask()),
+    ],
+)
+def test_incremental_render__matches_inpaint(old_mask, new_mask, radius):
+    frame = load_frame()
+    previous = cv2.inpaint(frame, old_mask, radius, cv2.INPAINT_TELEA)
+    incremental = IncrementalRender(old_mask, new_mask, radius)
+    assert 0 < len(incremental.tiles) < incremental.tile_count
+    assert_array_equal(
+        incremental.apply(frame, previous),
+        cv2.inpaint(frame, new_mask, radius, cv2.INPAINT_TELEA),
+    )
+
+
+def test_incremental_render__only_changed_tiles():
+    # Adding an area far from the rest of the mask doesn't touch the tiles around the rest of it.
+    incremental = IncrementalRender(load_mask(), load_mask() | get_extra_mask(), 3)
+    assert incremental.tiles == [
+        (64, 128, 64, 128),
+        (64, 128, 128, 192),
+        (64, 128, 192, 256),
+        (128, 192, 64, 128),
+        (128, 192, 128, 192),
+        (128, 192, 192, 256),
+    ]
+
+
+def test_incremental_render__unchanged():
+    frame = load_frame()
+    previous = cv2.inpaint(frame, load_mask(), 3, cv2.INPAINT_TELEA)
+    incremental = IncrementalRender(load_mask(), load_mask(), 3)
+    assert incremental.tiles == []
+    assert incremental.apply(frame, previous) is previous
+
+
+def test_render_state(tmp_path):
+    assert load_render_state(tmp_path, VIDEO_PATH, 3) is None
+    mask = load_mask()
+    save_render_state(tmp_path, VIDEO_PATH, mask, 3, 5, 20)
+    saved_mask, start_frame, end_frame = load_render_state(tmp_path, VIDEO_PATH, 3)
+    assert_array_equal(saved_mask, mask)
+    assert (start_frame, end_frame) == (5, 20)
+    # The state only applies to the same radius.
+    assert load_render_state(tmp_path, VIDEO_PATH, 4) is None
+    clear_render_state(tmp_path)
+    assert load_render_state(tmp_path, VIDEO_PATH, 3) is None
+
+
+def test_get_render_store_dir(tmp_path):
+    store_dir = get_render_store_dir(VIDEO_PATH, tmp_path / "out.mp4", tmp_path)
+    assert store_dir.parent == tmp_path
+    assert store_dir.name.startswith("horses-720p-")
+    assert get_render_store_dir(VIDEO_PATH, tmp_path / "out.mp4", tmp_path) == store_dir
+    assert (
+        get_render_store_dir(VIDEO_PATH, tmp_path / "other.mp4", tmp_path) != store_dir
+    )
+
+
+def test_evict_render_store(tmp_path):
+    frames_dirs = []
+    for i in range(3):
+        frames_dir = tmp_path / f"video-{i}"
+        frames_dir.mkdir()
+        (frames_dir / "frame-001.png").write_bytes(b"x" * 1000)
+        save_render_state(frames_dir, VIDEO_PATH, load_mask(), 3, 1, 1)
+        # Rendered in order, one second apart.
+        os.utime(frames_dir / "render.json", ns=(i * 10**9, i * 10**9))
+        frames_dirs.append(frames_dir)
+    state_size = sum(p.stat().st_size for p in frames_dirs[0].iterdir())
+    size = evict_render_store(tmp_path, 2 * state_size, keep=frames_dirs[0])
+    # The oldest render is kept, since it's the one that was just saved.
+    assert [p.is_dir() for p in frames_dirs] == [True, False, True]
+    assert size == 2 * state_size
+    assert evict_render_store(tmp_path / "missing") == 0
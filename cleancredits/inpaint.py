@@ -0,0 +1,361 @@
+import concurrent.futures
+import hashlib
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from .buffers import copyto
+from .scheduling import BalancedScheduler, get_inpaint_features
+
+# Telea only looks at pixels within the inpaint radius of the mask, so anything further than this
+# past the radius can't change the result.
+INPAINT_REGION_PADDING = 2
+# How many groups of mask pixels (see get_inpaint_groups) are inpainted at once. cv2.inpaint
+# releases the GIL, so they run in parallel.
+DEFAULT_INPAINT_THREADS = os.cpu_count() or 1
+
+_inpaint_threads = DEFAULT_INPAINT_THREADS
+_inpaint_executor = None
+_inpaint_executor_lock = threading.Lock()
+# Shared by every InpaintPlan, so that its cost model keeps learning across frames.
+_inpaint_scheduler = BalancedScheduler()
+
+
+def set_inpaint_threads(threads: int):
+    """Set how many threads InpaintPlan inpaints independent groups of mask pixels in."""
+    global _inpaint_threads, _inpaint_executor
+    with _inpaint_executor_lock:
+        if threads == _inpaint_threads:
+            return
+        _inpaint_threads = threads
+        if _inpaint_executor is not None:
+            _inpaint_executor.shutdown(wait=False)
+            _inpaint_executor = None
+
+
+def get_inpaint_threads() -> int:
+    return _inpaint_threads
+
+
+def get_inpaint_executor():
+    """Return the thread pool for inpainting groups of mask pixels, or None if it's 1 thread."""
+    global _inpaint_executor
+    with _inpaint_executor_lock:
+        if _inpaint_threads <= 1:
+            return None
+        if _inpaint_executor is None:
+            _inpaint_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=_inpaint_threads, thread_name_prefix="inpaint"
+            )
+        return _inpaint_executor
+
+
+def get_inpaint_region(mask, radius: int):
+    """
+    Return (top, bottom, left, right) of the part of the frame that inpainting with this mask reads
+    or writes: the mask's bounding box, grown by the radius plus INPAINT_REGION_PADDING. Returns None
+    if the mask is empty.
+    """
+    x, y, width, height = cv2.boundingRect(mask)
+    if width == 0 or height == 0:
+        return None
+    padding = radius + INPAINT_REGION_PADDING
+    frame_height, frame_width = mask.shape[:2]
+    return (
+        max(y - padding, 0),
+        min(y + height + padding, frame_height),
+        max(x - padding, 0),
+        min(x + width + padding, frame_width),
+    )
+
+
+def get_inpaint_scheduler() -> BalancedScheduler:
+    """Return the scheduler that balances groups of mask pixels across the inpaint threads."""
+    return _inpaint_scheduler
+
+
+def get_inpaint_groups(mask, radius: int) -> (int, np.array):
+    """
+    Return (count, labels) for the groups of mask pixels that are close enough together to affect
+    each other's inpainting, like cv2.connectedComponents. Inpainting each group on its own gives the
+    same result as inpainting them all at once.
+    """
+    size = 2 * (radius + INPAINT_REGION_PADDING) + 1
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+    count, labels = cv2.connectedComponents(cv2.dilate(mask, kernel), connectivity=8)
+    return count - 1, labels
+
+
+class InpaintPlan(object):
+    """
+    InpaintPlan holds the work that only depends on the mask (its bounding box and the cropped mask),
+    so that inpainting many frames with the same mask only has to inpaint the region around the mask.
+    The result is the same as calling cv2.inpaint on the whole frame.
+
+    If the mask has more than one group of pixels (see get_inpaint_groups), such as separate names in
+    the credits, each group is inpainted on its own box in a thread pool (see set_inpaint_threads)
+    rather than as one call over the whole region on one core.
+    """
+
+    def __init__(self, mask, radius: int):
+        self.mask = mask
+        self.radius = radius
+        self.region = get_inpaint_region(mask, radius)
+        self.region_mask = None
+        if self.region is not None:
+            top, bottom, left, right = self.region
+            self.region_mask = np.ascontiguousarray(mask[top:bottom, left:right])
+        self.ring = None
+        self.groups = None
+        self.group_features = None
+
+    def get_groups(self) -> list:
+        """
+        Return ((top, bottom, left, right), group_mask) for each group of mask pixels, where the box is
+        the part of the region that inpainting the group reads or writes. Returns an empty list if
+        there's only one group.
+        """
+        if self.groups is None:
+            self.groups = []
+            if self.region is None:
+                return self.groups
+            count, labels = get_inpaint_groups(self.region_mask, self.radius)
+            if count < 2:
+                return self.groups
+            ys, xs = np.nonzero(self.region_mask)
+            group_labels = labels[ys, xs]
+            tops = np.full(count + 1, self.region_mask.shape[0])
+            lefts = np.full(count + 1, self.region_mask.shape[1])
+            bottoms = np.zeros(count + 1, int)
+            rights = np.zeros(count + 1, int)
+            np.minimum.at(tops, group_labels, ys)
+            np.minimum.at(lefts, group_labels, xs)
+            np.maximum.at(bottoms, group_labels, ys + 1)
+            np.maximum.at(rights, group_labels, xs + 1)
+            padding = self.radius + INPAINT_REGION_PADDING
+            height, width = self.region_mask.shape[:2]
+            for label in range(1, count + 1):
+                top = max(tops[label] - padding, 0)
+                bottom = min(bottoms[label] + padding, height)
+                left = max(lefts[label] - padding, 0)
+                right = min(rights[label] + padding, width)
+                group_mask = np.where(
+                    labels[top:bottom, left:right] == label,
+                    self.region_mask[top:bottom, left:right],
+                    0,
+                ).astype(np.uint8)
+                self.groups.append(((top, bottom, left, right), group_mask))
+            self.group_features = [
+                get_inpaint_features(group_mask) for _, group_mask in self.groups
+            ]
+        return self.groups
+
+    def get_ring(self) -> np.array:
+        """
+        Return which pixels of the region Telea reads: the unmasked pixels within the radius (plus
+        INPAINT_REGION_PADDING) of the mask. Inpainting gives the same result as long as these and the
+        mask are the same.
+        """
+        if self.ring is None and self.region is not None:
+            size = 2 * (self.radius + INPAINT_REGION_PADDING) + 1
+            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+            self.ring = (cv2.dilate(self.region_mask, kernel) > 0) & (
+                self.region_mask == 0
+            )
+        return self.ring
+
+    def inpaint(self, frame, cache=None) -> np.array:
+        """Return a cleaned copy of frame. If an InpaintCache is given, results are reused from it."""
+        cleaned = frame.copy()
+        self.inpaint_in_place(cleaned, cache)
+        return cleaned
+
+    def inpaint_in_place(self, frame, cache=None, pool=None):
+        """
+        Clean frame, which can have any number of channels that cv2.inpaint supports. Inpainting
+        writes straight into frame; if a BufferPool is given, any other arrays it needs come from it.
+        """
+        if self.region is None:
+            return
+        top, bottom, left, right = self.region
+        region = frame[top:bottom, left:right]
+        if cache is None:
+            self.inpaint_region(region, pool)
+            return
+        cleaned = cache.inpaint(
+            region,
+            self.region_mask,
+            self.radius,
+            lambda image: self.inpaint_region(image, pool),
+        )
+        if cleaned is not region:
+            copyto(region, cleaned, pool=pool)
+
+    def inpaint_region(self, region, pool=None) -> np.array:
+        """
+        Inpaint the region around the mask in place, and return it. If there's more than one group of
+        mask pixels, each one only inpaints its own box, so inpainting never needs more memory than the
+        largest group's box takes. With more than 1 thread, the groups are balanced across the threads
+        by the BalancedScheduler from get_inpaint_scheduler.
+        """
+        if len(self.get_groups()) < 2:
+            inpaint_into(region, self.region_mask, self.radius, region, pool)
+            return region
+        executor = get_inpaint_executor()
+        if executor is None:
+            # Each group only changes its own mask pixels, which no other group reads, so the groups
+            # can be inpainted in place one after the other.
+            for (top, bottom, left, right), group_mask in self.groups:
+                box = region[top:bottom, left:right]
+                inpaint_into(box, group_mask, self.radius, box, pool)
+            return region
+
+        def get_task(group):
+            (top, bottom, left, right), group_mask = group
+
+            def inpaint_group():
+                box = region[top:bottom, left:right]
+                dst = np.empty_like(box) if pool is None else pool.acquire(box.shape)
+                inpaint_into(box, group_mask, self.radius, dst, pool)
+                return dst
+
+            return inpaint_group
+
+        # Results are only written back once every group is done, so that no thread reads pixels
+        # that another one is writing.
+        results = _inpaint_scheduler.run(
+            executor,
+            _inpaint_threads,
+            [get_task(group) for group in self.groups],
+            self.group_features,
+        )
+        for ((top, bottom, left, right), group_mask), result in zip(
+            self.groups, results
+        ):
+            masked = group_mask > 0
+            if result.ndim == 3:
+                masked = masked[:, :, None]
+            copyto(region[top:bottom, left:right], result, masked, pool)
+            if pool is not None:
+                pool.release(result)
+        return region
+
+
+def inpaint_into(image, mask, radius: int, dst, pool=None):
+    """cv2.inpaint with the Telea method, writing the result into dst (which can be image)."""
+    cleaned = cv2.inpaint(image, mask, radius, cv2.INPAINT_TELEA, dst=dst)
+    if cleaned is not dst:
+        # OpenCV can't write into some views, such as ones that aren't contiguous along a row.
+        copyto(dst, cleaned, pool=pool)
+
+
+class ReuseEntry(object):
+    """The result StaticBackgroundReuse keeps for the most recent background."""
+
+    def __init__(self):
+        self.patch = None
+        # Set once the thread that inpaints this background is done; ready_patch is only True if it
+        # succeeded.
+        self.ready = threading.Event()
+        self.ready_patch = False
+        # Number of threads waiting for or copying from patch.
+        self.readers = 0
+
+
+class StaticBackgroundReuse(object):
+    """
+    StaticBackgroundReuse skips inpainting frames when the background around the mask hasn't changed
+    since the previous frame, such as on held title cards and end boards. If the mask and the pixels
+    Telea reads around it (see InpaintPlan.get_ring) hash the same as the previous frame's, the masked
+    pixels are copied from the previous result instead.
+
+    Frames can be cleaned from several threads. If a frame matches one that another thread is still
+    inpainting, it waits for that result.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.key = None
+        self.entry = None
+        self.hits = 0
+        self.misses = 0
+
+    def inpaint(self, plan, frame, cache=None) -> np.array:
+        """Return a cleaned copy of frame, like plan.inpaint(frame, cache)."""
+        cleaned = frame.copy()
+        self.inpaint_in_place(plan, cleaned, cache)
+        return cleaned
+
+    def inpaint_in_place(self, plan, frame, cache=None, pool=None):
+        """Clean frame, like plan.inpaint_in_place(frame, cache, pool)."""
+        if plan.region is None:
+            return
+        top, bottom, left, right = plan.region
+        region = frame[top:bottom, left:right]
+        digest = hashlib.sha1(f"{plan.region}:{plan.radius}".encode())
+        digest.update(plan.region_mask.data)
+        digest.update(np.ascontiguousarray(region[plan.get_ring()]).data)
+        key = digest.digest()
+        with self.lock:
+            hit = key == self.key
+            if hit:
+                self.hits += 1
+                entry = self.entry
+                entry.readers += 1
+            else:
+                self.misses += 1
+                previous = self.entry
+                entry = self.entry = ReuseEntry()
+                self.key = key
+                # Nothing can start reading the previous result now, so its array can be reused once
+                # it has been written and nothing is still reading it.
+                if (
+                    previous is not None
+                    and previous.ready.is_set()
+                    and previous.readers == 0
+                ):
+                    entry.patch = previous.patch
+        if hit:
+            entry.ready.wait()
+            try:
+                if entry.ready_patch:
+                    masked = plan.region_mask > 0
+                    if frame.ndim == 3:
+                        masked = masked[:, :, None]
+                    copyto(region, entry.patch, masked, pool)
+                    return
+            finally:
+                with self.lock:
+                    entry.readers -= 1
+        try:
+            plan.inpaint_in_place(frame, cache, pool)
+            if hit:
+                return
+            if entry.patch is None or entry.patch.shape != region.shape:
+                entry.patch = np.empty_like(region)
+                if pool is not None:
+                    pool.record_allocation(entry.patch)
+            copyto(entry.patch, region, pool=pool)
+            entry.ready_patch = True
+        finally:
+            entry.ready.set()
+
+    def format_stats(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return (
+            f"Static background: reused {self.hits} of {total} inpainted frames "
+            f"({hit_rate:.0%} hit rate)"
+        )
+
+
+def as_inpaint_plan(mask, radius: int):
+    """
+    Return an InpaintPlan for a per-frame mask, which can be a uint8 mask, an InpaintPlan, or None
+    if nothing should be inpainted (in which case None is returned).
+    """
+    if mask is None or isinstance(mask, InpaintPlan):
+        return mask
+    return InpaintPlan(mask, radius)
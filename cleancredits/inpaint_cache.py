@@ -0,0 +1,144 @@
+import collections
+import hashlib
+import os
+import pathlib
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+from .video_scan import DEFAULT_CACHE_DIR
+
+DEFAULT_INPAINT_CACHE_DIR = DEFAULT_CACHE_DIR / "inpaint"
+# Least recently used results are deleted once the cache grows past this many bytes.
+DEFAULT_INPAINT_CACHE_BYTES = 1024 * 1024 * 1024
+INPAINT_CACHE_SUFFIX = ".npy"
+
+
+class InpaintCache(object):
+    """
+    InpaintCache is a persistent, size-capped cache of inpainting results on disk. Each result is
+    keyed by a hash of the pixels that were inpainted, the mask and the radius, so it is reused
+    whenever the same area of the same frame is inpainted with the same settings again, whichever
+    part of the program asks for it. Once the cache is bigger than max_bytes, the least recently used
+    results are deleted.
+
+    Results are usually only the area around the mask (see InpaintPlan), so they are small enough
+    that reading one back is much cheaper than inpainting it again.
+    """
+
+    def __init__(
+        self,
+        cache_dir=DEFAULT_INPAINT_CACHE_DIR,
+        max_bytes: int = DEFAULT_INPAINT_CACHE_BYTES,
+    ):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # The GUI can render and preview at the same time.
+        self.lock = threading.Lock()
+        # Size of each result in the cache by key, least recently used first. Results are touched
+        # when they're used, so the order carries over to the next run.
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        paths = [
+            (path.stat(), path)
+            for path in self.cache_dir.iterdir()
+            if path.suffix == INPAINT_CACHE_SUFFIX
+        ]
+        for stat, path in sorted(paths, key=lambda item: item[0].st_mtime_ns):
+            self.entries[path.stem] = stat.st_size
+            self.size += stat.st_size
+        self.hits = 0
+        self.misses = 0
+        with self.lock:
+            self.evict()
+
+    def get_key(self, image, mask, radius: int) -> str:
+        digest = hashlib.sha1()
+        # Results from a different version of OpenCV might not be the same.
+        digest.update(
+            f"{cv2.__version__}:{radius}:{image.shape}:{image.dtype}".encode()
+        )
+        digest.update(np.ascontiguousarray(mask).data)
+        digest.update(np.ascontiguousarray(image).data)
+        return digest.hexdigest()
+
+    def get_path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / f"{key}{INPAINT_CACHE_SUFFIX}"
+
+    def get(self, key: str):
+        """Return the cached result for key, or None if there isn't one."""
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        path = self.get_path(key)
+        try:
+            result = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Deleted or corrupted by something else.
+            with self.lock:
+                self.size -= self.entries.pop(key, 0)
+            return None
+        return result
+
+    def put(self, key: str, result):
+        path = self.get_path(key)
+        # Inpaint workers, and other runs sharing the cache directory, can put the same key at once,
+        # so each writes its own temporary file. The result is the same either way, so whichever
+        # replace lands last wins.
+        with tempfile.NamedTemporaryFile(
+            dir=self.cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            np.save(f, result)
+        try:
+            os.replace(f.name, path)
+            size = path.stat().st_size
+        except FileNotFoundError:
+            # Evicted by another run straight away; it can be inpainted again next time.
+            return
+        with self.lock:
+            self.size -= self.entries.pop(key, 0)
+            self.entries[key] = size
+            self.size += size
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used results until the cache fits in max_bytes."""
+        while self.size > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                self.get_path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def inpaint(self, image, mask, radius: int, inpaint=None) -> np.array:
+        """
+        Return cv2.inpaint(image, mask, radius, cv2.INPAINT_TELEA), from the cache if possible. On a
+        miss, inpaint(image) is used instead if it's given, which must return the same thing (and can
+        clean image in place).
+        """
+        key = self.get_key(image, mask, radius)
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        if inpaint is None:
+            result = cv2.inpaint(image, mask, radius, cv2.INPAINT_TELEA)
+        else:
+            result = inpaint(image)
+        self.put(key, result)
+        return result
+
+    def format_stats(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return (
+            f"Inpaint cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate), "
+            f"{self.size / 1024 / 1024:.1f} MB in {self.cache_dir}"
+        )
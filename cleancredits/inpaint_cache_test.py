@@ -0,0 +1,114 @@
+import concurrent.futures
+import threading
+
+import cv2
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from .helpers_test import TESTDATA_PATH
+from .inpaint import InpaintPlan
+from .inpaint_cache import InpaintCache
+
+
+def load_frame(frame_num=1):
+    return cv2.imread(str(TESTDATA_PATH / "horses-720p" / f"frame-{frame_num:03}.png"))
+
+
+def load_mask():
+    mask = cv2.imread(str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE)
+    _, mask = cv2.threshold(mask, 1, 255, cv2.THRESH_BINARY)
+    return mask
+
+
+def test_inpaint_cache__matches_inpaint(tmp_path):
+    frame = load_frame()
+    mask = load_mask()
+    cache = InpaintCache(tmp_path)
+    expected = cv2.inpaint(frame, mask, 3, cv2.INPAINT_TELEA)
+    assert_array_equal(cache.inpaint(frame, mask, 3), expected)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert_array_equal(cache.inpaint(frame, mask, 3), expected)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_inpaint_cache__key(tmp_path):
+    frame = load_frame()
+    mask = load_mask()
+    cache = InpaintCache(tmp_path)
+    key = cache.get_key(frame, mask, 3)
+    assert cache.get_key(frame.copy(), mask.copy(), 3) == key
+    assert cache.get_key(frame, mask, 4) != key
+    assert cache.get_key(load_frame(2), mask, 3) != key
+    other_mask = mask.copy()
+    other_mask[0, 0] = 255
+    assert cache.get_key(frame, other_mask, 3) != key
+
+
+def test_inpaint_cache__persists(tmp_path):
+    frame = load_frame()
+    mask = load_mask()
+    InpaintCache(tmp_path).inpaint(frame, mask, 3)
+    cache = InpaintCache(tmp_path)
+    assert_array_equal(
+        cache.inpaint(frame, mask, 3), cv2.inpaint(frame, mask, 3, cv2.INPAINT_TELEA)
+    )
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_inpaint_cache__evicts_least_recently_used(tmp_path):
+    images = [np.full((10, 10), i, np.uint8) for i in range(3)]
+    mask = np.zeros((10, 10), np.uint8)
+    mask[4:6, 4:6] = 255
+    cache = InpaintCache(tmp_path)
+    for image in images[:2]:
+        cache.inpaint(image, mask, 3)
+    # Use the first result again, so that the second one is the least recently used.
+    cache.inpaint(images[0], mask, 3)
+    cache.max_bytes = cache.size
+    cache.inpaint(images[2], mask, 3)
+    assert len(list(tmp_path.iterdir())) == 2
+    keys = [cache.get_key(image, mask, 3) for image in images]
+    assert list(cache.entries) == [keys[0], keys[2]]
+
+
+def test_inpaint_cache__deleted_result(tmp_path):
+    frame = load_frame()
+    mask = load_mask()
+    cache = InpaintCache(tmp_path)
+    cache.inpaint(frame, mask, 3)
+    for path in tmp_path.iterdir():
+        path.unlink()
+    assert_array_equal(
+        cache.inpaint(frame, mask, 3), cv2.inpaint(frame, mask, 3, cv2.INPAINT_TELEA)
+    )
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_inpaint_cache__concurrent_put(tmp_path):
+    frame = load_frame()
+    cache = InpaintCache(tmp_path)
+    # Another run sharing the directory puts the same keys at the same time.
+    other = InpaintCache(tmp_path)
+    barrier = threading.Barrier(8)
+
+    def put(cache):
+        barrier.wait()
+        for _ in range(20):
+            cache.put("samekey", frame)
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        list(executor.map(put, [cache] * 4 + [other] * 4))
+    assert [path.name for path in tmp_path.iterdir()] == ["samekey.npy"]
+    assert_array_equal(cache.get("samekey"), frame)
+    assert cache.size == (tmp_path / "samekey.npy").stat().st_size
+
+
+def test_inpaint_plan__cache(tmp_path):
+    frame = load_frame()
+    mask = load_mask()
+    cache = InpaintCache(tmp_path)
+    plan = InpaintPlan(mask, 3)
+    expected = plan.inpaint(frame)
+    assert_array_equal(plan.inpaint(frame, cache), expected)
+    assert_array_equal(plan.inpaint(frame, cache), expected)
+    assert (cache.hits, cache.misses) == (1, 1)
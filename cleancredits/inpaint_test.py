@@ -0,0 +1,217 @@
+import concurrent.futures
+
+import cv2
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from .helpers_test import TESTDATA_PATH
+from .inpaint import (
+    DEFAULT_INPAINT_THREADS,
+    InpaintPlan,
+    StaticBackgroundReuse,
+    get_inpaint_groups,
+    get_inpaint_region,
+    set_inpaint_threads,
+)
+from .inpaint_cache import InpaintCache
+
+
+def load_frame():
+    return cv2.imread(str(TESTDATA_PATH / "horses-720p" / "frame-001.png"))
+
+
+def load_mask():
+    mask = cv2.imread(str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE)
+    _, mask = cv2.threshold(mask, 1, 255, cv2.THRESH_BINARY)
+    return mask
+
+
+@pytest.fixture
+def inpaint_threads():
+    set_inpaint_threads(4)
+    yield
+    set_inpaint_threads(DEFAULT_INPAINT_THREADS)
+
+
+def get_scattered_mask():
+    """Return a mask with lots of separate groups of pixels, some of them at the edges."""
+    mask = np.zeros((720, 1080), np.uint8)
+    rng = np.random.default_rng(0)
+    for y, x in zip(rng.integers(0, 720, 40), rng.integers(0, 1080, 40)):
+        mask[y : y + 12, x : x + 30] = 255
+    return mask
+
+
+@pytest.mark.parametrize("radius", [1, 3, 10])
+def test_inpaint_plan__matches_inpaint(radius):
+    frame = load_frame()
+    mask = load_mask()
+    assert_array_equal(
+        InpaintPlan(mask, radius).inpaint(frame),
+        cv2.inpaint(frame, mask, radius, cv2.INPAINT_TELEA),
+    )
+
+
+def test_inpaint_plan__mask_at_edges():
+    frame = load_frame()
+    mask = np.zeros(frame.shape[:2], np.uint8)
+    mask[:5, :20] = 255
+    mask[-3:, -40:] = 255
+    assert_array_equal(
+        InpaintPlan(mask, 3).inpaint(frame),
+        cv2.inpaint(frame, mask, 3, cv2.INPAINT_TELEA),
+    )
+
+
+def test_inpaint_plan__in_place_single_channel():
+    plane = cv2.cvtColor(load_frame(), cv2.COLOR_BGR2GRAY)
+    mask = load_mask()
+    expected = cv2.inpaint(plane, mask, 3, cv2.INPAINT_TELEA)
+    InpaintPlan(mask, 3).inpaint_in_place(plane)
+    assert_array_equal(plane, expected)
+
+
+def test_inpaint_plan__empty_mask():
+    frame = load_frame()
+    plan = InpaintPlan(np.zeros(frame.shape[:2], np.uint8), 3)
+    assert plan.region is None
+    cleaned = plan.inpaint(frame)
+    assert_array_equal(cleaned, frame)
+    assert cleaned is not frame
+
+
+def test_get_inpaint_groups():
+    mask = np.zeros((50, 100), np.uint8)
+    mask[10:12, 10:12] = 255
+    # Close enough to the first one to be in the same group.
+    mask[10:12, 20:22] = 255
+    mask[40:42, 80:82] = 255
+    count, labels = get_inpaint_groups(mask, 3)
+    assert count == 2
+    assert labels[10, 10] == labels[10, 20]
+    assert labels[10, 10] != labels[40, 80]
+
+
+def test_get_inpaint_region():
+    mask = np.zeros((100, 200), np.uint8)
+    mask[10:20, 50:60] = 255
+    assert get_inpaint_region(mask, 3) == (5, 25, 45, 65)
+    assert get_inpaint_region(mask, 20) == (0, 42, 28, 82)
+
+
+def test_inpaint_plan__ring():
+    mask = np.zeros((20, 30), np.uint8)
+    mask[8:10, 10:13] = 255
+    ring = InpaintPlan(mask, 1).get_ring()
+    top, bottom, left, right = InpaintPlan(mask, 1).region
+    # Everything within radius 1 plus padding 2 of the mask, except the mask itself.
+    expected = np.zeros((20, 30), bool)
+    expected[5:13, 7:16] = True
+    expected[8:10, 10:13] = False
+    assert_array_equal(ring, expected[top:bottom, left:right])
+
+
+def test_static_background_reuse():
+    frame = load_frame()
+    mask = load_mask()
+    plan = InpaintPlan(mask, 3)
+    expected = cv2.inpaint(frame, mask, 3, cv2.INPAINT_TELEA)
+    reuse = StaticBackgroundReuse()
+    assert_array_equal(reuse.inpaint(plan, frame), expected)
+    # Pixels that Telea doesn't read can change (like the text under the mask) without changing
+    # the result.
+    noise = np.random.default_rng(0).integers(0, 256, frame.shape, np.uint8)
+    top, bottom, left, right = plan.region
+    unread = np.ones(frame.shape[:2], bool)
+    unread[top:bottom, left:right] = ~plan.get_ring()
+    changed = frame.copy()
+    changed[unread] = noise[unread]
+    cleaned = reuse.inpaint(plan, changed)
+    assert (reuse.hits, reuse.misses) == (1, 1)
+    assert_array_equal(cleaned[mask > 0], expected[mask > 0])
+    assert_array_equal(cleaned[mask == 0], changed[mask == 0])
+    # Changing a pixel that Telea reads means inpainting again.
+    changed[top:bottom, left:right][plan.get_ring()] = 0
+    assert_array_equal(
+        reuse.inpaint(plan, changed), cv2.inpaint(changed, mask, 3, cv2.INPAINT_TELEA)
+    )
+    assert (reuse.hits, reuse.misses) == (1, 2)
+    assert reuse.format_stats() == (
+        "Static background: reused 1 of 3 inpainted frames (33% hit rate)"
+    )
+
+
+def test_static_background_reuse__threads():
+    frames = [load_frame(), cv2.flip(load_frame(), 0)]
+    mask = load_mask()
+    plan = InpaintPlan(mask, 3)
+    expected = [cv2.inpaint(frame, mask, 3, cv2.INPAINT_TELEA) for frame in frames]
+    reuse = StaticBackgroundReuse()
+    # Runs of the same background, which threads clean in any order.
+    indexes = [0] * 5 + [1] * 5 + [0] * 5
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        cleaned = list(executor.map(lambda i: reuse.inpaint(plan, frames[i]), indexes))
+    for i, result in zip(indexes, cleaned):
+        assert_array_equal(result, expected[i])
+    assert reuse.hits + reuse.misses == len(indexes)
+    assert reuse.misses >= 3
+
+
+def test_static_background_reuse__empty_mask():
+    frame = load_frame()
+    reuse = StaticBackgroundReuse()
+    cleaned = reuse.inpaint(InpaintPlan(np.zeros(frame.shape[:2], np.uint8), 3), frame)
+    assert_array_equal(cleaned, frame)
+    assert (reuse.hits, reuse.misses) == (0, 0)
+
+
+def test_inpaint_plan__groups():
+    plan = InpaintPlan(get_scattered_mask(), 3)
+    groups = plan.get_groups()
+    assert len(groups) == get_inpaint_groups(plan.region_mask, 3)[0]
+    assert len(groups) > 10
+    # Every mask pixel is in exactly one group.
+    total = np.zeros(plan.region_mask.shape, int)
+    for (top, bottom, left, right), group_mask in groups:
+        total[top:bottom, left:right] += group_mask > 0
+    assert_array_equal(total, plan.region_mask > 0)
+
+
+@pytest.mark.parametrize(
+    "get_mask,radius",
+    [
+        (load_mask, 1),
+        (load_mask, 3),
+        (get_scattered_mask, 3),
+        (get_scattered_mask, 10),
+    ],
+)
+def test_inpaint_plan__concurrent_matches_inpaint(inpaint_threads, get_mask, radius):
+    frame = load_frame()
+    mask = get_mask()
+    plan = InpaintPlan(mask, radius)
+    assert len(plan.get_groups()) > 1
+    assert_array_equal(
+        plan.inpaint(frame), cv2.inpaint(frame, mask, radius, cv2.INPAINT_TELEA)
+    )
+
+
+def test_inpaint_plan__concurrent_single_channel(inpaint_threads):
+    plane = load_frame()[:, :, 1].copy()
+    mask = get_scattered_mask()
+    expected = cv2.inpaint(plane, mask, 3, cv2.INPAINT_TELEA)
+    InpaintPlan(mask, 3).inpaint_in_place(plane)
+    assert_array_equal(plane, expected)
+
+
+def test_inpaint_plan__concurrent_cache(inpaint_threads, tmp_path):
+    frame = load_frame()
+    mask = get_scattered_mask()
+    cache = InpaintCache(tmp_path)
+    plan = InpaintPlan(mask, 3)
+    expected = cv2.inpaint(frame, mask, 3, cv2.INPAINT_TELEA)
+    assert_array_equal(plan.inpaint(frame, cache), expected)
+    assert_array_equal(plan.inpaint(frame, cache), expected)
+    # The whole region is cached, rather than each group.
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,174 @@
+import bisect
+import itertools
+import json
+import pathlib
+
+import cv2
+
+from .helpers import combine_masks, get_frame, render_mask
+from .inpaint import InpaintPlan
+from .layers import LAYER_SETTINGS
+
+# Layers in a mask track are rendered from their own mask frame, like in the GUI.
+KEYFRAME_LAYER_SETTINGS = ("mask_frame_number",) + LAYER_SETTINGS
+
+
+class Keyframe(object):
+    """
+    A Keyframe sets the mask from its start frame until the next keyframe. The mask is either given
+    directly, or as mask layers that are rendered when the track is prepared. A keyframe with neither
+    turns inpainting off.
+    """
+
+    def __init__(self, start: int, mask=None, layers=None):
+        self.start = start
+        self.mask = mask
+        self.layers = layers
+        self.plan = None
+
+    def get_plan(self, radius: int):
+        """Return the InpaintPlan for this keyframe's mask, reusing it across the keyframe's range."""
+        if self.mask is None:
+            if self.layers:
+                raise RuntimeError(
+                    f"Keyframe at frame {self.start} has layers; call MaskTrack.prepare first"
+                )
+            return None
+        if self.plan is None or self.plan.radius != radius:
+            self.plan = InpaintPlan(self.mask, radius)
+        return self.plan
+
+
+class MaskTrack(object):
+    """
+    MaskTrack is a sparse list of keyframes that switch the mask at given frames, for titles where the
+    text moves every few seconds. Frames before the first keyframe aren't inpainted.
+
+    Mask tracks are stored as JSON files like:
+
+        {"keyframes": [
+            {"start": 0, "mask": "title-1.png"},
+            {"start": 120, "layers": [{"mask_frame_number": 130, "mask_mode": ..., ...}]},
+            {"start": 250}
+        ]}
+
+    where mask paths are relative to the JSON file.
+    """
+
+    def __init__(self, keyframes):
+        self.keyframes = sorted(keyframes, key=lambda keyframe: keyframe.start)
+        self.starts = [keyframe.start for keyframe in self.keyframes]
+        if len(set(self.starts)) != len(self.starts):
+            raise ValueError("Keyframes must start on different frames")
+
+    @classmethod
+    def load(cls, path) -> "MaskTrack":
+        path = pathlib.Path(path)
+        with open(path) as f:
+            data = json.load(f)
+        entries = data.get("keyframes") if isinstance(data, dict) else None
+        if not entries:
+            raise ValueError(f"No keyframes found in {path}")
+
+        keyframes = []
+        masks = {}
+        for entry in entries:
+            if "start" not in entry:
+                raise ValueError(f"Keyframe in {path} is missing start")
+            mask = None
+            if "mask" in entry:
+                mask_path = path.parent / entry["mask"]
+                if mask_path not in masks:
+                    mask = cv2.imread(str(mask_path), cv2.IMREAD_GRAYSCALE)
+                    if mask is None:
+                        raise ValueError(f"Invalid mask file: {mask_path}")
+                    _, masks[mask_path] = cv2.threshold(mask, 1, 255, cv2.THRESH_BINARY)
+                mask = masks[mask_path]
+            layers = entry.get("layers")
+            for i, layer in enumerate(layers or []):
+                missing = [k for k in KEYFRAME_LAYER_SETTINGS if k not in layer]
+                if missing:
+                    raise ValueError(
+                        f"Layer {i + 1} of keyframe at frame {entry['start']} is missing {', '.join(missing)}"
+                    )
+            keyframes.append(Keyframe(int(entry["start"]), mask=mask, layers=layers))
+        return cls(keyframes)
+
+    def save(self, path):
+        """
+        Save the track as a JSON file. Masks are saved as PNGs next to it; keyframes that only have
+        layers are saved as layers.
+        """
+        path = pathlib.Path(path)
+        entries = []
+        for i, keyframe in enumerate(self.keyframes):
+            entry = {"start": keyframe.start}
+            if keyframe.mask is not None:
+                mask_name = f"{path.stem}-{i + 1:03d}.png"
+                cv2.imwrite(str(path.parent / mask_name), keyframe.mask)
+                entry["mask"] = mask_name
+            elif keyframe.layers:
+                entry["layers"] = [
+                    {k: layer[k] for k in KEYFRAME_LAYER_SETTINGS}
+                    for layer in keyframe.layers
+                ]
+            entries.append(entry)
+        with open(path, "w") as f:
+            json.dump({"keyframes": entries}, f, indent=2)
+
+    def prepare(self, cap):
+        """
+        Render the masks of keyframes that are given as layers. Each layer is rendered once, even if
+        it is used by several keyframes.
+        """
+        frames = {}
+        layer_masks = {}
+        for keyframe in self.keyframes:
+            if keyframe.mask is not None or not keyframe.layers:
+                continue
+            mask = None
+            for layer in keyframe.layers:
+                key = tuple(layer[k] for k in KEYFRAME_LAYER_SETTINGS)
+                if key not in layer_masks:
+                    frame_num = layer["mask_frame_number"]
+                    if frame_num not in frames:
+                        frames[frame_num] = get_frame(cap, frame_num)
+                    layer_masks[key] = render_mask(
+                        frames[frame_num],
+                        **{k: layer[k] for k in LAYER_SETTINGS if k != "mask_mode"},
+                    )
+                mask = combine_masks(layer["mask_mode"], layer_masks[key], mask)
+            keyframe.mask = mask
+
+    def get_keyframe(self, frame_num: int):
+        """Return the keyframe in effect at frame_num, or None if it is before the first keyframe."""
+        index = bisect.bisect_right(self.starts, frame_num) - 1
+        if index < 0:
+            return None
+        return self.keyframes[index]
+
+    def get_mask(self, frame_num: int):
+        """Return the mask at frame_num, or None if nothing should be inpainted."""
+        keyframe = self.get_keyframe(frame_num)
+        if keyframe is None:
+            return None
+        if keyframe.mask is None and keyframe.layers:
+            raise RuntimeError(
+                f"Keyframe at frame {keyframe.start} has layers; call MaskTrack.prepare first"
+            )
+        return keyframe.mask
+
+    def get_plan(self, frame_num: int, radius: int):
+        """Return the InpaintPlan at frame_num, or None if nothing should be inpainted."""
+        keyframe = self.get_keyframe(frame_num)
+        if keyframe is None:
+            return None
+        return keyframe.get_plan(radius)
+
+    def mask_function(self, start_frame: int, radius: int):
+        """
+        Return a function for clean_frames that returns the InpaintPlan for each frame in turn,
+        starting with start_frame.
+        """
+        frame_nums = itertools.count(start_frame)
+        return lambda frame: self.get_plan(next(frame_nums), radius)
@@ -0,0 +1,130 @@
+import cv2
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from .helpers import MASK_MODE_EXCLUDE, MASK_MODE_INCLUDE, combine_masks, render_mask
+from .helpers_test import TESTDATA_PATH
+from .keyframes import Keyframe, MaskTrack
+
+
+def make_mask(x):
+    mask = np.zeros((720, 1080), np.uint8)
+    mask[100:200, x : x + 50] = 255
+    return mask
+
+
+def make_layer(**kwargs):
+    return {
+        "mask_frame_number": 3,
+        "mask_mode": MASK_MODE_INCLUDE,
+        "hue_min": 0,
+        "hue_max": 179,
+        "sat_min": 0,
+        "sat_max": 255,
+        "val_min": 200,
+        "val_max": 255,
+        "grow": 1,
+        "crop_left": 0,
+        "crop_top": 0,
+        "crop_right": 1080,
+        "crop_bottom": 720,
+    } | kwargs
+
+
+def test_mask_track__get_keyframe():
+    track = MaskTrack([Keyframe(10, make_mask(0)), Keyframe(0), Keyframe(20)])
+    assert track.get_keyframe(-1) is None
+    assert track.get_keyframe(0).start == 0
+    assert track.get_keyframe(9).start == 0
+    assert track.get_keyframe(10).start == 10
+    assert track.get_keyframe(19).start == 10
+    assert track.get_keyframe(1000).start == 20
+    assert track.get_mask(5) is None
+    assert_array_equal(track.get_mask(15), make_mask(0))
+
+
+def test_mask_track__duplicate_start():
+    with pytest.raises(ValueError):
+        MaskTrack([Keyframe(10), Keyframe(10)])
+
+
+def test_mask_track__plans_are_reused():
+    track = MaskTrack([Keyframe(0, make_mask(0)), Keyframe(10, make_mask(500))])
+    plan = track.get_plan(0, 3)
+    assert track.get_plan(9, 3) is plan
+    assert track.get_plan(10, 3) is not plan
+    assert track.get_plan(10, 3).region[2] > plan.region[3]
+
+
+def test_mask_track__mask_function():
+    track = MaskTrack([Keyframe(5, make_mask(0)), Keyframe(7)])
+    mask_function = track.mask_function(4, 3)
+    frame = np.zeros((720, 1080, 3), np.uint8)
+    plans = [mask_function(frame) for _ in range(4)]
+    assert plans[0] is None
+    assert plans[1] is not None and plans[1] is plans[2]
+    assert plans[3] is None
+
+
+def test_mask_track__save_load(tmp_path):
+    layers = [make_layer(), make_layer(mask_mode=MASK_MODE_EXCLUDE, val_min=250)]
+    track = MaskTrack(
+        [
+            Keyframe(0, make_mask(0)),
+            Keyframe(10, layers=layers),
+            Keyframe(20),
+            Keyframe(30, make_mask(0)),
+        ]
+    )
+    track.save(tmp_path / "track.json")
+    loaded = MaskTrack.load(tmp_path / "track.json")
+    assert loaded.starts == [0, 10, 20, 30]
+    assert_array_equal(loaded.get_mask(0), make_mask(0))
+    assert loaded.keyframes[1].layers == layers
+    assert loaded.keyframes[2].mask is None
+    assert loaded.keyframes[2].layers is None
+    assert_array_equal(loaded.get_mask(30), make_mask(0))
+
+
+@pytest.mark.parametrize(
+    "data",
+    ['{"keyframes": []}', '{"keyframes": [{"mask": "x.png"}]}', "[]"],
+)
+def test_mask_track__load_invalid(tmp_path, data):
+    path = tmp_path / "track.json"
+    path.write_text(data)
+    with pytest.raises(ValueError):
+        MaskTrack.load(path)
+
+
+def test_mask_track__load_missing_mask(tmp_path):
+    path = tmp_path / "track.json"
+    path.write_text('{"keyframes": [{"start": 0, "mask": "missing.png"}]}')
+    with pytest.raises(ValueError):
+        MaskTrack.load(path)
+
+
+def test_mask_track__prepare():
+    layers = [make_layer(), make_layer(mask_mode=MASK_MODE_EXCLUDE, val_min=250)]
+    track = MaskTrack([Keyframe(0, layers=layers), Keyframe(5, layers=layers[:1])])
+    with pytest.raises(RuntimeError):
+        track.get_mask(0)
+
+    cap = cv2.VideoCapture(str(TESTDATA_PATH / "horses-720p.mp4"))
+    track.prepare(cap)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 3)
+    _, frame = cap.read()
+    expected = None
+    for layer in layers:
+        settings = {
+            k: v
+            for k, v in layer.items()
+            if k not in ("mask_mode", "mask_frame_number")
+        }
+        expected = combine_masks(
+            layer["mask_mode"], render_mask(frame, **settings), expected
+        )
+        if layer is layers[0]:
+            assert_array_equal(track.get_mask(5), expected)
+    assert_array_equal(track.get_mask(0), expected)
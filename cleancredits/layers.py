@@ -0,0 +1,217 @@
+import json
+
+import cv2
+import numpy as np
+
+from .helpers import MASK_MODE_EXCLUDE, MASK_MODE_INCLUDE, combine_masks, render_mask
+
+# Settings that determine a single layer's contribution to the final mask.
+LAYER_SETTINGS = (
+    "mask_mode",
+    "hue_min",
+    "hue_max",
+    "sat_min",
+    "sat_max",
+    "val_min",
+    "val_max",
+    "grow",
+    "crop_left",
+    "crop_top",
+    "crop_right",
+    "crop_bottom",
+)
+
+MAX_COMPILED_LAYERS = 32
+# The final composite is looked up in tables indexed by this many layer bits at a time.
+FOLD_TABLE_BITS = 16
+
+
+def save_layers(path, layers):
+    """Save the settings of a stack of mask layers (bottom layer first) as a JSON layers file."""
+    data = {"layers": [{k: layer[k] for k in LAYER_SETTINGS} for layer in layers]}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def load_layers(path) -> list:
+    """Load the mask layers saved by save_layers."""
+    with open(path) as f:
+        data = json.load(f)
+    layers = data.get("layers") if isinstance(data, dict) else None
+    if not layers:
+        raise ValueError(f"No mask layers found in {path}")
+    for i, layer in enumerate(layers):
+        missing = [k for k in LAYER_SETTINGS if k not in layer]
+        if missing:
+            raise ValueError(f"Layer {i + 1} in {path} is missing {', '.join(missing)}")
+    return [{k: layer[k] for k in LAYER_SETTINGS} for layer in layers]
+
+
+def _bits_dtype(layer_count: int):
+    if layer_count <= 8:
+        return np.uint8
+    if layer_count <= 16:
+        return np.uint16
+    return np.uint32
+
+
+def _fold_table(modes, base: int) -> np.array:
+    """
+    Build a table mapping a set of layer bits to the final mask value (0 or 255). Stacking layers
+    with combine_masks means the topmost layer that selected a pixel decides whether it is included
+    or excluded, so every index in [2**k, 2**(k+1)) - whose highest set bit is k - maps to layer k's
+    mode. Index 0 (no layer selected the pixel) maps to base.
+    """
+    # cv2.LUT needs exactly 256 entries, so tables for up to 8 layers are padded with unused entries.
+    table = np.zeros(max(2 ** len(modes), 256), np.uint8)
+    table[0] = base
+    for k, mode in enumerate(modes):
+        table[2**k : 2 ** (k + 1)] = 255 if mode == MASK_MODE_INCLUDE else 0
+    return table
+
+
+class CompiledLayers(object):
+    """
+    CompiledLayers evaluates a stack of mask layers in a single pass over the frame, producing the
+    same mask as calling render_mask on each layer and stacking the results with combine_masks.
+
+    Each pixel is converted to HSV once and then classified by three per-channel lookup tables whose
+    entries are bit sets of the layers whose range contains that channel value; ANDing the three
+    lookups gives the set of layers that select the pixel. Grow is only applied to layers that have
+    it, crop is applied once per distinct crop box (and not at all for full-frame crops), and the
+    final composite is a single table lookup on the layer bits.
+    """
+
+    def __init__(self, layers):
+        if not layers:
+            raise ValueError("At least one layer is required")
+        if len(layers) > MAX_COMPILED_LAYERS:
+            raise ValueError(
+                f"At most {MAX_COMPILED_LAYERS} layers can be compiled, got {len(layers)}"
+            )
+        self.layer_count = len(layers)
+        self.dtype = _bits_dtype(self.layer_count)
+
+        self.layers = layers
+        # One table per HSV channel. OpenCV hue only goes up to 179, but 8-bit tables need 256 entries.
+        tables = np.zeros((3, 256), np.uint32)
+        values = np.arange(256)
+        self.grow_layers = []
+        self.crop_groups = {}
+        for i, layer in enumerate(layers):
+            bit = 1 << i
+            for channel, name in enumerate(("hue", "sat", "val")):
+                in_range = (values >= layer[f"{name}_min"]) & (
+                    values <= layer[f"{name}_max"]
+                )
+                tables[channel, in_range] |= bit
+            if layer["grow"] > 0:
+                self.grow_layers.append((bit, layer["grow"]))
+            crop = (
+                layer["crop_left"],
+                layer["crop_top"],
+                layer["crop_right"],
+                layer["crop_bottom"],
+            )
+            self.crop_groups[crop] = self.crop_groups.get(crop, 0) | bit
+        # cv2.LUT doesn't support unsigned 32-bit tables, but the bits are the same when signed.
+        if self.dtype == np.uint32:
+            self.tables = tables.view(np.int32)
+        else:
+            self.tables = tables.astype(self.dtype)
+
+        # Stacking onto nothing with an exclude layer inverts it, so pixels no layer selected are
+        # included in that case.
+        base = 255 if layers[0]["mask_mode"] == MASK_MODE_EXCLUDE else 0
+        modes = [layer["mask_mode"] for layer in layers]
+        self.fold_tables = [
+            _fold_table(modes[i : i + FOLD_TABLE_BITS], base if i == 0 else 0)
+            for i in range(0, self.layer_count, FOLD_TABLE_BITS)
+        ]
+
+    def classify(
+        self, image, row_offset: int = 0, frame_height: int = None
+    ) -> np.array:
+        """
+        Return, for each pixel of a BGR image, the bit set of layers that select it. image can also be
+        a horizontal strip of a frame, starting at row_offset in a frame that is frame_height rows tall.
+        """
+        frame_hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        hue, sat, val = cv2.split(frame_hsv)
+        bits = cv2.bitwise_and(
+            cv2.bitwise_and(cv2.LUT(hue, self.tables[0]), cv2.LUT(sat, self.tables[1])),
+            cv2.LUT(val, self.tables[2]),
+        )
+        if self.dtype == np.uint32:
+            bits = bits.view(np.uint32)
+
+        height, width = bits.shape
+        if frame_height is None:
+            frame_height = height
+        for bit, grow in self.grow_layers:
+            # Dilate this layer's bit plane the same way render_mask does.
+            kernel = np.ones((grow, grow), np.uint8)
+            if self.dtype == np.uint32:
+                # cv2.dilate doesn't support 32-bit integers.
+                plane = np.not_equal(bits & self.dtype(bit), 0).view(np.uint8)
+                grown = cv2.dilate(plane, kernel, iterations=1)
+                np.bitwise_or(bits, self.dtype(bit), out=bits, where=grown.view(bool))
+            else:
+                # The plane only contains 0 or bit, so dilating (max) is the same as ORing.
+                plane = cv2.bitwise_and(bits, int(bit))
+                cv2.bitwise_or(bits, cv2.dilate(plane, kernel, iterations=1), dst=bits)
+
+        for (left, top, right, bottom), group in self.crop_groups.items():
+            top, bottom, _ = slice(top, bottom).indices(frame_height)
+            left, right, _ = slice(left, right).indices(width)
+            if top == 0 and left == 0 and bottom == frame_height and right == width:
+                continue
+            top = min(max(top - row_offset, 0), height)
+            bottom = min(max(bottom - row_offset, 0), height)
+            clear = ~self.dtype(group)
+            if bottom <= top or right <= left:
+                bits &= clear
+                continue
+            bits[:top] &= clear
+            bits[bottom:] &= clear
+            bits[top:bottom, :left] &= clear
+            bits[top:bottom, right:] &= clear
+        return bits
+
+    def render(self, image) -> np.array:
+        """Return the combined uint8 mask (0 or 255) of all layers for a BGR image."""
+        if self.layer_count == 1:
+            # Nothing to fold, so the plain single-layer path is faster.
+            layer = self.layers[0]
+            mask = render_mask(
+                image, **{k: layer[k] for k in LAYER_SETTINGS if k != "mask_mode"}
+            )
+            return combine_masks(layer["mask_mode"], mask, None)
+        return self.fold(self.classify(image))
+
+    def render_rows(self, image, top: int, bottom: int) -> np.array:
+        """
+        Return rows [top, bottom) of the combined mask for a BGR image, classifying only those rows
+        (plus enough rows around them for grow to work the same as on the full frame).
+        """
+        height = image.shape[0]
+        padding = max((grow for _, grow in self.grow_layers), default=0)
+        strip_top = max(top - padding, 0)
+        strip_bottom = min(bottom + padding, height)
+        bits = self.classify(
+            image[strip_top:strip_bottom], row_offset=strip_top, frame_height=height
+        )
+        return self.fold(bits)[top - strip_top : bottom - strip_top]
+
+    def fold(self, bits) -> np.array:
+        """Return the combined uint8 mask (0 or 255) for the layer bits returned by classify."""
+        if self.dtype == np.uint8:
+            return cv2.LUT(bits, self.fold_tables[0])
+        if len(self.fold_tables) == 1:
+            return self.fold_tables[0][bits]
+        # The highest chunk with any bits set contains the topmost layer for each pixel.
+        mask = self.fold_tables[0][bits & ((1 << FOLD_TABLE_BITS) - 1)]
+        for i, table in enumerate(self.fold_tables[1:], start=1):
+            chunk = (bits >> (i * FOLD_TABLE_BITS)) & ((1 << FOLD_TABLE_BITS) - 1)
+            np.copyto(mask, table[chunk], where=chunk != 0)
+        return mask
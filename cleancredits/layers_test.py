@@ -0,0 +1,182 @@
+import cv2
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from .helpers import MASK_MODE_EXCLUDE, MASK_MODE_INCLUDE, combine_masks, render_mask
+from .helpers_test import TESTDATA_PATH
+from .layers import (
+    LAYER_SETTINGS,
+    MAX_COMPILED_LAYERS,
+    CompiledLayers,
+    load_layers,
+    save_layers,
+)
+
+
+def load_frame():
+    return cv2.imread(str(TESTDATA_PATH / "horses-720p" / "frame-001.png"))
+
+
+def random_layers(count, seed, width=1080, height=720):
+    rng = np.random.default_rng(seed)
+    layers = []
+    for _ in range(count):
+        hue = sorted(rng.integers(0, 180, 2))
+        sat = sorted(rng.integers(0, 256, 2))
+        val = sorted(rng.integers(0, 256, 2))
+        crop_x = sorted(rng.integers(0, width, 2))
+        crop_y = sorted(rng.integers(0, height, 2))
+        if rng.random() < 0.3:
+            crop_x, crop_y = (0, width), (0, height)
+        layers.append(
+            {
+                "mask_mode": rng.choice([MASK_MODE_INCLUDE, MASK_MODE_EXCLUDE]),
+                "hue_min": int(hue[0]),
+                "hue_max": int(hue[1]),
+                "sat_min": int(sat[0]),
+                "sat_max": int(sat[1]),
+                "val_min": int(val[0]),
+                "val_max": int(val[1]),
+                "grow": int(rng.choice([0, 0, 1, 2, 5, 20])),
+                "crop_left": int(crop_x[0]),
+                "crop_right": int(crop_x[1]),
+                "crop_top": int(crop_y[0]),
+                "crop_bottom": int(crop_y[1]),
+            }
+        )
+    return layers
+
+
+def render_layers_sequentially(image, layers):
+    mask = None
+    for layer in layers:
+        layer_mask = render_mask(
+            image,
+            **{k: v for k, v in layer.items() if k != "mask_mode"},
+        )
+        mask = combine_masks(layer["mask_mode"], layer_mask, mask)
+    return mask
+
+
+@pytest.mark.parametrize(
+    "count,seed",
+    [(1, 0), (1, 1), (2, 2), (5, 3), (8, 4), (9, 5), (16, 6), (17, 7), (32, 8)],
+)
+def test_compiled_layers__matches_sequential(count, seed):
+    image = load_frame()
+    layers = random_layers(count, seed)
+    assert_array_equal(
+        CompiledLayers(layers).render(image),
+        render_layers_sequentially(image, layers),
+    )
+
+
+def test_compiled_layers__wide_ranges():
+    image = load_frame()
+    layers = [
+        {
+            "mask_mode": MASK_MODE_INCLUDE,
+            "hue_min": 0,
+            "hue_max": 179,
+            "sat_min": 0,
+            "sat_max": 60,
+            "val_min": 150,
+            "val_max": 255,
+            "grow": 3,
+            "crop_left": 0,
+            "crop_right": 1080,
+            "crop_top": 0,
+            "crop_bottom": 720,
+        },
+        {
+            "mask_mode": MASK_MODE_EXCLUDE,
+            "hue_min": 0,
+            "hue_max": 179,
+            "sat_min": 0,
+            "sat_max": 255,
+            "val_min": 0,
+            "val_max": 255,
+            "grow": 0,
+            "crop_left": 100,
+            "crop_right": 300,
+            "crop_top": 50,
+            "crop_bottom": 400,
+        },
+    ]
+    assert_array_equal(
+        CompiledLayers(layers).render(image),
+        render_layers_sequentially(image, layers),
+    )
+
+
+def test_compiled_layers__empty_crop():
+    image = load_frame()
+    layers = random_layers(3, 9)
+    layers[1] |= {"crop_left": 500, "crop_right": 400}
+    assert_array_equal(
+        CompiledLayers(layers).render(image),
+        render_layers_sequentially(image, layers),
+    )
+
+
+def test_compiled_layers__classify():
+    image = np.zeros((1, 2, 3), np.uint8)
+    image[0, 1] = 255
+    layers = random_layers(2, 0, width=2, height=1)
+    for layer in layers:
+        layer |= {
+            "hue_min": 0,
+            "hue_max": 179,
+            "sat_min": 0,
+            "sat_max": 255,
+            "grow": 0,
+            "crop_left": 0,
+            "crop_right": 2,
+            "crop_top": 0,
+            "crop_bottom": 1,
+        }
+    layers[0] |= {"val_min": 0, "val_max": 255}
+    layers[1] |= {"val_min": 200, "val_max": 255}
+    assert_array_equal(CompiledLayers(layers).classify(image), [[0b01, 0b11]])
+
+
+@pytest.mark.parametrize(
+    "count,seed,top,bottom",
+    [(1, 10, 0, 720), (1, 11, 100, 140), (4, 12, 0, 50), (9, 13, 650, 720)],
+)
+def test_compiled_layers__render_rows(count, seed, top, bottom):
+    image = load_frame()
+    layers = random_layers(count, seed)
+    compiled = CompiledLayers(layers)
+    assert_array_equal(
+        compiled.render_rows(image, top, bottom),
+        render_layers_sequentially(image, layers)[top:bottom],
+    )
+
+
+def test_compiled_layers__layer_count():
+    with pytest.raises(ValueError):
+        CompiledLayers([])
+    with pytest.raises(ValueError):
+        CompiledLayers(random_layers(MAX_COMPILED_LAYERS + 1, 0))
+
+
+def test_layer_settings():
+    assert set(random_layers(1, 0)[0]) == set(LAYER_SETTINGS)
+
+
+def test_save_layers__roundtrip(tmp_path):
+    layers = random_layers(3, 0)
+    save_layers(tmp_path / "layers.json", [layer | {"mask": None} for layer in layers])
+    assert load_layers(tmp_path / "layers.json") == layers
+
+
+def test_load_layers__invalid(tmp_path):
+    path = tmp_path / "layers.json"
+    path.write_text('{"layers": []}')
+    with pytest.raises(ValueError):
+        load_layers(path)
+    path.write_text('{"layers": [{"mask_mode": "Include"}]}')
+    with pytest.raises(ValueError):
+        load_layers(path)
@@ -1,4 +1,9 @@
+import multiprocessing
+
 from cleancredits.cli import cli
 
 if __name__ == "__main__":
+    # Worker processes of the frozen (PyInstaller) app run this file again, and have to stop here
+    # rather than start another app.
+    multiprocessing.freeze_support()
     cli()
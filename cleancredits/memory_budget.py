@@ -0,0 +1,116 @@
+from .stages import DEFAULT_QUEUE_SIZE
+
+# Queues between the stages of a render that hold decoded frames: in front of inpainting and in front
+# of writing.
+PIPELINE_FRAME_QUEUES = 2
+# Frames a render holds besides the ones in its queues and the ones being inpainted: one being
+# decoded and one being written.
+PIPELINE_BUSY_FRAMES = 2
+
+
+def format_megabytes(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+class MemoryBudget(object):
+    """
+    MemoryBudget fits the parts of cleaning that hold whole frames into max_bytes of memory, given
+    how many bytes each frame takes (frame_bytes): the frames waiting in a render's queues and being
+    inpainted by its workers, the temporal method's window, and the GUI's playback queue. Only one of
+    them runs at a time, so each one gets the whole budget.
+
+    Each part asks for the size it would like, and gets it if it fits. Otherwise it shrinks, down to
+    1 frame at least: a render first shrinks its queues, which only costs speed when one stage is
+    much burstier than the others, and then its workers. If a part doesn't fit even then,
+    format_allocation says it's over budget. format_usage reports how much memory a render actually
+    used.
+    """
+
+    def __init__(self, max_bytes: int, frame_bytes: int):
+        self.max_bytes = max_bytes
+        self.frame_bytes = frame_bytes
+        # (description, bytes) for each part, by name.
+        self.allocations = {}
+
+    def get_frames(self) -> int:
+        """Return how many whole frames fit in the budget (at least 1)."""
+        return max(self.max_bytes // self.frame_bytes, 1)
+
+    def allocate(self, name: str, description: str, size: int, shrunk: bool):
+        if shrunk:
+            description += ", shrunk to fit"
+        self.allocations[name] = (description, size)
+
+    def get_pipeline(self, workers: int = 1, queue_size: int = DEFAULT_QUEUE_SIZE):
+        """Return (queue_size, workers) for a StagedPipeline render, shrunk to fit the budget."""
+        wanted = (queue_size, workers)
+
+        def get_frames():
+            return PIPELINE_FRAME_QUEUES * queue_size + workers + PIPELINE_BUSY_FRAMES
+
+        while get_frames() > self.get_frames() and queue_size > 1:
+            queue_size -= 1
+        while get_frames() > self.get_frames() and workers > 1:
+            workers -= 1
+        self.allocate(
+            "render",
+            f"render with {queue_size} frames per queue and {workers} inpaint workers",
+            get_frames() * self.frame_bytes,
+            (queue_size, workers) != wanted,
+        )
+        return queue_size, workers
+
+    def get_window(self, window: int) -> int:
+        """
+        Return how many frames the temporal method can take the background from. The window's
+        masks take a third of a (BGR) frame each.
+        """
+        fitted = max(min(window, self.get_frames() * 3 // 4), 1)
+        self.allocate(
+            "window",
+            f"temporal window of {fitted} frames",
+            fitted * self.frame_bytes * 4 // 3,
+            fitted < window,
+        )
+        return fitted
+
+    def get_playback_queue(self, queue_size: int) -> int:
+        """Return how many played frames can wait to be shown."""
+        fitted = max(min(queue_size, self.get_frames()), 1)
+        self.allocate(
+            "playback",
+            f"{fitted} frames queued for playback",
+            fitted * self.frame_bytes,
+            fitted < queue_size,
+        )
+        return fitted
+
+    def format_allocation(self) -> str:
+        parts = []
+        for description, size in self.allocations.values():
+            part = f"{description} ({format_megabytes(size)})"
+            if size > self.max_bytes:
+                part += ", over budget"
+            parts.append(part)
+        return (
+            f"Memory budget: {format_megabytes(self.max_bytes)}, "
+            f"{format_megabytes(self.frame_bytes)} per frame: "
+            f"{'; '.join(parts) or 'nothing to fit'}"
+        )
+
+    def format_usage(self, pipeline=None, pool=None) -> str:
+        """Return how much memory a render with this StagedPipeline and BufferPool used."""
+        parts = []
+        if pipeline is not None and pipeline.stages:
+            # The first stage's queue holds frame numbers or file names, not frames.
+            waiting = sum(stage.depth_max for stage in pipeline.stages[1:])
+            parts.append(
+                f"up to {waiting} frames waiting between stages "
+                f"({format_megabytes(waiting * self.frame_bytes)})"
+            )
+        if pool is not None:
+            parts.append(f"{format_megabytes(pool.pooled_bytes)} of pooled buffers")
+        return (
+            f"Memory used: {', '.join(parts) or 'nothing measured'} "
+            f"of a {format_megabytes(self.max_bytes)} budget"
+        )
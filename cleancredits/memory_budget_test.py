@@ -0,0 +1,74 @@
+import numpy as np
+
+from .buffers import BufferPool
+from .memory_budget import MemoryBudget
+from .stages import Stage, StagedPipeline
+
+MB = 1024 * 1024
+
+
+def test_memory_budget__get_pipeline():
+    budget = MemoryBudget(100 * MB, MB)
+    assert budget.get_pipeline(4) == (2, 4)
+    assert budget.allocations["render"] == (
+        "render with 2 frames per queue and 4 inpaint workers",
+        10 * MB,
+    )
+
+
+def test_memory_budget__get_pipeline__shrinks_queues_first():
+    budget = MemoryBudget(8 * MB, MB)
+    assert budget.get_pipeline(4, queue_size=4) == (1, 4)
+    assert budget.get_pipeline(8, queue_size=4) == (1, 4)
+    assert budget.allocations["render"][0].endswith(", shrunk to fit")
+
+
+def test_memory_budget__get_pipeline__over_budget():
+    budget = MemoryBudget(MB, 2 * MB)
+    assert budget.get_pipeline(4) == (1, 1)
+    assert "over budget" in budget.format_allocation()
+
+
+def test_memory_budget__get_window():
+    budget = MemoryBudget(100 * MB, MB)
+    assert budget.get_window(9) == 9
+    budget = MemoryBudget(8 * MB, MB)
+    # The masks take a third of a frame each.
+    assert budget.get_window(9) == 6
+    assert budget.allocations["window"] == (
+        "temporal window of 6 frames, shrunk to fit",
+        8 * MB,
+    )
+    assert MemoryBudget(MB, 2 * MB).get_window(9) == 1
+
+
+def test_memory_budget__get_playback_queue():
+    assert MemoryBudget(100 * MB, MB).get_playback_queue(4) == 4
+    assert MemoryBudget(3 * MB, MB).get_playback_queue(4) == 3
+
+
+def test_memory_budget__format_allocation():
+    budget = MemoryBudget(64 * MB, 2 * MB)
+    assert budget.format_allocation() == (
+        "Memory budget: 64.0 MB, 2.0 MB per frame: nothing to fit"
+    )
+    budget.get_pipeline()
+    budget.get_playback_queue(4)
+    assert budget.format_allocation() == (
+        "Memory budget: 64.0 MB, 2.0 MB per frame: "
+        "render with 2 frames per queue and 1 inpaint workers (14.0 MB); "
+        "4 frames queued for playback (8.0 MB)"
+    )
+
+
+def test_memory_budget__format_usage():
+    budget = MemoryBudget(64 * MB, MB)
+    pool = BufferPool()
+    pool.acquire((MB,))
+    pipeline = StagedPipeline()
+    list(pipeline.run(range(5), [Stage("decode", lambda item: np.zeros(1))]))
+    assert budget.format_usage(pipeline, pool).startswith("Memory used: up to 0 frames")
+    assert budget.format_usage(pipeline, pool).endswith(
+        "1.0 MB of pooled buffers of a 64.0 MB budget"
+    )
+    assert budget.format_usage() == "Memory used: nothing measured of a 64.0 MB budget"
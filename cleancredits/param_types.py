@@ -55,3 +55,15 @@ def timecode_to_frame(timecode, fps, default=None):
     if times["frames"]:
         frame_num += int(times["frames"])
     return frame_num
+
+
+def frame_to_timecode(frame_num, fps):
+    """Return a timecode (HH:MM:SS:frame) that timecode_to_frame converts back to frame_num."""
+    seconds = int(frame_num / fps)
+    # Floating point error can put the whole seconds just past the frame.
+    while seconds > 0 and math.floor(seconds * fps) > frame_num:
+        seconds -= 1
+    frames = frame_num - math.floor(seconds * fps)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}:{frames:02d}"
@@ -1,7 +1,7 @@
 import click
 import pytest
 
-from .param_types import FRAMERATE, TIMECODE
+from .param_types import FRAMERATE, TIMECODE, frame_to_timecode, timecode_to_frame
 
 
 def test_timecode_param_type__valid_timecode():
@@ -74,3 +74,24 @@ def test_framerate_param_type__invalid_framerate__float_string():
     value = "23.976"
     with pytest.raises(click.BadParameter):
         FRAMERATE.convert(value, None, None)
+
+
+@pytest.mark.parametrize(
+    "frame_num,fps,expected",
+    [
+        (0, 25, "00:00:00:00"),
+        (30, 25, "00:00:01:05"),
+        (25 * 3661 + 3, 25, "01:01:01:03"),
+        (1000, 24000 / 1001, "00:00:41:17"),
+    ],
+)
+def test_frame_to_timecode(frame_num, fps, expected):
+    timecode = frame_to_timecode(frame_num, fps)
+    assert timecode == expected
+    assert timecode_to_frame(timecode, fps) == frame_num
+
+
+def test_frame_to_timecode__round_trip():
+    fps = 30000 / 1001
+    for frame_num in range(0, 10000, 7):
+        assert timecode_to_frame(frame_to_timecode(frame_num, fps), fps) == frame_num
@@ -0,0 +1,433 @@
+import json
+import pathlib
+import shlex
+from fractions import Fraction
+
+import cv2
+import ffmpeg
+import numpy as np
+
+from .helpers import (
+    INPAINT_METHOD_TELEA,
+    INPAINT_METHOD_TEMPORAL,
+    OUTPUT_VIDEO_KWARGS,
+    SPLIT_FRAME_FILENAME,
+    get_threads_kwargs,
+    set_framerate,
+)
+from .inpaint import InpaintPlan, get_inpaint_region
+from .temporal import DEFAULT_TEMPORAL_WINDOW, TemporalInpainter
+
+# Split the range into frame images, clean each one, and join them back together.
+PIPELINE_FRAMES = "frames"
+# Have ffmpeg crop the area around the mask out of the source, clean only that, and overlay the
+# cleaned patch back onto the source in the final encode.
+PIPELINE_CROP = "crop"
+# Clean the planar YUV 4:2:0 frames that ffmpeg decodes, without converting them to BGR and back: the
+# Y plane is inpainted at full resolution and the U and V planes at quarter resolution.
+PIPELINE_YUV = "yuv"
+PIPELINES = (PIPELINE_FRAMES, PIPELINE_CROP, PIPELINE_YUV)
+
+# RGBA formats that cleaned patches can be exported in for compositing.
+PATCH_FORMAT_PNG = "png"
+PATCH_FORMAT_QTRLE = "qtrle"
+PATCH_FORMAT_PRORES = "prores"
+PATCH_FORMATS = (PATCH_FORMAT_PNG, PATCH_FORMAT_QTRLE, PATCH_FORMAT_PRORES)
+PATCH_FORMAT_KWARGS = {
+    PATCH_FORMAT_PNG: {"vcodec": "png", "pix_fmt": "rgba"},
+    # QuickTime Animation
+    PATCH_FORMAT_QTRLE: {"vcodec": "qtrle", "pix_fmt": "argb"},
+    # ProRes 4444
+    PATCH_FORMAT_PRORES: {
+        "vcodec": "prores_ks",
+        "profile:v": "4444",
+        "pix_fmt": "yuva444p10le",
+    },
+}
+
+
+def get_patch_region(mask, radius: int):
+    """
+    Return (top, bottom, left, right) of the patch the crop pipeline cleans: the inpaint region,
+    grown to even coordinates so that it lines up with 4:2:0 chroma. Returns None if the mask is empty.
+    """
+    region = get_inpaint_region(mask, radius)
+    if region is None:
+        return None
+    top, bottom, left, right = region
+    frame_height, frame_width = mask.shape[:2]
+    top -= top % 2
+    left -= left % 2
+    bottom = min(bottom + bottom % 2, frame_height)
+    right = min(right + right % 2, frame_width)
+    return top, bottom, left, right
+
+
+def get_input_framerate(video_file) -> Fraction:
+    cap = cv2.VideoCapture(str(video_file))
+    # Patches need the same timestamps as the source so that overlay pairs them up. OpenCV only gives
+    # the framerate as a float, so turn it back into a ratio like 24000/1001.
+    framerate = Fraction(cap.get(cv2.CAP_PROP_FPS)).limit_denominator(1001)
+    cap.release()
+    return framerate
+
+
+def get_time_kwargs(start=None, end=None) -> dict:
+    kwargs = {}
+    if start:
+        kwargs["ss"] = start
+    if end:
+        kwargs["to"] = end
+    return kwargs
+
+
+def decode_patches(
+    video_file: pathlib.Path, region, start=None, end=None, threads: int = None
+):
+    """
+    Start an ffmpeg process (decoding with threads threads, if set) that writes the region of each
+    frame to stdout as raw BGR video.
+    """
+    top, bottom, left, right = region
+    decode = (
+        ffmpeg.input(
+            str(video_file),
+            **get_time_kwargs(start, end),
+            **get_threads_kwargs(threads),
+        )
+        .video.crop(left, top, right - left, bottom - top)
+        .output("pipe:", format="rawvideo", pix_fmt="bgr24")
+    )
+    print(f"Decoding patches: {shlex.join(ffmpeg.compile(decode))}")
+    return decode.run_async(pipe_stdout=True)
+
+
+def read_patches(process, width: int, height: int):
+    """Yield each BGR patch that an ffmpeg process writes to stdout as raw video."""
+    frame_size = width * height * 3
+    while True:
+        data = process.stdout.read(frame_size)
+        if len(data) < frame_size:
+            return
+        yield np.frombuffer(data, np.uint8).reshape(height, width, 3)
+
+
+def clean_patches(
+    patches,
+    patch_mask,
+    radius: int,
+    method: str = INPAINT_METHOD_TELEA,
+    window: int = DEFAULT_TEMPORAL_WINDOW,
+):
+    """Yield each of the patches (in order) cleaned with patch_mask."""
+    if method == INPAINT_METHOD_TEMPORAL:
+        inpainter = TemporalInpainter(radius, window)
+        for patch in patches:
+            for _, cleaned in inpainter.push(patch, patch_mask):
+                yield cleaned
+        for _, cleaned in inpainter.flush():
+            yield cleaned
+    elif method == INPAINT_METHOD_TELEA:
+        plan = InpaintPlan(patch_mask, radius)
+        for patch in patches:
+            yield plan.inpaint(patch)
+    else:
+        raise ValueError(f"Unknown inpaint method: {method}")
+
+
+def write_patches(encoder, patches) -> int:
+    """
+    Write each patch to an ffmpeg process's stdin as raw video, then wait for it to finish. Returns
+    the number of patches.
+    """
+    frame_count = 0
+    try:
+        for patch in patches:
+            encoder.stdin.write(memoryview(np.ascontiguousarray(patch)))
+            frame_count += 1
+    finally:
+        encoder.stdin.close()
+        encoder.wait()
+    if encoder.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with code {encoder.returncode}")
+    return frame_count
+
+
+def crop_clean(
+    video_file: pathlib.Path,
+    out_file: pathlib.Path,
+    mask,
+    radius: int,
+    method: str = INPAINT_METHOD_TELEA,
+    window: int = DEFAULT_TEMPORAL_WINDOW,
+    start=None,
+    end=None,
+    framerate: str = None,
+    overwrite_output: bool = False,
+    decode_threads: int = None,
+    encode_threads: int = None,
+):
+    """
+    Clean the video between the start and end times with the crop pipeline, and write it to out_file.
+    Only the patch around the mask is decoded into Python, cleaned, and sent back to ffmpeg, so the
+    work done in Python scales with the size of the mask rather than the size of the frame. Inpainting
+    the patch gives the same result as inpainting the whole frame. decode_threads and encode_threads
+    limit ffmpeg's decoder and encoder.
+
+    Returns the number of frames that were cleaned.
+    """
+    if method not in (INPAINT_METHOD_TELEA, INPAINT_METHOD_TEMPORAL):
+        raise ValueError(f"Unknown inpaint method: {method}")
+    region = get_patch_region(mask, radius)
+    source = ffmpeg.input(
+        str(video_file),
+        **get_time_kwargs(start, end),
+        **get_threads_kwargs(decode_threads),
+    ).video
+    if region is None:
+        # Nothing to clean, so just re-encode the range.
+        stream = source
+        if framerate:
+            stream = set_framerate(stream, framerate)
+        stream.output(
+            str(out_file), **OUTPUT_VIDEO_KWARGS, **get_threads_kwargs(encode_threads)
+        ).run(overwrite_output=overwrite_output)
+        return 0
+
+    top, bottom, left, right = region
+    width, height = right - left, bottom - top
+    patch_mask = np.ascontiguousarray(mask[top:bottom, left:right])
+    patches = ffmpeg.input(
+        "pipe:",
+        format="rawvideo",
+        pix_fmt="bgr24",
+        s=f"{width}x{height}",
+        framerate=str(get_input_framerate(video_file)),
+    )
+    stream = ffmpeg.overlay(source, patches, x=left, y=top, eof_action="pass")
+    if framerate:
+        stream = set_framerate(stream, framerate)
+    encode = stream.output(
+        str(out_file), **OUTPUT_VIDEO_KWARGS, **get_threads_kwargs(encode_threads)
+    )
+    if overwrite_output:
+        encode = encode.overwrite_output()
+    print(f"Encoding with patches: {shlex.join(ffmpeg.compile(encode))}")
+
+    decoder = decode_patches(video_file, region, start, end, decode_threads)
+    encoder = encode.run_async(pipe_stdin=True)
+    try:
+        return write_patches(
+            encoder,
+            clean_patches(
+                read_patches(decoder, width, height), patch_mask, radius, method, window
+            ),
+        )
+    finally:
+        decoder.stdout.close()
+        decoder.wait()
+
+
+def get_chroma_mask(mask):
+    """
+    Return mask at the resolution of 4:2:0 chroma planes (half the width and height, rounded up).
+    A chroma pixel is masked if any of the luma pixels it covers are.
+    """
+    height, width = mask.shape[:2]
+    padded = np.pad(mask, ((0, height % 2), (0, width % 2)))
+    return padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).max(
+        axis=(1, 3)
+    )
+
+
+def read_yuv420_frames(process, width: int, height: int):
+    """
+    Yield (frame, y, u, v) for each frame that an ffmpeg process writes to stdout as raw yuv420p
+    video, where y, u and v are views of the planes in frame. The same buffer is reused for every
+    frame, so each frame has to be used before asking for the next one.
+    """
+    chroma_width, chroma_height = (width + 1) // 2, (height + 1) // 2
+    luma_size = width * height
+    chroma_size = chroma_width * chroma_height
+    frame = np.empty(luma_size + 2 * chroma_size, np.uint8)
+    y = frame[:luma_size].reshape(height, width)
+    u = frame[luma_size : luma_size + chroma_size].reshape(chroma_height, chroma_width)
+    v = frame[luma_size + chroma_size :].reshape(chroma_height, chroma_width)
+    buffer = memoryview(frame)
+    while True:
+        read = 0
+        while read < len(frame):
+            n = process.stdout.readinto(buffer[read:])
+            if not n:
+                return
+            read += n
+        yield frame, y, u, v
+
+
+def yuv_clean(
+    video_file: pathlib.Path,
+    out_file: pathlib.Path,
+    mask,
+    radius: int,
+    start=None,
+    end=None,
+    framerate: str = None,
+    overwrite_output: bool = False,
+    decode_threads: int = None,
+    encode_threads: int = None,
+):
+    """
+    Clean the video between the start and end times with the yuv pipeline, and write it to out_file.
+    Frames are decoded to planar YUV 4:2:0 and sent back to the encoder in the same format, so there
+    is no color conversion. The Y plane is inpainted with the mask, and the quarter resolution U and V
+    planes with the mask scaled down to match (and half the radius), so each frame is 1.5 planes of
+    work rather than 3. decode_threads and encode_threads limit ffmpeg's decoder and encoder.
+
+    Returns the number of frames that were cleaned.
+    """
+    height, width = mask.shape[:2]
+    luma_plan = InpaintPlan(mask, radius)
+    chroma_plan = InpaintPlan(get_chroma_mask(mask), max((radius + 1) // 2, 1))
+
+    decode = ffmpeg.input(
+        str(video_file),
+        **get_time_kwargs(start, end),
+        **get_threads_kwargs(decode_threads),
+    ).output("pipe:", format="rawvideo", pix_fmt="yuv420p")
+    stream = ffmpeg.input(
+        "pipe:",
+        format="rawvideo",
+        pix_fmt="yuv420p",
+        s=f"{width}x{height}",
+        framerate=str(get_input_framerate(video_file)),
+    )
+    if framerate:
+        stream = set_framerate(stream, framerate)
+    encode = stream.output(
+        str(out_file), **OUTPUT_VIDEO_KWARGS, **get_threads_kwargs(encode_threads)
+    )
+    if overwrite_output:
+        encode = encode.overwrite_output()
+    print(f"Decoding frames: {shlex.join(ffmpeg.compile(decode))}")
+    print(f"Encoding frames: {shlex.join(ffmpeg.compile(encode))}")
+
+    def clean(frames):
+        for frame, y, u, v in frames:
+            luma_plan.inpaint_in_place(y)
+            chroma_plan.inpaint_in_place(u)
+            chroma_plan.inpaint_in_place(v)
+            yield frame
+
+    decoder = decode.run_async(pipe_stdout=True)
+    encoder = encode.run_async(pipe_stdin=True)
+    try:
+        return write_patches(encoder, clean(read_yuv420_frames(decoder, width, height)))
+    finally:
+        decoder.stdout.close()
+        decoder.wait()
+
+
+def get_patch_sidecar_path(out_path) -> pathlib.Path:
+    """Return where the sidecar for a patch exported to out_path (a file or a directory) goes."""
+    return pathlib.Path(f"{out_path}.json")
+
+
+def export_patch(
+    video_file: pathlib.Path,
+    out_path: pathlib.Path,
+    mask,
+    radius: int,
+    patch_format: str = PATCH_FORMAT_QTRLE,
+    method: str = INPAINT_METHOD_TELEA,
+    window: int = DEFAULT_TEMPORAL_WINDOW,
+    start=None,
+    end=None,
+    start_frame: int = 0,
+    framerate: str = None,
+    overwrite_output: bool = False,
+    decode_threads: int = None,
+    encode_threads: int = None,
+):
+    """
+    Clean the video between the start and end times, and write only the cleaned patch around the mask
+    as RGBA video for compositing: as a directory of PNGs (PATCH_FORMAT_PNG) or a QuickTime file.
+    Alpha is opaque where the mask is, and transparent elsewhere. A JSON sidecar next to out_path says
+    where the patch goes in the frame, and which frames it covers. decode_threads and encode_threads
+    limit ffmpeg's decoder and encoder.
+
+    Returns the number of frames that were exported, or None if the mask is empty.
+    """
+    if patch_format not in PATCH_FORMATS:
+        raise ValueError(f"Unknown patch format: {patch_format}")
+    if method not in (INPAINT_METHOD_TELEA, INPAINT_METHOD_TEMPORAL):
+        raise ValueError(f"Unknown inpaint method: {method}")
+    region = get_patch_region(mask, radius)
+    if region is None:
+        return None
+    top, bottom, left, right = region
+    width, height = right - left, bottom - top
+    patch_mask = np.ascontiguousarray(mask[top:bottom, left:right])
+    if not framerate:
+        framerate = str(get_input_framerate(video_file))
+
+    out_path = pathlib.Path(out_path)
+    if patch_format == PATCH_FORMAT_PNG:
+        out_path.mkdir(parents=True, exist_ok=True)
+        output = out_path / SPLIT_FRAME_FILENAME
+    else:
+        output = out_path
+    encode = ffmpeg.input(
+        "pipe:",
+        format="rawvideo",
+        pix_fmt="bgra",
+        s=f"{width}x{height}",
+        framerate=framerate,
+    ).output(
+        str(output),
+        **PATCH_FORMAT_KWARGS[patch_format],
+        **get_threads_kwargs(encode_threads),
+    )
+    if overwrite_output:
+        encode = encode.overwrite_output()
+    print(f"Encoding patch: {shlex.join(ffmpeg.compile(encode))}")
+
+    decoder = decode_patches(video_file, region, start, end, decode_threads)
+    encoder = encode.run_async(pipe_stdin=True)
+    alpha = patch_mask[:, :, None]
+    try:
+        frame_count = write_patches(
+            encoder,
+            (
+                np.concatenate([cleaned, alpha], axis=2)
+                for cleaned in clean_patches(
+                    read_patches(decoder, width, height),
+                    patch_mask,
+                    radius,
+                    method,
+                    window,
+                )
+            ),
+        )
+    finally:
+        decoder.stdout.close()
+        decoder.wait()
+
+    frame_height, frame_width = mask.shape[:2]
+    with open(get_patch_sidecar_path(out_path), "w") as f:
+        json.dump(
+            {
+                "x": left,
+                "y": top,
+                "width": width,
+                "height": height,
+                "frame_width": frame_width,
+                "frame_height": frame_height,
+                "start_frame": start_frame,
+                "frame_count": frame_count,
+                "framerate": framerate,
+                "format": patch_format,
+            },
+            f,
+            indent=2,
+        )
+    return frame_count
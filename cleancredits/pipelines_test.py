@@ -0,0 +1,205 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from .helpers import INPAINT_METHOD_TELEA, INPAINT_METHOD_TEMPORAL
+from .helpers_test import TESTDATA_PATH
+from .pipelines import (
+    PATCH_FORMAT_PNG,
+    PATCH_FORMAT_PRORES,
+    PATCH_FORMAT_QTRLE,
+    crop_clean,
+    export_patch,
+    get_chroma_mask,
+    get_patch_region,
+    get_patch_sidecar_path,
+    yuv_clean,
+)
+
+VIDEO_PATH = TESTDATA_PATH / "horses-720p.mp4"
+
+
+def load_mask():
+    mask = cv2.imread(str(TESTDATA_PATH / "horses-720p-mask.png"), cv2.IMREAD_GRAYSCALE)
+    _, mask = cv2.threshold(mask, 1, 255, cv2.THRESH_BINARY)
+    return mask
+
+
+def read_frames(path):
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            return frames
+        frames.append(frame)
+
+
+def test_get_patch_region():
+    mask = np.zeros((20, 30), np.uint8)
+    mask[7:9, 11:14] = 255
+    # The inpaint region is rows 2-14 and columns 6-19 (radius 3 plus padding 2), grown to even
+    # coordinates.
+    assert get_patch_region(mask, 3) == (2, 14, 6, 20)
+
+
+def test_get_patch_region__edges():
+    mask = np.zeros((20, 30), np.uint8)
+    mask[18:, 27:] = 255
+    assert get_patch_region(mask, 3) == (12, 20, 22, 30)
+
+
+def test_get_patch_region__empty():
+    assert get_patch_region(np.zeros((20, 30), np.uint8), 3) is None
+
+
+@pytest.mark.parametrize("method", [INPAINT_METHOD_TELEA, INPAINT_METHOD_TEMPORAL])
+def test_crop_clean(tmp_path, method):
+    mask = np.zeros((720, 1080), np.uint8)
+    mask[600:650, 300:700] = 255
+    out_file = tmp_path / "out.mp4"
+    frame_count = crop_clean(
+        VIDEO_PATH, out_file, mask, 3, method=method, window=3, end="0.4s"
+    )
+    assert frame_count == 10
+    source = read_frames(VIDEO_PATH)[:10]
+    cleaned = read_frames(out_file)
+    assert len(cleaned) == 10
+    top, bottom, left, right = get_patch_region(mask, 3)
+    for source_frame, cleaned_frame in zip(source, cleaned):
+        diff = cv2.absdiff(source_frame, cleaned_frame)
+        # Outside the patch, the only differences come from encoding.
+        outside = diff.copy()
+        outside[top:bottom, left:right] = 0
+        assert outside.mean() < 3
+        # Patches line up with the source frames they were cropped from. Patches are converted to
+        # BGR and back, so they differ a little more than the rest of the frame.
+        patch_diff = diff[top:bottom, left:right]
+        assert patch_diff[mask[top:bottom, left:right] == 0].mean() < 6
+        assert diff[mask > 0].mean() > outside.mean()
+
+
+def test_crop_clean__empty_mask(tmp_path):
+    out_file = tmp_path / "out.mp4"
+    frame_count = crop_clean(
+        VIDEO_PATH, out_file, np.zeros((720, 1080), np.uint8), 3, end="0.4s"
+    )
+    assert frame_count == 0
+    assert len(read_frames(out_file)) == 10
+
+
+def test_crop_clean__unknown_method(tmp_path):
+    with pytest.raises(ValueError):
+        crop_clean(VIDEO_PATH, tmp_path / "out.mp4", load_mask(), 3, method="foo")
+
+
+def test_get_chroma_mask():
+    mask = np.zeros((5, 7), np.uint8)
+    mask[1, 2] = 255
+    mask[4, 6] = 255
+    expected = np.zeros((3, 4), np.uint8)
+    expected[0, 1] = 255
+    expected[2, 3] = 255
+    assert_array_equal(get_chroma_mask(mask), expected)
+
+
+def test_yuv_clean(tmp_path):
+    mask = np.zeros((720, 1080), np.uint8)
+    mask[600:650, 300:700] = 255
+    out_file = tmp_path / "out.mp4"
+    assert yuv_clean(VIDEO_PATH, out_file, mask, 3, end="0.4s") == 10
+    source = read_frames(VIDEO_PATH)[:10]
+    cleaned = read_frames(out_file)
+    assert len(cleaned) == 10
+    for source_frame, cleaned_frame in zip(source, cleaned):
+        diff = cv2.absdiff(source_frame, cleaned_frame)
+        # Outside the mask, the only differences come from encoding.
+        assert diff[mask == 0].mean() < 3
+        assert diff[mask > 0].mean() > 10 * diff[mask == 0].mean()
+
+
+def test_yuv_clean__threads(tmp_path):
+    mask = np.zeros((720, 1080), np.uint8)
+    mask[600:650, 300:700] = 255
+    out_file = tmp_path / "out.mp4"
+    frame_count = yuv_clean(
+        VIDEO_PATH, out_file, mask, 3, end="0.4s", decode_threads=1, encode_threads=1
+    )
+    assert frame_count == 10
+    assert len(read_frames(out_file)) == 10
+
+
+def test_yuv_clean__matches_bgr(tmp_path):
+    # Cleaning the planes gives nearly the same result as cleaning BGR frames.
+    mask = np.zeros((720, 1080), np.uint8)
+    mask[600:650, 300:700] = 255
+    yuv_file = tmp_path / "yuv.mp4"
+    crop_file = tmp_path / "crop.mp4"
+    yuv_clean(VIDEO_PATH, yuv_file, mask, 3, end="0.2s")
+    crop_clean(VIDEO_PATH, crop_file, mask, 3, end="0.2s")
+    for yuv_frame, crop_frame in zip(read_frames(yuv_file), read_frames(crop_file)):
+        assert cv2.absdiff(yuv_frame, crop_frame)[mask > 0].mean() < 8
+
+
+def test_export_patch__png(tmp_path):
+    mask = np.zeros((720, 1080), np.uint8)
+    mask[600:650, 300:700] = 255
+    out_path = tmp_path / "patch"
+    frame_count = export_patch(
+        VIDEO_PATH,
+        out_path,
+        mask,
+        3,
+        patch_format=PATCH_FORMAT_PNG,
+        end="0.4s",
+        start_frame=0,
+    )
+    assert frame_count == 10
+    top, bottom, left, right = get_patch_region(mask, 3)
+    patch_files = sorted(out_path.iterdir())
+    assert len(patch_files) == 10
+    patch = cv2.imread(str(patch_files[0]), cv2.IMREAD_UNCHANGED)
+    assert patch.shape == (bottom - top, right - left, 4)
+    assert_array_equal(patch[:, :, 3], mask[top:bottom, left:right])
+    # Outside the mask, the patch is the source frame (up to differences in YUV to BGR conversion).
+    source = read_frames(VIDEO_PATH)[0][top:bottom, left:right]
+    outside = mask[top:bottom, left:right] == 0
+    diff = cv2.absdiff(patch[:, :, :3], source)
+    assert diff[outside].mean() < 3
+
+    with open(get_patch_sidecar_path(out_path)) as f:
+        sidecar = json.load(f)
+    assert sidecar == {
+        "x": left,
+        "y": top,
+        "width": right - left,
+        "height": bottom - top,
+        "frame_width": 1080,
+        "frame_height": 720,
+        "start_frame": 0,
+        "frame_count": 10,
+        "framerate": "25",
+        "format": PATCH_FORMAT_PNG,
+    }
+
+
+@pytest.mark.parametrize("patch_format", [PATCH_FORMAT_QTRLE, PATCH_FORMAT_PRORES])
+def test_export_patch__quicktime(tmp_path, patch_format):
+    out_path = tmp_path / "patch.mov"
+    frame_count = export_patch(
+        VIDEO_PATH, out_path, load_mask(), 3, patch_format=patch_format, end="0.2s"
+    )
+    assert frame_count == 5
+    assert out_path.is_file()
+    assert get_patch_sidecar_path(out_path).is_file()
+
+
+def test_export_patch__empty_mask(tmp_path):
+    assert (
+        export_patch(VIDEO_PATH, tmp_path / "patch", np.zeros((720, 1080), np.uint8), 3)
+        is None
+    )
+    assert not get_patch_sidecar_path(tmp_path / "patch").exists()
@@ -0,0 +1,153 @@
+import threading
+import time
+
+import numpy as np
+
+# Seconds per megapixel of mask, per megapixel of box, and per call that inpainting an area starts
+# out estimated to take (measured with Telea at radius 3). CostModel refines these as it goes.
+DEFAULT_COST_COEFFICIENTS = (0.5, 0.35, 0.00005)
+# How many measured timings the default coefficients count for.
+COST_PRIOR_WEIGHT = 10.0
+# Each chunk of tasks a thread takes is about this fraction of the remaining work per thread, so
+# chunks get smaller towards the end of a run.
+CHUNK_FRACTION = 0.5
+
+
+def get_inpaint_features(mask) -> np.array:
+    """Return the features CostModel uses to estimate the cost of inpainting with mask."""
+    return np.array([np.count_nonzero(mask) / 1e6, mask.size / 1e6, 1.0])
+
+
+class CostModel(object):
+    """
+    CostModel estimates how long a task takes from cheap statistics of it (features, such as from
+    get_inpaint_features): the default coefficients times the features, each scaled by a weight.
+    The weights start at 1 and are fitted to the measured timings with least squares as they come in,
+    relative to the estimate so that small and large tasks count the same.
+    """
+
+    def __init__(
+        self,
+        coefficients=DEFAULT_COST_COEFFICIENTS,
+        prior_weight: float = COST_PRIOR_WEIGHT,
+    ):
+        self.coefficients = np.array(coefficients, float)
+        self.weights = np.ones(len(coefficients))
+        self.xtx = np.eye(len(coefficients)) * prior_weight
+        self.xty = self.weights * prior_weight
+        self.lock = threading.Lock()
+        self.samples = 0
+        # Totals of |estimate - measured| and of the measured timings, for the estimates' error.
+        self.error_total = 0.0
+        self.measured_total = 0.0
+
+    def estimate(self, features) -> float:
+        cost = float(np.dot(self.weights * self.coefficients, features))
+        # Weights can be fitted below 0, but nothing takes no time.
+        return max(cost, 1e-6)
+
+    def record(self, features, seconds: float):
+        """Refine the model with how long a task with these features took."""
+        terms = self.coefficients * features
+        default = terms.sum()
+        if default <= 0:
+            return
+        row = terms / default
+        with self.lock:
+            self.error_total += abs(self.estimate(features) - seconds)
+            self.measured_total += seconds
+            self.samples += 1
+            self.xtx += np.outer(row, row)
+            self.xty += row * (seconds / default)
+            self.weights = np.linalg.solve(self.xtx, self.xty)
+
+    def get_error(self) -> float:
+        """Return the estimates' total error, as a fraction of the total time measured."""
+        return self.error_total / self.measured_total if self.measured_total else 0.0
+
+
+class BalancedScheduler(object):
+    """
+    BalancedScheduler runs tasks of uneven cost on a number of threads so that they finish at about
+    the same time. Tasks are handed out most expensive first (as estimated by a CostModel), so that a
+    big task never starts last and leaves the other threads idle. They're handed out in chunks of
+    about CHUNK_FRACTION of the remaining work per thread, so that lots of small tasks don't each pay
+    to be handed out, while the chunks at the end are small enough to even the threads out.
+
+    Each task's measured time refines the model, and format_stats reports how balanced the threads
+    were since the last reset_stats.
+    """
+
+    def __init__(self, model=None):
+        self.model = CostModel() if model is None else model
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Start counting runs and balance again, while keeping what the model has learned."""
+        with self.lock:
+            self.runs = 0
+            self.tasks = 0
+            # Total time threads were busy, and the total of the slowest thread's time in each run
+            # times the number of threads. The ratio is how balanced the threads were.
+            self.busy_total = 0.0
+            self.span_total = 0.0
+
+    def run(self, executor, threads: int, tasks, features) -> list:
+        """
+        Call each task (a function with no arguments) on up to threads threads of executor, and
+        return their results in the same order. features are the tasks' features for the model.
+        """
+        costs = [self.model.estimate(f) for f in features]
+        order = sorted(range(len(tasks)), key=lambda i: costs[i], reverse=True)
+        threads = max(min(threads, len(tasks)), 1)
+        results = [None] * len(tasks)
+        lock = threading.Lock()
+        state = {"next": 0, "remaining": sum(costs)}
+
+        def take_chunk() -> list:
+            with lock:
+                target = state["remaining"] / threads * CHUNK_FRACTION
+                chunk = []
+                chunk_cost = 0.0
+                while state["next"] < len(order):
+                    i = order[state["next"]]
+                    if chunk and chunk_cost + costs[i] > target:
+                        break
+                    chunk.append(i)
+                    chunk_cost += costs[i]
+                    state["next"] += 1
+                state["remaining"] -= chunk_cost
+                return chunk
+
+        def work(_) -> float:
+            busy = 0.0
+            while True:
+                chunk = take_chunk()
+                if not chunk:
+                    return busy
+                for i in chunk:
+                    start = time.perf_counter()
+                    results[i] = tasks[i]()
+                    elapsed = time.perf_counter() - start
+                    busy += elapsed
+                    self.model.record(features[i], elapsed)
+
+        busy = list(executor.map(work, range(threads)))
+        with self.lock:
+            self.runs += 1
+            self.tasks += len(tasks)
+            self.busy_total += sum(busy)
+            self.span_total += max(busy) * threads
+        return results
+
+    def get_balance(self) -> float:
+        """Return the threads' busy time as a fraction of the time the slowest thread took."""
+        return self.busy_total / self.span_total if self.span_total else 1.0
+
+    def format_stats(self) -> str:
+        return (
+            f"Group scheduling: {self.tasks} groups in {self.runs} frames, "
+            f"{self.get_balance():.0%} balanced across threads, "
+            f"cost estimates off by {self.model.get_error():.0%}"
+        )
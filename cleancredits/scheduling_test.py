@@ -0,0 +1,117 @@
+import concurrent.futures
+import threading
+
+import numpy as np
+import pytest
+
+from .scheduling import BalancedScheduler, CostModel, get_inpaint_features
+
+
+def test_get_inpaint_features():
+    mask = np.zeros((1000, 2000), np.uint8)
+    mask[:500, :100] = 255
+    assert list(get_inpaint_features(mask)) == [0.05, 2.0, 1.0]
+
+
+def test_cost_model__record():
+    model = CostModel(coefficients=(1.0, 0.0, 0.001), prior_weight=1.0)
+    features = np.array([0.01, 0.0, 1.0])
+    assert model.estimate(features) == pytest.approx(0.011)
+    # Inpainting is actually 3 times as slow as the defaults say.
+    for _ in range(50):
+        model.record(features, 0.033)
+    assert model.estimate(features) == pytest.approx(0.033, rel=0.05)
+    assert model.samples == 50
+    assert 0 < model.get_error() < 0.5
+
+
+def test_cost_model__no_samples():
+    model = CostModel()
+    assert model.get_error() == 0.0
+    assert model.estimate(np.zeros(3)) > 0
+
+
+def test_balanced_scheduler__order():
+    scheduler = BalancedScheduler()
+    started = []
+    lock = threading.Lock()
+
+    def get_task(i):
+        def task():
+            with lock:
+                started.append(i)
+            return i * 10
+
+        return task
+
+    sizes = [1, 50, 5, 200, 20]
+    features = [np.array([size / 1e3, size / 1e3, 1.0]) for size in sizes]
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        results = scheduler.run(
+            executor, 1, [get_task(i) for i in range(len(sizes))], features
+        )
+    assert results == [0, 10, 20, 30, 40]
+    # The most expensive tasks are started first.
+    assert started == [3, 1, 4, 2, 0]
+    assert scheduler.runs == 1
+    assert scheduler.tasks == 5
+    assert scheduler.model.samples == 5
+
+
+def test_balanced_scheduler__threads():
+    scheduler = BalancedScheduler()
+    thread_names = set()
+    lock = threading.Lock()
+
+    def task():
+        with lock:
+            thread_names.add(threading.current_thread().name)
+        return threading.current_thread().name
+
+    features = [np.array([0.01, 0.01, 1.0])] * 40
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        results = scheduler.run(executor, 4, [task] * 40, features)
+    assert len(results) == 40
+    assert set(results) == thread_names
+    assert len(thread_names) <= 4
+    assert 0 < scheduler.get_balance() <= 1
+
+
+def test_balanced_scheduler__fewer_tasks_than_threads():
+    scheduler = BalancedScheduler()
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        results = scheduler.run(
+            executor, 8, [lambda: 1, lambda: 2], [np.array([0.0, 0.0, 1.0])] * 2
+        )
+    assert results == [1, 2]
+
+
+def test_balanced_scheduler__error():
+    scheduler = BalancedScheduler()
+
+    def fail():
+        raise ValueError("inpainting failed")
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValueError, match="inpainting failed"):
+            scheduler.run(executor, 2, [fail, fail], [np.array([0.0, 0.0, 1.0])] * 2)
+
+
+def test_balanced_scheduler__format_stats():
+    scheduler = BalancedScheduler()
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        scheduler.run(executor, 2, [lambda: 1] * 3, [np.array([0.0, 0.0, 1.0])] * 3)
+    assert scheduler.format_stats().startswith(
+        "Group scheduling: 3 groups in 1 frames, "
+    )
+
+
+def test_balanced_scheduler__reset_stats():
+    scheduler = BalancedScheduler()
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        scheduler.run(executor, 2, [lambda: 1] * 3, [np.array([0.0, 0.0, 1.0])] * 3)
+    scheduler.reset_stats()
+    assert (scheduler.runs, scheduler.tasks) == (0, 0)
+    assert scheduler.get_balance() == 1.0
+    # The model keeps what it learned.
+    assert scheduler.model.samples == 3
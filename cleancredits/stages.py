@@ -0,0 +1,187 @@
+import queue
+import threading
+import time
+
+# How many items can wait between two stages. Items are usually frames, so this caps how many frames
+# are in memory at once: a stage that falls behind makes the stages before it wait.
+DEFAULT_QUEUE_SIZE = 2
+# How often (in seconds) threads that are waiting on a queue check whether the run was stopped.
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class Stage(object):
+    """
+    Stage is one step of a StagedPipeline: function is called on each item (and returns the item for
+    the next stage) in workers threads. A stage with more than one worker can pass items on out of
+    order. Stages also keep the statistics for format_stats.
+    """
+
+    def __init__(self, name: str, function, workers: int = 1):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.busy = 0.0
+        self.items = 0
+        # Number of items waiting in the queue in front of this stage, each time one was added.
+        self.depth_total = 0
+        self.depth_max = 0
+        self.depth_samples = 0
+
+    def record_depth(self, depth: int):
+        with self.lock:
+            self.depth_total += depth
+            self.depth_max = max(self.depth_max, depth)
+            self.depth_samples += 1
+
+    def record_item(self, busy: float):
+        with self.lock:
+            self.busy += busy
+            self.items += 1
+
+
+class StagedPipeline(object):
+    """
+    StagedPipeline runs items through a list of Stages, each in its own threads, so that (for example)
+    decoding the next frame, inpainting this one and writing the previous one happen at the same time.
+    Stages are connected by queues that hold at most queue_size items, so memory stays bounded: when a
+    stage falls behind, the stages before it wait for it.
+
+    run yields the results of the last stage in the same order as the items. format_stats reports how
+    busy each stage of the last run was and how full the queue in front of it got, to show which one
+    is the bottleneck.
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.stages = []
+        self.elapsed = 0.0
+        self.items = 0
+
+    def run(self, items, stages):
+        self.stages = stages
+        self.elapsed = 0.0
+        self.items = 0
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        results = queue.Queue(self.queue_size)
+        stop = threading.Event()
+        errors = []
+
+        def put(q, item, stage=None):
+            if stage is not None:
+                stage.record_depth(q.qsize())
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(q):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+            return _DONE
+
+        def feed():
+            try:
+                for index, item in enumerate(items):
+                    if not put(queues[0], (index, item), self.stages[0]):
+                        return
+            except Exception as exc:
+                errors.append(exc)
+                stop.set()
+                return
+            for _ in range(self.stages[0].workers):
+                put(queues[0], _DONE)
+
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+
+        def work(i, stage):
+            if i + 1 < len(self.stages):
+                out, next_stage = queues[i + 1], self.stages[i + 1]
+                next_workers = next_stage.workers
+            else:
+                out, next_stage, next_workers = results, None, 1
+            while True:
+                entry = get(queues[i])
+                if entry is _DONE:
+                    break
+                index, item = entry
+                start = time.perf_counter()
+                try:
+                    item = stage.function(item)
+                except Exception as exc:
+                    errors.append(exc)
+                    stop.set()
+                    return
+                stage.record_item(time.perf_counter() - start)
+                if not put(out, (index, item), next_stage):
+                    return
+            with remaining_lock:
+                remaining[i] -= 1
+                last = remaining[i] == 0
+            # The last worker of a stage to finish tells the next stage that there's nothing left.
+            if last:
+                for _ in range(next_workers):
+                    put(out, _DONE)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for i, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                threads.append(
+                    threading.Thread(target=work, args=(i, stage), daemon=True)
+                )
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            # Results can arrive out of order, so they're held until the ones before them are done.
+            pending = {}
+            next_index = 0
+            while True:
+                entry = get(results)
+                if entry is _DONE:
+                    break
+                index, result = entry
+                pending[index] = result
+                while next_index in pending:
+                    self.items += 1
+                    next_index += 1
+                    yield pending.pop(next_index - 1)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self.elapsed += time.perf_counter() - start
+        if errors:
+            raise errors[0]
+
+    def format_stats(self) -> str:
+        if not self.stages:
+            return "Pipeline: not run"
+        lines = [f"Pipeline: {self.items} items in {self.elapsed:.2f}s"]
+        utilisations = [
+            stage.busy / (stage.workers * self.elapsed) if self.elapsed else 0.0
+            for stage in self.stages
+        ]
+        bottleneck = max(range(len(self.stages)), key=lambda i: utilisations[i])
+        for i, stage in enumerate(self.stages):
+            depth = (
+                stage.depth_total / stage.depth_samples if stage.depth_samples else 0
+            )
+            threads = "thread" if stage.workers == 1 else "threads"
+            line = (
+                f"  {stage.name}: {stage.workers} {threads}, {utilisations[i]:.0%} busy, "
+                f"queue {depth:.1f} avg / {stage.depth_max} max"
+            )
+            if i == bottleneck:
+                line += " (bottleneck)"
+            lines.append(line)
+        return "\n".join(lines)
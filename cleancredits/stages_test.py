@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from .stages import Stage, StagedPipeline
+
+
+def test_staged_pipeline__order():
+    def slow_for_even(item):
+        # Make later items finish first.
+        if item % 2 == 0:
+            time.sleep(0.01)
+        return item * 10
+
+    pipeline = StagedPipeline()
+    results = pipeline.run(
+        range(20),
+        [
+            Stage("first", lambda item: item + 1),
+            Stage("second", slow_for_even, workers=4),
+            Stage("third", lambda item: item - 1),
+        ],
+    )
+    assert list(results) == [(i + 1) * 10 - 1 for i in range(20)]
+    assert pipeline.items == 20
+    assert [stage.items for stage in pipeline.stages] == [20, 20, 20]
+
+
+def test_staged_pipeline__bounded():
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def start(item):
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        return item
+
+    def finish(item):
+        nonlocal in_flight
+        time.sleep(0.005)
+        with lock:
+            in_flight -= 1
+        return item
+
+    pipeline = StagedPipeline(queue_size=2)
+    assert list(
+        pipeline.run(range(30), [Stage("start", start), Stage("finish", finish)])
+    )
+    # At most: one item in each stage, and a full queue between them.
+    assert max_in_flight <= 4
+    assert pipeline.stages[1].depth_max <= 2
+
+
+def test_staged_pipeline__error():
+    def fail(item):
+        if item == 5:
+            raise ValueError("bad item")
+        return item
+
+    pipeline = StagedPipeline()
+    results = []
+    with pytest.raises(ValueError, match="bad item"):
+        for result in pipeline.run(range(100), [Stage("fail", fail, workers=2)]):
+            results.append(result)
+    assert 5 not in results
+
+
+def test_staged_pipeline__stop_early():
+    pipeline = StagedPipeline()
+    results = pipeline.run(range(1000), [Stage("identity", lambda item: item)])
+    assert next(results) == 0
+    results.close()
+    assert pipeline.items == 1
+
+
+def test_staged_pipeline__format_stats():
+    pipeline = StagedPipeline()
+    assert pipeline.format_stats() == "Pipeline: not run"
+
+    def slow(item):
+        time.sleep(0.01)
+        return item
+
+    list(
+        pipeline.run(range(5), [Stage("fast", lambda item: item), Stage("slow", slow)])
+    )
+    lines = pipeline.format_stats().splitlines()
+    assert lines[0].startswith("Pipeline: 5 items in ")
+    assert lines[1].startswith("  fast: 1 thread, ")
+    assert lines[2].startswith("  slow: 1 thread, ")
+    assert lines[2].endswith("(bottleneck)")
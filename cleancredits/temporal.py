@@ -0,0 +1,107 @@
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Number of frames (centered on the frame being cleaned) that background pixels are taken from.
+DEFAULT_TEMPORAL_WINDOW = 9
+# Shown when the temporal method is used with a single mask for every frame, where it can't help.
+STATIC_MASK_WARNING = (
+    "The temporal method only helps when the mask moves (scrolling credits or keyframes). With a "
+    "single mask, every masked pixel is masked in every frame, so it gives the same result as the "
+    "telea method, only slower."
+)
+
+
+def temporal_inpaint(frames, masks, index: int, radius: int) -> np.array:
+    """
+    Clean frames[index] by replacing each masked pixel with the median of that pixel in the other
+    frames where it isn't masked. This recovers the real background when the text moves over a static
+    background, without the blur of a large inpaint radius. Pixels that are masked in every frame fall
+    back to cv2.inpaint.
+    """
+    frame = frames[index]
+    mask = masks[index]
+    ys, xs = np.nonzero(mask)
+    cleaned = frame.copy()
+    if ys.size == 0:
+        return cleaned
+
+    # Only gather the masked pixels of the target frame: (frames, pixels, channels).
+    samples = np.stack([f[ys, xs] for f in frames]).astype(np.float32)
+    valid = np.stack([m[ys, xs] == 0 for m in masks])
+    # Sort masked samples to the end, so the first `count` samples of each pixel are the valid ones.
+    samples[~valid] = np.inf
+    samples.sort(axis=0)
+    count = valid.sum(axis=0)
+    lower = np.maximum((count - 1) // 2, 0)[None, :, None]
+    upper = (count // 2)[None, :, None]
+    median = (
+        np.take_along_axis(samples, lower, axis=0)[0]
+        + np.take_along_axis(samples, np.minimum(upper, len(frames) - 1), axis=0)[0]
+    ) / 2
+
+    found = count > 0
+    cleaned[ys[found], xs[found]] = np.rint(median[found]).astype(np.uint8)
+    if not found.all():
+        remaining = np.zeros_like(mask)
+        remaining[ys[~found], xs[~found]] = 255
+        cleaned = cv2.inpaint(cleaned, remaining, radius, cv2.INPAINT_TELEA)
+    return cleaned
+
+
+class TemporalInpainter(object):
+    """
+    TemporalInpainter runs temporal_inpaint over a sequence of frames with a sliding window. Frames
+    (and their masks) are pushed in order; each cleaned frame is returned as soon as the frames after
+    it that are in its window have been pushed. Call flush once the last frame has been pushed to get
+    the remaining cleaned frames. Windows are cut short at the start and end of the sequence.
+    """
+
+    def __init__(self, radius: int, window: int = DEFAULT_TEMPORAL_WINDOW):
+        if window < 1:
+            raise ValueError(f"Window must be at least 1 frame, got {window}")
+        self.radius = radius
+        self.half_window = window // 2
+        self.frames = deque()
+        self.masks = deque()
+        # Sequence index of self.frames[0]
+        self.first_index = 0
+        self.next_index = 0
+        self.pushed = 0
+
+    def clean(self, index: int) -> np.array:
+        position = index - self.first_index
+        # Only pass frames inside this frame's window.
+        start = max(position - self.half_window, 0)
+        end = position + self.half_window + 1
+        frames = [self.frames[i] for i in range(start, min(end, len(self.frames)))]
+        masks = [self.masks[i] for i in range(start, min(end, len(self.masks)))]
+        return temporal_inpaint(frames, masks, position - start, self.radius)
+
+    def emit(self, index: int) -> (int, np.array):
+        cleaned = self.clean(index)
+        self.next_index = index + 1
+        # Drop frames that are no longer in any remaining frame's window.
+        while self.first_index < self.next_index - self.half_window:
+            self.frames.popleft()
+            self.masks.popleft()
+            self.first_index += 1
+        return index, cleaned
+
+    def push(self, frame, mask) -> list:
+        """Add the next frame and return a list of (index, cleaned frame) that are now ready."""
+        self.frames.append(frame)
+        self.masks.append(mask)
+        self.pushed += 1
+        ready = []
+        while self.next_index + self.half_window < self.pushed:
+            ready.append(self.emit(self.next_index))
+        return ready
+
+    def flush(self) -> list:
+        """Return a list of (index, cleaned frame) for all frames that haven't been returned yet."""
+        ready = []
+        while self.next_index < self.pushed:
+            ready.append(self.emit(self.next_index))
+        return ready
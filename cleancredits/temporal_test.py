@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from .temporal import TemporalInpainter, temporal_inpaint
+
+
+def moving_text_frames(count, height=60, width=80):
+    """A static noisy background with a white box that moves right by 4 pixels every frame."""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 200, (height, width, 3), np.uint8)
+    frames, masks = [], []
+    for i in range(count):
+        frame = background.copy()
+        mask = np.zeros((height, width), np.uint8)
+        mask[20:30, i * 4 : i * 4 + 10] = 255
+        frame[mask > 0] = 255
+        frames.append(frame)
+        masks.append(mask)
+    return background, frames, masks
+
+
+def test_temporal_inpaint__recovers_static_background():
+    background, frames, masks = moving_text_frames(9)
+    assert_array_equal(temporal_inpaint(frames, masks, 4, 3), background)
+
+
+def test_temporal_inpaint__median():
+    frames = [np.full((1, 1, 3), v, np.uint8) for v in (10, 0, 20, 200)]
+    masks = [np.zeros((1, 1), np.uint8) for _ in frames]
+    masks[1][:] = 255
+    # Median of 10, 20 and 200.
+    assert_array_equal(temporal_inpaint(frames, masks, 1, 3), [[[20, 20, 20]]])
+    masks[3][:] = 255
+    # Median of 10 and 20.
+    assert_array_equal(temporal_inpaint(frames, masks, 1, 3), [[[15, 15, 15]]])
+
+
+def test_temporal_inpaint__always_masked_falls_back_to_inpaint():
+    _, frames, masks = moving_text_frames(3)
+    masks = [np.full_like(masks[0], 0) for _ in masks]
+    masks[1][40:45, 40:45] = 255
+    for mask in masks:
+        mask[0:5, 0:5] = 255
+    cleaned = temporal_inpaint(frames, masks, 1, 3)
+    expected = frames[1].copy()
+    expected[40:45, 40:45] = frames[0][40:45, 40:45]
+    expected = cv2.inpaint(expected, masks[0], 3, cv2.INPAINT_TELEA)
+    assert_array_equal(cleaned, expected)
+
+
+def test_temporal_inpaint__empty_mask():
+    _, frames, masks = moving_text_frames(3)
+    masks = [np.zeros_like(m) for m in masks]
+    assert_array_equal(temporal_inpaint(frames, masks, 1, 3), frames[1])
+
+
+@pytest.mark.parametrize("count,window", [(10, 5), (3, 9), (6, 1), (7, 4)])
+def test_temporal_inpainter__sliding_window(count, window):
+    _, frames, masks = moving_text_frames(count)
+    inpainter = TemporalInpainter(3, window)
+    results = []
+    for frame, mask in zip(frames, masks):
+        results += inpainter.push(frame, mask)
+    results += inpainter.flush()
+    assert [index for index, _ in results] == list(range(count))
+    half = window // 2
+    for index, cleaned in results:
+        start = max(index - half, 0)
+        end = min(index + half + 1, count)
+        expected = temporal_inpaint(
+            frames[start:end], masks[start:end], index - start, 3
+        )
+        assert_array_equal(cleaned, expected)
+    # Only the frames still needed for the window are kept.
+    assert len(inpainter.frames) <= half + 1
@@ -0,0 +1,49 @@
+import numpy as np
+
+# How many bytes the intermediate arrays for one tile of a frame may take, so that they stay in the
+# CPU cache and the memory each worker needs doesn't grow with the size of the frame.
+DEFAULT_TILE_MEMORY = 4 * 1024 * 1024
+
+
+def get_strip_rows(
+    width: int, bytes_per_pixel: int, padding: int = 0, max_bytes=DEFAULT_TILE_MEMORY
+) -> int:
+    """
+    Return how many rows each horizontal strip of a frame that is width pixels wide can have, so that
+    a strip and the padding rows above and below it take at most max_bytes at bytes_per_pixel. At
+    least one row is returned, even if a single row doesn't fit.
+    """
+    rows = max_bytes // (width * bytes_per_pixel) - 2 * padding
+    return max(rows, 1)
+
+
+def iter_strips(height: int, rows: int):
+    """Yield (top, bottom) for each strip of rows in a frame that is height rows tall."""
+    for top in range(0, height, rows):
+        yield top, min(top + rows, height)
+
+
+def get_layers_bytes_per_pixel(compiled) -> int:
+    """
+    Return about how many bytes CompiledLayers.classify and fold use per pixel: the HSV copy and its
+    three planes, the three lookups and the layer bits, and the mask.
+    """
+    return 3 + 3 + 4 * np.dtype(compiled.dtype).itemsize + 1
+
+
+def render_layers_tiled(compiled, image, max_bytes=DEFAULT_TILE_MEMORY) -> np.array:
+    """
+    Return compiled.render(image), rendered in horizontal strips so that only one strip's
+    intermediate arrays are in memory at once. Only the mask itself is the size of the frame.
+    """
+    height, width = image.shape[:2]
+    padding = max((grow for _, grow in compiled.grow_layers), default=0)
+    rows = get_strip_rows(
+        width, get_layers_bytes_per_pixel(compiled), padding, max_bytes
+    )
+    if rows >= height:
+        return compiled.render(image)
+    mask = np.empty((height, width), np.uint8)
+    for top, bottom in iter_strips(height, rows):
+        mask[top:bottom] = compiled.render_rows(image, top, bottom)
+    return mask
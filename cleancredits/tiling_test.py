@@ -0,0 +1,32 @@
+import pytest
+from numpy.testing import assert_array_equal
+
+from .layers import CompiledLayers
+from .layers_test import load_frame, random_layers
+from .tiling import get_strip_rows, iter_strips, render_layers_tiled
+
+
+def test_get_strip_rows():
+    assert get_strip_rows(1000, 4, 0, 40000) == 10
+    assert get_strip_rows(1000, 4, 2, 40000) == 6
+    # At least one row, even if that doesn't fit.
+    assert get_strip_rows(1000, 4, 10, 40000) == 1
+
+
+def test_iter_strips():
+    assert list(iter_strips(10, 4)) == [(0, 4), (4, 8), (8, 10)]
+    assert list(iter_strips(8, 4)) == [(0, 4), (4, 8)]
+    assert list(iter_strips(3, 4)) == [(0, 3)]
+
+
+@pytest.mark.parametrize("max_bytes", [64 * 1024, 1024 * 1024, 1024**3])
+@pytest.mark.parametrize("count,seed", [(1, 0), (3, 1), (9, 2), (17, 3)])
+def test_render_layers_tiled__matches_render(count, seed, max_bytes):
+    image = load_frame()
+    # Make sure the largest grow is used, so strips need padding.
+    layers = random_layers(count, seed)
+    layers[0]["grow"] = 20
+    compiled = CompiledLayers(layers)
+    assert_array_equal(
+        render_layers_tiled(compiled, image, max_bytes), compiled.render(image)
+    )
@@ -0,0 +1,166 @@
+import cv2
+import numpy as np
+
+from .helpers import MASK_MODE_INCLUDE, combine_masks
+from .layers import CompiledLayers
+from .tiling import render_layers_tiled
+
+# Phase correlation peaks below this are treated as a failed match.
+DEFAULT_MIN_CONFIDENCE = 0.5
+# Re-render the whole mask at least this often, so that small tracking errors can't build up.
+DEFAULT_REFRESH_INTERVAL = 50
+# Credits scroll vertically, so any more horizontal motion than this means the match is wrong (or the
+# shot changed).
+MAX_HORIZONTAL_SHIFT = 1.0
+
+
+def get_band(layers, width: int, height: int):
+    """
+    Return the (left, top, right, bottom) box around all of the layers' crops. Layers can't select
+    anything outside of it, so this is the area that needs to be tracked.
+    """
+    left, top, right, bottom = width, height, 0, 0
+    for layer in layers:
+        layer_top, layer_bottom, _ = slice(
+            layer["crop_top"], layer["crop_bottom"]
+        ).indices(height)
+        layer_left, layer_right, _ = slice(
+            layer["crop_left"], layer["crop_right"]
+        ).indices(width)
+        if layer_bottom <= layer_top or layer_right <= layer_left:
+            continue
+        left, top = min(left, layer_left), min(top, layer_top)
+        right, bottom = max(right, layer_right), max(bottom, layer_bottom)
+    if bottom <= top or right <= left:
+        return None
+    return left, top, right, bottom
+
+
+class ScrollTracker(object):
+    """
+    ScrollTracker builds masks for scrolling credits. Rather than rendering the mask layers for every
+    frame, it estimates how far the text moved since the previous frame with phase correlation over
+    the band covered by the layers' crops, shifts the previous mask by that much, and only renders the
+    rows that scrolled into view. If the match isn't confident (for example at a cut or a fade), the
+    whole mask is rendered again.
+
+    A ScrollTracker is called with consecutive BGR frames and returns the mask for each one, so it can
+    be passed anywhere a per-frame mask function is accepted (for example helpers.clean_frames).
+
+    If max_bytes is set, whole masks are rendered in strips that take at most that much memory each
+    (see tiling.render_layers_tiled).
+    """
+
+    def __init__(
+        self,
+        layers,
+        static_mask=None,
+        min_confidence=DEFAULT_MIN_CONFIDENCE,
+        refresh_interval=DEFAULT_REFRESH_INTERVAL,
+        max_bytes=None,
+    ):
+        self.layers = layers
+        self.compiled = CompiledLayers(layers)
+        # Areas that should be inpainted on every frame, no matter how the text moves.
+        self.static_mask = static_mask
+        self.min_confidence = min_confidence
+        self.refresh_interval = refresh_interval
+        self.max_bytes = max_bytes
+
+        self.band = None
+        self.window = None
+        self.mask = None
+        self.previous = None
+        # Sub-pixel motion that hasn't been applied to the mask yet.
+        self.residual = 0.0
+        self.frames_since_render = 0
+
+        self.tracked_frames = 0
+        self.rendered_frames = 0
+
+    def reset(self):
+        """Forget the previous frame, so that the next mask is rendered from scratch."""
+        self.mask = None
+        self.previous = None
+
+    def get_band_image(self, frame) -> np.array:
+        left, top, right, bottom = self.band
+        band = cv2.cvtColor(frame[top:bottom, left:right], cv2.COLOR_BGR2GRAY)
+        return band.astype(np.float32)
+
+    def estimate_shift(self, band_image):
+        """
+        Return the vertical shift (in pixels, negative when the text moves up) of the band since the
+        previous frame, or None if it couldn't be estimated confidently.
+        """
+        (dx, dy), confidence = cv2.phaseCorrelate(
+            self.previous, band_image, self.window
+        )
+        if confidence < self.min_confidence or abs(dx) > MAX_HORIZONTAL_SHIFT:
+            return None
+        return dy
+
+    def render(self, frame):
+        if self.max_bytes is None:
+            self.mask = self.compiled.render(frame)
+        else:
+            self.mask = render_layers_tiled(self.compiled, frame, self.max_bytes)
+        self.residual = 0.0
+        self.frames_since_render = 0
+        self.rendered_frames += 1
+
+    def shift(self, frame, dy: float) -> bool:
+        """
+        Move the mask by dy rows within the band and render the rows that scrolled into view. Returns
+        False if the shift is too large to track.
+        """
+        _, top, _, bottom = self.band
+        self.residual += dy
+        rows = int(round(self.residual))
+        if abs(rows) >= bottom - top:
+            return False
+        self.residual -= rows
+        if rows < 0:
+            # Text moved up, so new text appears at the bottom of the band.
+            self.mask[top : bottom + rows] = self.mask[top - rows : bottom]
+            self.mask[bottom + rows : bottom] = self.compiled.render_rows(
+                frame, bottom + rows, bottom
+            )
+        elif rows > 0:
+            self.mask[top + rows : bottom] = self.mask[top : bottom - rows]
+            self.mask[top : top + rows] = self.compiled.render_rows(
+                frame, top, top + rows
+            )
+        self.frames_since_render += 1
+        self.tracked_frames += 1
+        return True
+
+    def __call__(self, frame) -> np.array:
+        height, width = frame.shape[:2]
+        if self.band is None:
+            self.band = get_band(self.layers, width, height) or (0, 0, width, height)
+            left, top, right, bottom = self.band
+            self.window = cv2.createHanningWindow(
+                (right - left, bottom - top), cv2.CV_32F
+            )
+
+        band_image = self.get_band_image(frame)
+        tracked = False
+        if self.mask is not None and self.frames_since_render < self.refresh_interval:
+            dy = self.estimate_shift(band_image)
+            if dy is not None:
+                tracked = self.shift(frame, dy)
+        if not tracked:
+            self.render(frame)
+        self.previous = band_image
+
+        if self.static_mask is None:
+            return self.mask.copy()
+        return combine_masks(MASK_MODE_INCLUDE, self.static_mask, self.mask)
+
+    def format_stats(self) -> str:
+        total = self.tracked_frames + self.rendered_frames
+        return (
+            f"Scroll tracking: {self.tracked_frames}/{total} frames tracked, "
+            f"{self.rendered_frames} fully rendered"
+        )
@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from .helpers import MASK_MODE_EXCLUDE, MASK_MODE_INCLUDE
+from .layers import CompiledLayers
+from .tracking import ScrollTracker, get_band
+
+WIDTH = 320
+HEIGHT = 240
+
+
+def credits_layer(**kwargs):
+    # Select the bright text.
+    return {
+        "mask_mode": MASK_MODE_INCLUDE,
+        "hue_min": 0,
+        "hue_max": 179,
+        "sat_min": 0,
+        "sat_max": 255,
+        "val_min": 200,
+        "val_max": 255,
+        "grow": 2,
+        "crop_left": 0,
+        "crop_top": 20,
+        "crop_right": WIDTH,
+        "crop_bottom": HEIGHT - 20,
+    } | kwargs
+
+
+def scrolling_frames(count, speed):
+    """Render frames of white text scrolling up over a dark gradient, speed pixels per frame."""
+    rng = np.random.default_rng(0)
+    page = np.zeros((HEIGHT + count * speed, WIDTH, 3), np.uint8)
+    for y in range(30, page.shape[0], 30):
+        name = "".join(rng.choice(list("ABCDEFGHIJKLMNOP"), 10))
+        cv2.putText(
+            page, name, (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2
+        )
+    background = np.linspace(0, 80, WIDTH, dtype=np.uint8)[None, :, None]
+    for i in range(count):
+        frame = page[i * speed : i * speed + HEIGHT].copy()
+        yield np.maximum(frame, background)
+
+
+@pytest.mark.parametrize("speed", [1, 3, 8])
+def test_scroll_tracker__matches_render(speed):
+    layers = [credits_layer()]
+    compiled = CompiledLayers(layers)
+    tracker = ScrollTracker(layers)
+    for frame in scrolling_frames(20, speed):
+        mask = tracker(frame)
+        expected = compiled.render(frame)
+        assert np.count_nonzero(mask != expected) / mask.size < 0.001
+    assert tracker.rendered_frames == 1
+    assert tracker.tracked_frames == 19
+
+
+def test_scroll_tracker__max_bytes():
+    layers = [credits_layer()]
+    tracker = ScrollTracker(layers, max_bytes=16 * 1024)
+    frame = next(scrolling_frames(1, 1))
+    assert_array_equal(tracker(frame), CompiledLayers(layers).render(frame))
+
+
+def test_scroll_tracker__renders_after_cut():
+    layers = [credits_layer()]
+    tracker = ScrollTracker(layers)
+    frames = list(scrolling_frames(3, 2))
+    rng = np.random.default_rng(1)
+    frames.append(rng.integers(0, 256, frames[0].shape, np.uint8))
+    for frame in frames:
+        mask = tracker(frame)
+    assert tracker.rendered_frames == 2
+    assert_array_equal(mask, CompiledLayers(layers).render(frames[-1]))
+
+
+def test_scroll_tracker__refresh_interval():
+    tracker = ScrollTracker([credits_layer()], refresh_interval=4)
+    for frame in scrolling_frames(10, 2):
+        tracker(frame)
+    assert tracker.rendered_frames == 2
+    assert tracker.tracked_frames == 8
+
+
+def test_scroll_tracker__static_mask():
+    static_mask = np.zeros((HEIGHT, WIDTH), np.uint8)
+    static_mask[:10, :10] = 255
+    tracker = ScrollTracker([credits_layer()], static_mask=static_mask)
+    for frame in scrolling_frames(3, 2):
+        mask = tracker(frame)
+        assert (mask[:10, :10] == 255).all()
+
+
+@pytest.mark.parametrize(
+    "crops,expected",
+    [
+        ([(0, 0, WIDTH, HEIGHT)], (0, 0, WIDTH, HEIGHT)),
+        ([(10, 20, 30, 40), (5, 30, 25, 100)], (5, 20, 30, 100)),
+        ([(10, 20, 30, 40), (50, 50, 40, 40)], (10, 20, 30, 40)),
+        ([(0, 0, 0, 0)], None),
+    ],
+)
+def test_get_band(crops, expected):
+    layers = [
+        credits_layer(
+            mask_mode=MASK_MODE_EXCLUDE,
+            crop_left=left,
+            crop_top=top,
+            crop_right=right,
+            crop_bottom=bottom,
+        )
+        for left, top, right, bottom in crops
+    ]
+    assert get_band(layers, WIDTH, HEIGHT) == expected
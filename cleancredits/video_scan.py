@@ -0,0 +1,327 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import pathlib
+
+import cv2
+import numpy as np
+
+from .cpu_budget import get_available_cpus
+from .layers import LAYER_SETTINGS, CompiledLayers
+
+# Frames are scanned at this fraction of their full resolution. Text detection only needs to know
+# roughly how much of each frame is masked, so this makes the scan much cheaper to classify.
+DEFAULT_SCAN_SCALE = 0.25
+# Number of frames each worker process decodes in one go. Each chunk starts with a seek, so chunks
+# shouldn't be so small that seeking dominates.
+DEFAULT_CHUNK_FRAMES = 250
+# Text ranges shorter than this are dropped, and gaps shorter than this between text ranges are
+# bridged, so that a few frames where the text fades or the layers miss it don't split a range.
+DEFAULT_MIN_RANGE_FRAMES = 12
+DEFAULT_MAX_GAP_FRAMES = 12
+# The most masked frames only count as text if they stand out from the least masked ones by more than
+# this many times the noise between frames. Pure noise hardly ever spans more than 7 times its
+# standard deviation, even over hours of video.
+TEXT_NOISE_RATIO = 10
+DEFAULT_CACHE_DIR = (
+    pathlib.Path(os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache")
+    / "cleancredits"
+)
+
+
+def scale_layers(layers, scale: float) -> list:
+    """Return copies of the layers with their crops and grow scaled to a frame resized by scale."""
+    scaled = []
+    for layer in layers:
+        layer = {k: layer[k] for k in LAYER_SETTINGS}
+        for k in ("crop_left", "crop_top", "crop_right", "crop_bottom"):
+            if layer[k] is not None:
+                layer[k] = int(round(layer[k] * scale))
+        if layer["grow"] > 0:
+            layer["grow"] = max(int(round(layer["grow"] * scale)), 1)
+        scaled.append(layer)
+    return scaled
+
+
+def scan_chunk(video_path, start: int, end: int, layers, scale: float) -> np.array:
+    """
+    Return the number of masked pixels (at the scan resolution) in each of frames [start, end) of the
+    video. Fewer counts are returned if the video ends early.
+    """
+    compiled = CompiledLayers(scale_layers(layers, scale))
+    cap = cv2.VideoCapture(str(video_path))
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    counts = []
+    try:
+        for _ in range(start, end):
+            ok, frame = cap.read()
+            if not ok:
+                break
+            # Nearest neighbor keeps the pixels' original colors, so they are classified the same
+            # way as at full resolution.
+            small = cv2.resize(
+                frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST
+            )
+            counts.append(cv2.countNonZero(compiled.render(small)))
+    finally:
+        cap.release()
+    return np.array(counts, np.int64)
+
+
+def get_frame_count(video_path) -> int:
+    cap = cv2.VideoCapture(str(video_path))
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return frame_count
+
+
+def get_chunk_workers(processes: int = None, cpus: int = None) -> (int, int):
+    """
+    Return (processes, OpenCV threads in each of them) for map_chunks, so that together they don't
+    run more threads than cpus CPUs (default: all of the CPUs this process may run on). processes
+    defaults to one per CPU.
+    """
+    cpus = cpus or len(get_available_cpus())
+    processes = processes or cpus
+    return processes, max(cpus // processes, 1)
+
+
+def format_chunk_workers(processes: int = None, cpus: int = None) -> str:
+    processes, opencv_threads = get_chunk_workers(processes, cpus)
+    cpus = cpus or len(get_available_cpus())
+    return f"CPU budget: {cpus} CPUs: {processes} processes x {opencv_threads} OpenCV threads"
+
+
+def init_chunk_worker(opencv_threads: int):
+    cv2.setNumThreads(opencv_threads)
+
+
+def map_chunks(
+    func,
+    video_path,
+    start: int,
+    end: int,
+    args=(),
+    processes: int = None,
+    chunk_frames: int = DEFAULT_CHUNK_FRAMES,
+    progress=None,
+    mp_context=None,
+    reduce=None,
+    cpus: int = None,
+) -> list:
+    """
+    Split frames [start, end) of the video into chunks and return the results of calling
+    func(video_path, chunk_start, chunk_end, *args) for each chunk, in order. Chunks are run in
+    parallel worker processes (started with mp_context, if it's given), so func and args must be
+    picklable. progress is called with (frames done, frame count) as chunks finish. Each worker
+    process only starts as many OpenCV threads as its share of cpus (see get_chunk_workers).
+
+    If reduce is given, it's called with (chunk_start, result) for each chunk in order, as soon as
+    the chunks before it are done, and nothing is returned. Only the results of chunks that finished
+    before an earlier one are held, so large results don't pile up over a long video.
+    """
+    chunks = [
+        (chunk_start, min(chunk_start + chunk_frames, end))
+        for chunk_start in range(start, end, chunk_frames)
+    ]
+    frame_count = end - start
+    processes, opencv_threads = get_chunk_workers(processes, cpus)
+    results = {}
+    ordered = []
+    next_chunk = 0
+
+    def collect(chunk_start, result):
+        nonlocal next_chunk
+        results[chunk_start] = result
+        while next_chunk < len(chunks) and chunks[next_chunk][0] in results:
+            chunk_start = chunks[next_chunk][0]
+            if reduce is None:
+                ordered.append(results.pop(chunk_start))
+            else:
+                reduce(chunk_start, results.pop(chunk_start))
+            next_chunk += 1
+
+    if len(chunks) <= 1 or processes == 1:
+        # Not worth starting worker processes for.
+        for chunk_start, chunk_end in chunks:
+            collect(chunk_start, func(video_path, chunk_start, chunk_end, *args))
+            if progress is not None:
+                progress(chunk_end - start, frame_count)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=mp_context,
+            initializer=init_chunk_worker,
+            initargs=(opencv_threads,),
+        ) as executor:
+            futures = {
+                executor.submit(func, str(video_path), chunk_start, chunk_end, *args): (
+                    chunk_start,
+                    chunk_end,
+                )
+                for chunk_start, chunk_end in chunks
+            }
+            done = 0
+            for future in concurrent.futures.as_completed(futures):
+                chunk_start, chunk_end = futures.pop(future)
+                collect(chunk_start, future.result())
+                done += chunk_end - chunk_start
+                if progress is not None:
+                    progress(done, frame_count)
+    if reduce is None:
+        return ordered
+
+
+def scan_video(
+    video_path,
+    layers,
+    scale: float = DEFAULT_SCAN_SCALE,
+    processes: int = None,
+    chunk_frames: int = DEFAULT_CHUNK_FRAMES,
+    progress=None,
+    mp_context=None,
+    cpus: int = None,
+) -> np.array:
+    """
+    Return the number of masked pixels (at the scan resolution) in every frame of the video, scanning
+    chunks of frames in parallel worker processes on up to cpus CPUs (see map_chunks). progress is
+    called with (frames done, frame count) as chunks finish.
+    """
+    frame_count = get_frame_count(video_path)
+    results = map_chunks(
+        scan_chunk,
+        video_path,
+        0,
+        frame_count,
+        args=(layers, scale),
+        processes=processes,
+        chunk_frames=chunk_frames,
+        progress=progress,
+        mp_context=mp_context,
+        cpus=cpus,
+    )
+    # Stop at the first chunk that came up short, since the frames after it couldn't be read.
+    counts = []
+    for chunk_start, chunk_counts in zip(range(0, frame_count, chunk_frames), results):
+        counts.append(chunk_counts)
+        if len(chunk_counts) < min(chunk_frames, frame_count - chunk_start):
+            break
+    if not counts:
+        return np.zeros(0, np.int64)
+    return np.concatenate(counts)
+
+
+def get_timeline_cache_path(cache_dir, video_path, layers, scale: float):
+    """
+    Return where the timeline for these settings is cached. The name depends on the video file (and
+    when it was last modified), the layer settings, and the scan scale, so changing any of them
+    causes a new scan.
+    """
+    video_path = pathlib.Path(video_path).resolve()
+    stat = video_path.stat()
+    key = json.dumps(
+        {
+            "video": str(video_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "layers": [{k: layer[k] for k in LAYER_SETTINGS} for layer in layers],
+            "scale": scale,
+        },
+        sort_keys=True,
+    )
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return pathlib.Path(cache_dir) / f"{video_path.stem}-timeline-{digest}.npy"
+
+
+def get_timeline(
+    video_path,
+    layers,
+    scale: float = DEFAULT_SCAN_SCALE,
+    processes: int = None,
+    cache_dir=DEFAULT_CACHE_DIR,
+    progress=None,
+    mp_context=None,
+    cpus: int = None,
+) -> np.array:
+    """
+    Return the approximate number of masked pixels (at full resolution) in every frame of the video.
+    The scan is cached in cache_dir (unless it is None), so running this again with the same video,
+    layers and scale doesn't decode the video again.
+    """
+    cache_path = None
+    counts = None
+    if cache_dir is not None:
+        cache_path = get_timeline_cache_path(cache_dir, video_path, layers, scale)
+        if cache_path.is_file():
+            counts = np.load(cache_path)
+    if counts is None:
+        counts = scan_video(
+            video_path,
+            layers,
+            scale=scale,
+            processes=processes,
+            progress=progress,
+            mp_context=mp_context,
+            cpus=cpus,
+        )
+        if cache_path is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(cache_path, counts)
+    return counts / (scale * scale)
+
+
+def get_noise_level(timeline) -> float:
+    """
+    Return the standard deviation of the noise in the timeline, estimated from the median difference
+    between consecutive frames. Text only appears and disappears a few times, so the differences
+    where it does hardly change the median, however many frames have text.
+    """
+    if len(timeline) < 2:
+        return 0.0
+    return float(np.median(np.abs(np.diff(timeline)))) / (0.6745 * np.sqrt(2))
+
+
+def get_default_threshold(timeline) -> float:
+    """
+    Return a threshold halfway between the least and most masked frames. Frames without text usually
+    still have a few pixels that match the layers, so a threshold of zero would find text everywhere.
+
+    If the most masked frames don't stand out from the noise (by TEXT_NOISE_RATIO), the video has no
+    text the layers match, and the threshold is the most masked frame, so that no frame is above it.
+    """
+    if len(timeline) == 0:
+        return 0.0
+    low, high = float(timeline.min()), float(timeline.max())
+    if high - low <= TEXT_NOISE_RATIO * get_noise_level(timeline):
+        return high
+    return (low + high) / 2
+
+
+def propose_ranges(
+    timeline,
+    threshold: float = None,
+    min_length: int = DEFAULT_MIN_RANGE_FRAMES,
+    max_gap: int = DEFAULT_MAX_GAP_FRAMES,
+) -> list:
+    """
+    Return a list of (start frame, end frame) ranges (both inclusive) where text is present, that is,
+    where the timeline is above the threshold. Ranges separated by at most max_gap frames are merged,
+    and then ranges shorter than min_length frames are dropped.
+    """
+    timeline = np.asarray(timeline)
+    if threshold is None:
+        threshold = get_default_threshold(timeline)
+    present = timeline > threshold
+    if not present.any():
+        return []
+    # Find the edges of each run of frames with text.
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], present.view(np.int8), [0]])))
+    runs = edges.reshape(-1, 2)
+    ranges = []
+    for start, end in runs:
+        if ranges and start - ranges[-1][1] - 1 <= max_gap:
+            ranges[-1] = (ranges[-1][0], int(end) - 1)
+        else:
+            ranges.append((int(start), int(end) - 1))
+    return [(start, end) for start, end in ranges if end - start + 1 >= min_length]
@@ -0,0 +1,183 @@
+import multiprocessing
+
+import cv2
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from . import video_scan
+from .helpers import MASK_MODE_INCLUDE
+from .helpers_test import TESTDATA_PATH
+from .video_scan import (
+    get_chunk_workers,
+    get_default_threshold,
+    get_timeline,
+    get_timeline_cache_path,
+    map_chunks,
+    propose_ranges,
+    scale_layers,
+    scan_chunk,
+    scan_video,
+)
+
+VIDEO_PATH = TESTDATA_PATH / "horses-720p.mp4"
+LAYERS = [
+    {
+        "mask_mode": MASK_MODE_INCLUDE,
+        "hue_min": 0,
+        "hue_max": 179,
+        "sat_min": 0,
+        "sat_max": 255,
+        "val_min": 200,
+        "val_max": 255,
+        "grow": 3,
+        "crop_left": 0,
+        "crop_top": 100,
+        "crop_right": 1080,
+        "crop_bottom": 720,
+    }
+]
+
+
+def test_scale_layers():
+    (layer,) = scale_layers(LAYERS, 0.25)
+    assert layer["crop_top"] == 25
+    assert layer["crop_right"] == 270
+    assert layer["crop_bottom"] == 180
+    assert layer["grow"] == 1
+    assert LAYERS[0]["crop_top"] == 100
+
+
+def test_scan_video__chunks_match_sequential_scan():
+    sequential = scan_chunk(VIDEO_PATH, 0, 25, LAYERS, 0.25)
+    assert len(sequential) == 25
+    assert sequential.any()
+    parallel = scan_video(VIDEO_PATH, LAYERS, 0.25, processes=2, chunk_frames=7)
+    assert_array_equal(parallel, sequential)
+
+
+def test_scan_video__spawn():
+    # The GUI starts its workers with spawn, since it scans from a thread.
+    sequential = scan_chunk(VIDEO_PATH, 0, 25, LAYERS, 0.25)
+    parallel = scan_video(
+        VIDEO_PATH,
+        LAYERS,
+        0.25,
+        processes=2,
+        chunk_frames=13,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    assert_array_equal(parallel, sequential)
+
+
+def get_chunk_range(video_path, start, end):
+    return (start, end)
+
+
+@pytest.mark.parametrize("processes", [1, 3])
+def test_map_chunks__reduce(processes):
+    reduced = []
+    result = map_chunks(
+        get_chunk_range,
+        VIDEO_PATH,
+        5,
+        30,
+        processes=processes,
+        chunk_frames=4,
+        reduce=lambda chunk_start, chunk: reduced.append((chunk_start, chunk)),
+    )
+    assert result is None
+    # Chunks are reduced in order, however they finish.
+    assert reduced == [
+        (start, (start, min(start + 4, 30))) for start in range(5, 30, 4)
+    ]
+
+
+def get_chunk_opencv_threads(video_path, start, end):
+    return cv2.getNumThreads()
+
+
+def test_get_chunk_workers():
+    assert get_chunk_workers(cpus=8) == (8, 1)
+    assert get_chunk_workers(2, cpus=8) == (2, 4)
+    # More processes than CPUs still get a thread each.
+    assert get_chunk_workers(4, cpus=2) == (4, 1)
+
+
+def test_map_chunks__opencv_threads():
+    threads = map_chunks(
+        get_chunk_opencv_threads,
+        VIDEO_PATH,
+        0,
+        8,
+        processes=2,
+        cpus=6,
+        chunk_frames=4,
+    )
+    # Each process only starts its share of the CPUs as OpenCV threads.
+    assert threads == [3, 3]
+
+
+def test_scan_video__progress():
+    progress = []
+    scan_video(
+        VIDEO_PATH,
+        LAYERS,
+        0.25,
+        processes=1,
+        chunk_frames=10,
+        progress=lambda done, total: progress.append((done, total)),
+    )
+    assert progress == [(10, 25), (20, 25), (25, 25)]
+
+
+def test_get_timeline__cached(tmp_path, monkeypatch):
+    timeline = get_timeline(VIDEO_PATH, LAYERS, 0.25, processes=1, cache_dir=tmp_path)
+    assert len(timeline) == 25
+    assert get_timeline_cache_path(tmp_path, VIDEO_PATH, LAYERS, 0.25).is_file()
+
+    def scan_video(*args, **kwargs):
+        raise AssertionError("The video shouldn't be scanned again")
+
+    monkeypatch.setattr(video_scan, "scan_video", scan_video)
+    assert_array_equal(
+        get_timeline(VIDEO_PATH, LAYERS, 0.25, cache_dir=tmp_path), timeline
+    )
+    # Different layers need a new scan.
+    with pytest.raises(AssertionError):
+        get_timeline(
+            VIDEO_PATH, [LAYERS[0] | {"val_min": 100}], 0.25, cache_dir=tmp_path
+        )
+
+
+@pytest.mark.parametrize(
+    "timeline,kwargs,expected",
+    [
+        ([0, 0, 0, 0], {}, []),
+        (
+            [0, 10, 10, 0, 10],
+            {"threshold": 5, "min_length": 1, "max_gap": 0},
+            [(1, 2), (4, 4)],
+        ),
+        ([0, 10, 10, 0, 10], {"threshold": 5, "min_length": 1, "max_gap": 1}, [(1, 4)]),
+        ([0, 10, 10, 0, 10], {"threshold": 5, "min_length": 2, "max_gap": 0}, [(1, 2)]),
+        ([0, 0, 10, 10, 10, 0, 0], {"min_length": 1}, [(2, 4)]),
+        ([10, 10, 3, 3], {"threshold": 2, "min_length": 1}, [(0, 3)]),
+        ([10, 10, 3, 3], {"threshold": 5, "min_length": 1}, [(0, 1)]),
+    ],
+)
+def test_propose_ranges(timeline, kwargs, expected):
+    assert propose_ranges(np.array(timeline), **kwargs) == expected
+
+
+def test_propose_ranges__no_text():
+    # Some pixels of every frame match the layers, but none of them have text.
+    timeline = np.random.default_rng(0).normal(200, 15, 2000)
+    assert get_default_threshold(timeline) == timeline.max()
+    assert propose_ranges(timeline) == []
+
+
+def test_propose_ranges__text():
+    timeline = np.random.default_rng(0).normal(200, 15, 2000)
+    timeline[500:1700] += 2000
+    assert propose_ranges(timeline) == [(500, 1699)]